@@ -4,3 +4,16 @@ from django.apps import AppConfig
 class ApiConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "api"
+
+    def ready(self):
+        import api.checks  # noqa: F401
+        import api.connections  # noqa: F401
+        from django.utils.module_loading import autodiscover_modules
+
+        from api.catalog import connect_catalog_invalidation
+        from api.recipe_suggest import connect_recipe_name_index
+
+        connect_catalog_invalidation()
+        connect_recipe_name_index()
+        # Задачи фоновой очереди регистрируются в модулях tasks приложений.
+        autodiscover_modules("tasks")
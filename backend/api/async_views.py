@@ -0,0 +1,255 @@
+import asyncio
+import functools
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.paginator import InvalidPage, Page
+from django.db import close_old_connections
+from django.http import HttpResponse
+from django_filters.utils import translate_validation
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.exceptions import APIException, NotFound
+from rest_framework.request import Request
+
+from api.fast_serializers import (RECIPE_FIELDS, RECIPE_SUMMARY_FIELDS,
+                                  build_recipes, get_authors, get_ingredients,
+                                  get_recipe_columns, get_tags)
+from api.filters import IngredientFilter, RecipeFilter
+from api.paginations import KeysetPagination, get_recipe_pagination_class
+from api.renderers import FastJSONRenderer
+from api.utils import get_requested_ids, get_sparse_fields, order_by_ids
+from api.views import IngredientViewSet, RecipeViewSet, TagViewSet
+from recipes.models import Favorite, Ingredient, Recipe, ShoppingCart, Tag
+
+RECIPE_FLAGS = ("is_favorited", "is_in_shopping_cart")
+
+
+def run_query(function, *args):
+    """Выполнить синхронную работу с базой в отдельном потоке.
+
+    Потоки не привязаны к запросу, поэтому независимые запросы идут
+    параллельно, каждый через соединение своего потока.
+    """
+    def run():
+        close_old_connections()
+        try:
+            return function(*args)
+        finally:
+            close_old_connections()
+
+    return sync_to_async(run, thread_sensitive=False)()
+
+
+async def skip():
+    """Заглушка для asyncio.gather вместо ненужного запроса."""
+    return None
+
+
+def render(data, status=200, headers=None):
+    """JSON-ответ, побайтно совпадающий с ответом DRF."""
+    response = HttpResponse(
+        FastJSONRenderer().render(data),
+        status=status,
+        content_type="application/json"
+    )
+    for header, value in (headers or {}).items():
+        response[header] = value
+    return response
+
+
+def filter_queryset(filterset):
+    """Отфильтрованный queryset, как в DjangoFilterBackend."""
+    if not filterset.is_valid():
+        raise translate_validation(filterset.errors)
+    return filterset.qs
+
+
+def async_api_view(drf_view):
+    """Async-представление для чтения; остальные методы обслуживает DRF."""
+    def decorator(view):
+        @functools.wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            if request.method not in ("GET", "HEAD"):
+                return await sync_to_async(drf_view)(request, *args, **kwargs)
+
+            authentication = TokenAuthentication()
+            try:
+                result = None
+                # Без заголовка токен не ищется, поток для этого не нужен.
+                if "HTTP_AUTHORIZATION" in request.META:
+                    result = await run_query(
+                        authentication.authenticate, request
+                    )
+                request.user = result[0] if result else AnonymousUser()
+                return await view(request, *args, **kwargs)
+            except APIException as exc:
+                headers = {}
+                if exc.status_code == 401:
+                    headers["WWW-Authenticate"] = (
+                        authentication.authenticate_header(request)
+                    )
+                detail = exc.detail
+                if not isinstance(detail, (list, dict)):
+                    detail = {"detail": detail}
+                return render(detail, exc.status_code, headers)
+
+        # Как и представления DRF, не проверяются CSRF-middleware.
+        wrapper.csrf_exempt = True
+        return wrapper
+
+    return decorator
+
+
+async def paginate(queryset, request, columns):
+    """Пагинатор DRF и строки values() страницы.
+
+    Запрос страницы и COUNT выполняются параллельно.
+    """
+    pagination = get_recipe_pagination_class(request)()
+    queryset = queryset.values(*columns)
+    if isinstance(pagination, KeysetPagination):
+        return pagination, await run_query(
+            pagination.paginate_queryset, queryset, request
+        )
+
+    pagination.request = request
+    page_size = pagination.get_page_size(request)
+    paginator = pagination.django_paginator_class(queryset, page_size)
+    page_number = request.query_params.get(pagination.page_query_param, 1)
+
+    try:
+        number = int(page_number)
+    except (TypeError, ValueError):
+        number = None
+    if number is None or number < 1:
+        # «last» и некорректные номера обрабатываются как в DRF.
+        pagination.page = await run_query(get_page, pagination, paginator)
+        return pagination, pagination.page.object_list
+
+    offset = (number - 1) * page_size
+    _, rows = await asyncio.gather(
+        run_query(lambda: paginator.count),
+        run_query(list, queryset[offset:offset + page_size])
+    )
+    try:
+        paginator.validate_number(number)
+    except InvalidPage as exc:
+        raise NotFound(pagination.invalid_page_message.format(
+            page_number=page_number, message=str(exc)
+        ))
+    pagination.page = Page(rows, number, paginator)
+
+    return pagination, rows
+
+
+def get_page(pagination, paginator):
+    """Страница по номеру из запроса, как в PageNumberPagination."""
+    page_number = pagination.get_page_number(pagination.request, paginator)
+    try:
+        page = paginator.page(page_number)
+    except InvalidPage as exc:
+        raise NotFound(pagination.invalid_page_message.format(
+            page_number=page_number, message=str(exc)
+        ))
+    page.object_list = list(page.object_list)
+    return page
+
+
+def get_user_recipe_ids(model, user, recipe_ids):
+    """Id рецептов из recipe_ids в избранном или корзине пользователя."""
+    return set(
+        model.objects.filter(
+            user=user, recipe_id__in=recipe_ids
+        ).values_list("recipe_id", flat=True)
+    )
+
+
+@async_api_view(RecipeViewSet.as_view({"get": "list", "post": "create"}))
+async def recipe_list(request):
+    """Список рецептов с параллельными запросами к базе."""
+    drf_request = Request(request)
+    fields = get_sparse_fields(
+        drf_request,
+        RECIPE_FIELDS,
+        RECIPE_SUMMARY_FIELDS if settings.RECIPE_LIST_SUMMARY else None
+    )
+    queryset = await run_query(filter_queryset, RecipeFilter(
+        request.GET, queryset=Recipe.objects.all(), request=request
+    ))
+    columns = [
+        column for column in get_recipe_columns(fields)
+        if column not in RECIPE_FLAGS
+    ]
+
+    user = request.user
+    ids = get_requested_ids(drf_request)
+    if ids is None:
+        pagination, rows = await paginate(queryset, drf_request, columns)
+    else:
+        pagination = None
+        rows, missing = order_by_ids(
+            await run_query(
+                list, queryset.filter(pk__in=ids).values(*columns)
+            ),
+            ids
+        )
+
+    # Признаки избранного и покупок запрашиваются только для рецептов
+    # страницы: у активного пользователя их может быть сколько угодно.
+    recipe_ids = [row["id"] for row in rows]
+    flags = rows and user.is_authenticated
+    tags, ingredients, authors, favorites, carts = await asyncio.gather(
+        run_query(get_tags, recipe_ids)
+        if rows and "tags" in fields else skip(),
+        run_query(get_ingredients, recipe_ids)
+        if rows and "ingredients" in fields else skip(),
+        run_query(get_authors, {row["author_id"] for row in rows}, user)
+        if rows and "author" in fields else skip(),
+        run_query(get_user_recipe_ids, Favorite, user, recipe_ids)
+        if flags and "is_favorited" in fields else skip(),
+        run_query(get_user_recipe_ids, ShoppingCart, user, recipe_ids)
+        if flags and "is_in_shopping_cart" in fields else skip(),
+    )
+    results = build_recipes(
+        rows,
+        request,
+        fields,
+        tags=tags,
+        ingredients=ingredients,
+        authors=authors,
+        favorites=favorites or set(),
+        carts=carts or set()
+    )
+
+    if pagination is None:
+        return render({"results": results, "missing": missing})
+    return render(pagination.get_paginated_response(results).data)
+
+
+@async_api_view(TagViewSet.as_view({"get": "list"}))
+async def tag_list(request):
+    """Список тегов."""
+    return render(await run_query(
+        list, Tag.objects.values("id", "name", "color", "slug")
+    ))
+
+
+@async_api_view(IngredientViewSet.as_view({"get": "list"}))
+async def ingredient_list(request):
+    """Поиск ингредиентов по началу названия или с опечатками.
+
+    Фильтр выполняется в потоке: ?search= может перестраивать индекс
+    поиска запросом к базе.
+    """
+    return render(await run_query(
+        get_ingredient_rows,
+        IngredientFilter(request.GET, queryset=Ingredient.objects.all())
+    ))
+
+
+def get_ingredient_rows(filterset):
+    """Строки ингредиентов, прошедших фильтр."""
+    return list(
+        filter_queryset(filterset).values("id", "name", "measurement_unit")
+    )
@@ -0,0 +1,88 @@
+import hashlib
+import uuid
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import EmptyResultSet
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+
+# Приложения, изменения в которых меняют версию каталога.
+CATALOG_APPS = ("recipes", "users")
+# Модели, у которых каталог меняют только создание и удаление: поля
+# пользователя не входят в фильтры, а вход по токену пишет last_login.
+CATALOG_INSERT_ONLY_MODELS = ("users.CustomUser",)
+CATALOG_VERSION_KEY = "catalog:version"
+
+
+def get_catalog_cache():
+    """Кэш для результатов, зависящих от версии каталога."""
+    return caches[settings.CATALOG_CACHE]
+
+
+def is_catalog_cache_enabled():
+    """Включен ли хотя бы один кэш, сбрасываемый по версии каталога."""
+    return bool(
+        settings.PAGINATION_COUNT_CACHE_TIMEOUT
+        or settings.FACETS_CACHE_TIMEOUT
+    )
+
+
+def get_catalog_key(prefix, queryset):
+    """Ключ кэша по SQL запроса и текущей версии каталога.
+
+    Возвращает None, если запрос заведомо пуст и кэшировать нечего.
+    """
+    try:
+        sql, params = queryset.query.sql_with_params()
+    except EmptyResultSet:
+        return None
+
+    cache = get_catalog_cache()
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        cache.add(CATALOG_VERSION_KEY, uuid.uuid4().hex, None)
+        version = cache.get(CATALOG_VERSION_KEY)
+    digest = hashlib.blake2b(
+        repr((queryset.db, sql, params)).encode(), digest_size=16
+    ).hexdigest()
+    return f"{prefix}:{version}:{digest}"
+
+
+def bump_catalog_version():
+    """Сбросить зависящие от каталога кэши сменой его версии."""
+    get_catalog_cache().set(CATALOG_VERSION_KEY, uuid.uuid4().hex, None)
+
+
+def invalidate_catalog(sender, **kwargs):
+    """Сменить версию каталога после записи в отслеживаемые таблицы."""
+    if (
+        kwargs.get("created") is False
+        and sender._meta.label in CATALOG_INSERT_ONLY_MODELS
+    ):
+        return
+    if kwargs.get("action", "post_").startswith("post_"):
+        # Внутри транзакции сброс откладывается до фиксации, иначе
+        # параллельный запрос закэширует старые данные с новой версией.
+        transaction.on_commit(bump_catalog_version)
+
+
+def connect_catalog_invalidation():
+    """Подписаться на записи в отслеживаемые таблицы, если кэш включен.
+
+    Обработчики подключаются только к нужным моделям: любой обработчик
+    post_delete отключает у модели быстрое каскадное удаление.
+    """
+    if not is_catalog_cache_enabled():
+        return
+
+    for app_label in CATALOG_APPS:
+        app_config = apps.get_app_config(app_label)
+        for model in app_config.get_models(include_auto_created=True):
+            for signal in (post_save, post_delete, m2m_changed):
+                signal.connect(
+                    invalidate_catalog,
+                    sender=model,
+                    dispatch_uid=f"invalidate_catalog:{model._meta.label}"
+                )
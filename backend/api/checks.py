@@ -0,0 +1,47 @@
+from django.conf import settings
+from django.core.checks import Error, Tags, register
+
+# Кэши, которые не разделяются между процессами gunicorn.
+PROCESS_LOCAL_CACHES = {
+    "django.core.cache.backends.locmem.LocMemCache",
+    "django.core.cache.backends.dummy.DummyCache",
+}
+
+
+@register(Tags.caches, Tags.database)
+def check_replica_sticky_cache(app_configs, **kwargs):
+    """Привязке к основной базе после записи нужен общий кэш.
+
+    Иначе следующий запрос клиента, попавший в другой воркер, не увидит
+    привязку и прочитает отстающую реплику.
+    """
+    backend = settings.CACHES["default"]["BACKEND"]
+    if not settings.REPLICA_DATABASES or backend not in PROCESS_LOCAL_CACHES:
+        return []
+
+    return [Error(
+        "С DB_REPLICAS нужен общий для воркеров кэш.",
+        hint=(
+            "Задайте CACHE_BACKEND и CACHE_LOCATION, например "
+            "django.core.cache.backends.memcached.PyMemcacheCache или "
+            "DatabaseCache; сейчас кэш свой у каждого процесса: " + backend
+        ),
+        id="api.E001",
+    )]
+
+
+@register(Tags.database)
+def check_ingredient_search_backend(app_configs, **kwargs):
+    """Поиск ингредиентов в базе работает только через pg_trgm."""
+    backend = settings.INGREDIENT_SEARCH_BACKEND
+    engine = settings.DATABASES["default"]["ENGINE"]
+    if backend == "memory" or (
+        backend == "database" and engine.endswith("postgresql")
+    ):
+        return []
+
+    return [Error(
+        f"INGREDIENT_SEARCH_BACKEND={backend} не поддерживается с {engine}.",
+        hint="Допустимо memory, а на PostgreSQL еще и database.",
+        id="api.E002",
+    )]
@@ -0,0 +1,120 @@
+import gzip
+import hashlib
+import re
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+
+from api.metrics import observe_cache
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+COMPRESSIBLE_TYPES = re.compile(
+    r"^(text/|application/(json|javascript|xml)|image/svg\+xml)"
+)
+QUALITY = re.compile(r"(?:^|;)\s*q=([0-9.]+)")
+
+
+def get_encodings():
+    """Поддерживаемые кодировки в порядке предпочтения."""
+    return ("br", "gzip") if brotli is not None else ("gzip",)
+
+
+def choose_encoding(accept_encoding):
+    """Выбрать кодировку по заголовку Accept-Encoding с учетом q."""
+    weights = {}
+    for part in accept_encoding.lower().split(","):
+        name, _, params = part.partition(";")
+        match = QUALITY.search(params)
+        try:
+            weights[name.strip()] = float(match[1]) if match else 1.0
+        except ValueError:
+            continue
+
+    default = weights.get("*", 0)
+    candidates = [
+        encoding for encoding in get_encodings()
+        if weights.get(encoding, default) > 0
+    ]
+    if not candidates:
+        return None
+
+    return max(
+        candidates, key=lambda encoding: weights.get(encoding, default)
+    )
+
+
+def compress(content, encoding):
+    """Сжать тело ответа."""
+    if encoding == "br":
+        return brotli.compress(content, quality=BROTLI_QUALITY)
+    # mtime=0 делает результат детерминированным и пригодным для кэша.
+    return gzip.compress(content, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def get_compressed(content, encoding):
+    """Сжатое тело из кэша или только что сжатое."""
+    cache = caches[settings.COMPRESSION_CACHE]
+    key = "compressed:{}:{}".format(
+        encoding, hashlib.blake2b(content, digest_size=16).hexdigest()
+    )
+    compressed = cache.get(key)
+    observe_cache("compression", compressed is not None)
+    if compressed is None:
+        compressed = compress(content, encoding)
+        cache.set(key, compressed, settings.COMPRESSION_CACHE_TIMEOUT)
+
+    return compressed
+
+
+class CompressionMiddleware(MiddlewareMixin):
+    """Сжатие ответов gzip или brotli по заголовку Accept-Encoding.
+
+    Ответы без авторизации одинаковы для всех клиентов, поэтому их сжатая
+    форма кэшируется по хешу тела и повторно не сжимается.
+    """
+
+    def process_response(self, request, response):
+        """Сжать ответ, если клиент это поддерживает."""
+        if (
+            response.streaming
+            or response.has_header("Content-Encoding")
+            or not COMPRESSIBLE_TYPES.match(response.get("Content-Type", ""))
+            or len(response.content) < settings.COMPRESSION_MIN_SIZE
+        ):
+            return response
+
+        patch_vary_headers(response, ("Accept-Encoding",))
+        encoding = choose_encoding(
+            request.META.get("HTTP_ACCEPT_ENCODING", "")
+        )
+        if encoding is None:
+            return response
+
+        if (
+            request.method in ("GET", "HEAD")
+            and "HTTP_AUTHORIZATION" not in request.META
+        ):
+            content = get_compressed(response.content, encoding)
+        else:
+            content = compress(response.content, encoding)
+        if len(content) >= len(response.content):
+            return response
+
+        response.content = content
+        response["Content-Length"] = str(len(content))
+        response["Content-Encoding"] = encoding
+        # Сжатое тело отличается побайтно, поэтому ETag становится слабым.
+        etag = response.get("ETag")
+        if etag and etag.startswith('"'):
+            response["ETag"] = "W/" + etag
+
+        return response
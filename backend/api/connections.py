@@ -0,0 +1,33 @@
+from django.conf import settings
+from django.core.signals import request_started
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+from api.metrics import (DB_CONNECTIONS_BROKEN, DB_CONNECTIONS_OPENED,
+                         DB_CONNECTIONS_REUSED, install_query_counter)
+
+
+@receiver(connection_created)
+def count_opened_connection(sender, connection, **kwargs):
+    """Учесть открытие нового соединения и считать его SQL-запросы."""
+    DB_CONNECTIONS_OPENED.labels(connection.alias).inc()
+    install_query_counter(connection)
+
+
+@receiver(request_started)
+def check_persistent_connections(sender, **kwargs):
+    """Проверить постоянные соединения перед обработкой запроса.
+
+    Устаревшие по CONN_MAX_AGE соединения к этому моменту уже закрыты
+    обработчиком Django, здесь отсеиваются оборванные сервером или
+    PgBouncer, чтобы запрос не упал на первом же SQL.
+    """
+    for connection in connections.all():
+        if connection.connection is None:
+            continue
+        if settings.DB_CONN_HEALTH_CHECKS and not connection.is_usable():
+            DB_CONNECTIONS_BROKEN.labels(connection.alias).inc()
+            connection.close()
+            continue
+        DB_CONNECTIONS_REUSED.labels(connection.alias).inc()
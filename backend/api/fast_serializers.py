@@ -0,0 +1,167 @@
+from collections import defaultdict
+from operator import itemgetter
+
+from api.utils import annotate_is_subscribed
+from recipes.models import Recipe, RecipeIngredient
+from users.models import CustomUser
+
+
+# Поля ответа в порядке RecipeSerializer и нужные им колонки values().
+RECIPE_COLUMNS = {
+    "id": (),
+    "tags": (),
+    "author": ("author_id",),
+    "ingredients": (),
+    "is_favorited": ("is_favorited",),
+    "is_in_shopping_cart": ("is_in_shopping_cart",),
+    "name": ("name",),
+    "image": ("image",),
+    "text": ("text",),
+    "cooking_time": ("cooking_time",),
+}
+RECIPE_FIELDS = tuple(RECIPE_COLUMNS)
+RECIPE_SUMMARY_FIELDS = tuple(
+    field for field in RECIPE_FIELDS if field not in ("ingredients", "text")
+)
+AUTHOR_FIELDS = (
+    "email",
+    "id",
+    "username",
+    "first_name",
+    "last_name",
+    "is_subscribed",
+)
+
+image_storage = Recipe._meta.get_field("image").storage
+
+
+def get_recipe_columns(fields=RECIPE_FIELDS):
+    """Колонки values(), нужные для выбранных полей ответа."""
+    return ("id", *(
+        column for field in fields for column in RECIPE_COLUMNS[field]
+    ))
+
+
+def get_image_url(name, request):
+    """Абсолютный URL изображения, как в ImageField из DRF."""
+    if not name:
+        return None
+
+    url = image_storage.url(name)
+    if request is not None:
+        return request.build_absolute_uri(url)
+    return url
+
+
+def serialize_short_recipes(rows, request):
+    """Краткие рецепты из строк values() с полями SHORT_RECIPE_FIELDS."""
+    return [
+        {
+            "id": row["id"],
+            "name": row["name"],
+            "image": get_image_url(row["image"], request),
+            "cooking_time": row["cooking_time"],
+        }
+        for row in rows
+    ]
+
+
+def get_tags(recipe_ids):
+    """Теги рецептов в порядке Tag.Meta.ordering."""
+    tags = defaultdict(list)
+    for row in Recipe.tags.through.objects.filter(
+        recipe_id__in=recipe_ids
+    ).order_by("tag__name").values_list(
+        "recipe_id", "tag__id", "tag__name", "tag__color", "tag__slug"
+    ):
+        tags[row[0]].append({
+            "id": row[1],
+            "name": row[2],
+            "color": row[3],
+            "slug": row[4],
+        })
+
+    return tags
+
+
+def get_ingredients(recipe_ids):
+    """Ингредиенты рецептов с количеством."""
+    ingredients = defaultdict(list)
+    for row in RecipeIngredient.objects.filter(
+        recipe_id__in=recipe_ids
+    ).order_by("pk").values_list(
+        "recipe_id",
+        "ingredient_id",
+        "ingredient__name",
+        "ingredient__measurement_unit",
+        "amount"
+    ):
+        ingredients[row[0]].append({
+            "id": row[1],
+            "name": row[2],
+            "measurement_unit": row[3],
+            "amount": row[4],
+        })
+
+    return ingredients
+
+
+def get_authors(author_ids, user):
+    """Авторы рецептов с признаком подписки."""
+    return {
+        row["id"]: row
+        for row in annotate_is_subscribed(
+            CustomUser.objects.filter(pk__in=author_ids), user
+        ).values(*AUTHOR_FIELDS)
+    }
+
+
+def serialize_recipes(rows, request, fields=RECIPE_FIELDS):
+    """Представление строк values() как в RecipeSerializer.
+
+    Связанные данные запрашиваются только для выбранных полей.
+    """
+    if not rows:
+        return []
+
+    recipe_ids = [row["id"] for row in rows]
+    return build_recipes(
+        rows,
+        request,
+        fields,
+        tags=get_tags(recipe_ids) if "tags" in fields else None,
+        ingredients=(
+            get_ingredients(recipe_ids) if "ingredients" in fields else None
+        ),
+        authors=get_authors(
+            {row["author_id"] for row in rows}, request.user
+        ) if "author" in fields else None
+    )
+
+
+def build_recipes(rows, request, fields, tags=None, ingredients=None,
+                  authors=None, favorites=None, carts=None):
+    """Собрать представление рецептов из уже полученных данных.
+
+    Если переданы множества id избранного и корзины, признаки берутся
+    из них, а не из аннотаций строк.
+    """
+    getters = {
+        "id": lambda row: row["id"],
+        "tags": lambda row: tags[row["id"]],
+        "author": lambda row: authors[row["author_id"]],
+        "ingredients": lambda row: ingredients[row["id"]],
+        "image": lambda row: get_image_url(row["image"], request),
+    }
+    if favorites is not None:
+        getters["is_favorited"] = lambda row: row["id"] in favorites
+    if carts is not None:
+        getters["is_in_shopping_cart"] = lambda row: row["id"] in carts
+    getters = [
+        (field, getters.get(field, itemgetter(field))) for field in fields
+    ]
+
+    return [
+        {field: getter(row) for field, getter in getters}
+        for row in rows
+    ]
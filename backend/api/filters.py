@@ -1,18 +1,32 @@
 import django_filters
+from django.db.models import F
 from django_filters import rest_framework
 from django_filters.rest_framework import FilterSet
 
-from recipes.models import Ingredient, Recipe, Tag
+from api.ingredient_search import search_ingredients
+from recipes.models import Ingredient, Recipe, Tag, get_tags_mask
+
+# Сортировки списка рецептов по ?ordering=; последнее поле уникально,
+# чтобы по ним работала курсорная пагинация.
+RECIPE_ORDERINGS = {
+    "trending": ("-trending_score", "-id"),
+    "popular": ("-popularity", "-id"),
+}
 
 
 class IngredientFilter(FilterSet):
     """Поиск по названию ингредиента."""
 
     name = rest_framework.CharFilter(lookup_expr="istartswith")
+    search = rest_framework.CharFilter(method="filter_search")
+
+    def filter_search(self, queryset, name, value):
+        """Нечеткий поиск с ранжированием, см. search_ingredients."""
+        return search_ingredients(queryset, value)
 
     class Meta:
         model = Ingredient
-        fields = ("name", )
+        fields = ("name", "search")
 
 
 class RecipeFilter(django_filters.FilterSet):
@@ -20,12 +34,42 @@ class RecipeFilter(django_filters.FilterSet):
     tags = django_filters.filters.ModelMultipleChoiceFilter(
         queryset=Tag.objects.all(),
         field_name="tags__slug",
-        to_field_name="slug")
+        to_field_name="slug",
+        method="filter_any_tags")
+    tags_all = django_filters.filters.ModelMultipleChoiceFilter(
+        queryset=Tag.objects.all(),
+        field_name="tags__slug",
+        to_field_name="slug",
+        method="filter_all_tags")
+    ordering = django_filters.filters.ChoiceFilter(
+        choices=[(ordering, ordering) for ordering in RECIPE_ORDERINGS],
+        method="filter_ordering")
     is_favorited = django_filters.filters.NumberFilter(
         method="is_recipe_in_favorites_filter")
     is_in_shopping_cart = django_filters.filters.NumberFilter(
         method="is_recipe_in_shoppingcart_filter")
 
+    def filter_any_tags(self, queryset, name, value):
+        """Рецепты хотя бы с одним из тегов, по маске без JOIN и DISTINCT."""
+        if not value:
+            return queryset
+        return queryset.alias(
+            matched_tags=F("tags_mask").bitand(get_tags_mask(value))
+        ).exclude(matched_tags=0)
+
+    def filter_all_tags(self, queryset, name, value):
+        """Рецепты со всеми указанными тегами."""
+        if not value:
+            return queryset
+        mask = get_tags_mask(value)
+        return queryset.alias(
+            matched_tags=F("tags_mask").bitand(mask)
+        ).filter(matched_tags=mask)
+
+    def filter_ordering(self, queryset, name, value):
+        """Сортировка по популярности или трендовости."""
+        return queryset.order_by(*RECIPE_ORDERINGS[value])
+
     def is_recipe_in_favorites_filter(self, queryset, name, value):
         if value == 1:
             user = self.request.user
@@ -40,4 +84,7 @@ class RecipeFilter(django_filters.FilterSet):
 
     class Meta:
         model = Recipe
-        fields = ("tags", "author", "is_favorited", "is_in_shopping_cart")
+        fields = (
+            "tags", "tags_all", "author", "is_favorited",
+            "is_in_shopping_cart", "ordering"
+        )
@@ -0,0 +1,201 @@
+import re
+import time
+from bisect import bisect_left
+from collections import Counter
+from itertools import islice
+
+from django.conf import settings
+from django.db.models import (BooleanField, Case, F, FloatField, Func, Q,
+                              TextField, Value, When)
+
+from api.metrics import observe_cache
+from recipes.models import Ingredient
+
+WORD_SEPARATORS = re.compile(r"[^\w]+")
+PREFIX, WORD_START, FUZZY = range(3)
+
+_index = None
+
+
+def normalize(text):
+    """Строка для сравнения: нижний регистр, ё как е, слова через пробел.
+
+    В базе то же делает функция normalize_search_text из миграции 0023.
+    """
+    return " ".join(
+        WORD_SEPARATORS.split(text.lower().replace("ё", "е"))
+    ).strip()
+
+
+def get_trigrams(word):
+    """Триграммы слова с отступами, как в pg_trgm."""
+    padded = f"  {word} "
+    return {padded[index:index + 3] for index in range(len(padded) - 2)}
+
+
+class IngredientIndex:
+    """Триграммный индекс названий ингредиентов в памяти процесса."""
+
+    def __init__(self, rows):
+        self.ids = []
+        self.names = []
+        self.words = []
+        self.postings = {}
+        # Хвосты названий с начала каждого слова в алфавитном порядке:
+        # совпадения с начала названия и слова ищутся бинарным поиском.
+        self.suffixes = []
+        for position, (pk, name) in enumerate(rows):
+            name = normalize(name)
+            self.ids.append(pk)
+            self.names.append(name)
+            words = name.split()
+            self.words.append([get_trigrams(word) for word in words])
+            for trigram in set().union(*self.words[-1]):
+                self.postings.setdefault(trigram, []).append(position)
+            for start in range(len(words)):
+                self.suffixes.append(
+                    (" ".join(words[start:]), start > 0, position)
+                )
+        self.suffixes.sort()
+        self.built_at = time.monotonic()
+
+    def __len__(self):
+        return len(self.ids)
+
+    def get_similarity(self, position, query_words):
+        """Средняя по словам запроса доля их триграмм в похожем слове."""
+        return sum(
+            max(
+                (
+                    len(trigrams & word_trigrams) / len(trigrams)
+                    for word_trigrams in self.words[position]
+                ),
+                default=0
+            )
+            for trigrams in query_words
+        ) / len(query_words)
+
+    def search(self, query, limit):
+        """id ингредиентов: начало названия, начало слова, похожие."""
+        query = normalize(query)
+        if not query:
+            return []
+
+        ranks = {}
+        start = bisect_left(self.suffixes, (query,))
+        for suffix, inner, position in islice(self.suffixes, start, None):
+            if not suffix.startswith(query):
+                break
+            rank = WORD_START if inner else PREFIX
+            ranks[position] = min(rank, ranks.get(position, rank))
+        ranked = [
+            (rank, 0, self.names[position], self.ids[position])
+            for position, rank in ranks.items()
+        ]
+
+        # Нечеткое совпадение проверяется только у названий, где хотя бы
+        # одно слово запроса может набрать порог по общим триграммам.
+        query_words = [get_trigrams(word) for word in query.split()]
+        threshold = settings.INGREDIENT_SEARCH_THRESHOLD
+        shared = Counter(
+            position
+            for trigram in set().union(*query_words)
+            for position in self.postings.get(trigram, ())
+        )
+        minimum = threshold * min(len(trigrams) for trigrams in query_words)
+        for position, count in shared.items():
+            if position in ranks or count < minimum:
+                continue
+            similarity = self.get_similarity(position, query_words)
+            if similarity >= threshold:
+                ranked.append((
+                    FUZZY, -similarity, self.names[position],
+                    self.ids[position]
+                ))
+
+        ranked.sort()
+        return [pk for *_, pk in ranked[:limit]]
+
+
+def build_ingredient_index():
+    """Построить индекс заново по текущему справочнику."""
+    global _index
+    _index = IngredientIndex(
+        Ingredient.objects.order_by("id").values_list("id", "name")
+    )
+    return _index
+
+
+def get_ingredient_index():
+    """Индекс процесса; старше INGREDIENT_SEARCH_INDEX_TIMEOUT — заново."""
+    index = _index
+    fresh = index is not None and (
+        time.monotonic() - index.built_at
+        < settings.INGREDIENT_SEARCH_INDEX_TIMEOUT
+    )
+    observe_cache("ingredient_index", fresh)
+    return index if fresh else build_ingredient_index()
+
+
+class NormalizeSearchText(Func):
+    """normalize_search_text из миграции 0023, аналог normalize."""
+    function = "normalize_search_text"
+    output_field = TextField()
+
+
+class WordSimilarity(Func):
+    """word_similarity из pg_trgm."""
+    function = "WORD_SIMILARITY"
+    output_field = FloatField()
+
+
+class TrigramWordSimilar(Func):
+    """Условие `запрос <% поле` из pg_trgm, проверяемое по GIN-индексу."""
+    template = "(%(expressions)s)"
+    arg_joiner = " <%% "
+    output_field = BooleanField()
+
+
+def search_in_database(queryset, query, limit):
+    """Поиск через pg_trgm по GIN-индексу нормализованных названий.
+
+    Запрос и названия нормализуются одинаково с индексом в памяти, так что
+    результаты обоих путей совпадают по составу. Порог нечеткого
+    совпадения — pg_trgm.word_similarity_threshold базы.
+    """
+    query = normalize(query)
+    if not query:
+        return queryset.none()
+
+    return queryset.alias(
+        search_name=NormalizeSearchText("name")
+    ).filter(
+        Q(search_name__startswith=query)
+        | Q(search_name__contains=f" {query}")
+        | Q(TrigramWordSimilar(Value(query), F("search_name")))
+    ).annotate(
+        search_rank=Case(
+            When(search_name__startswith=query, then=Value(PREFIX)),
+            When(search_name__contains=f" {query}", then=Value(WORD_START)),
+            default=Value(FUZZY)
+        ),
+        similarity=WordSimilarity(Value(query), F("search_name"))
+    ).order_by("search_rank", "-similarity", "search_name")[:limit]
+
+
+def search_ingredients(queryset, query):
+    """Ингредиенты по запросу с опечатками и совпадением внутри названия.
+
+    Сначала совпадения с начала названия, затем с начала слова, затем
+    похожие по триграммам, не больше INGREDIENT_SEARCH_LIMIT. Где искать,
+    задает INGREDIENT_SEARCH_BACKEND.
+    """
+    limit = settings.INGREDIENT_SEARCH_LIMIT
+    if settings.INGREDIENT_SEARCH_BACKEND == "database":
+        return search_in_database(queryset, query, limit)
+
+    ids = get_ingredient_index().search(query, limit)
+    return queryset.filter(pk__in=ids).order_by(Case(
+        *(When(pk=pk, then=Value(rank)) for rank, pk in enumerate(ids)),
+        default=Value(len(ids))
+    ))
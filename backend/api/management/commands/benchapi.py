@@ -0,0 +1,388 @@
+import json
+import re
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from urllib.error import HTTPError
+from urllib.parse import quote
+from urllib.request import Request, urlopen
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.models import Count
+from django.test.utils import setup_test_environment
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from api.metrics import QueryCounter
+from recipes.models import Ingredient, Recipe, Tag
+from users.models import CustomUser
+
+
+POSTMAN_COLLECTION = (
+    settings.BASE_DIR.parent / "postman-collection"
+    / "diploma.postman_collection.json"
+)
+
+# Сценарий: (метод, путь, нужна ли авторизация).
+# Метод TOGGLE чередует POST и DELETE на одном адресе.
+SCENARIOS = {
+    "recipe_list": ("GET", "/api/recipes/", False),
+    "recipe_list_100": ("GET", "/api/recipes/?limit=100", False),
+    "recipe_list_100_summary": (
+        "GET", "/api/recipes/?limit=100&omit=text,ingredients", False
+    ),
+    "recipe_list_tags": (
+        "GET", "/api/recipes/?tags={tag_slug}&tags={second_tag_slug}", False
+    ),
+    "recipe_list_trending": (
+        "GET", "/api/recipes/?ordering=trending&tags={tag_slug}", False
+    ),
+    "recipe_list_author": ("GET", "/api/recipes/?author={author_id}", False),
+    "recipe_list_favorited": ("GET", "/api/recipes/?is_favorited=1", True),
+    "recipe_list_cart": ("GET", "/api/recipes/?is_in_shopping_cart=1", True),
+    "recipe_batch": ("GET", "/api/recipes/?ids={recipe_ids}", True),
+    "recipe_detail": ("GET", "/api/recipes/{recipe_id}/", False),
+    "tag_list": ("GET", "/api/tags/", False),
+    "recipe_facets": (
+        "GET", "/api/recipes/facets/?tags={tag_slug}&is_favorited=1", True
+    ),
+    "recipe_similar": ("GET", "/api/recipes/{recipe_id}/similar/", False),
+    "recipe_similar_ingredients": (
+        "GET", "/api/recipes/{recipe_id}/similar_ingredients/", False
+    ),
+    "recipe_recommended": ("GET", "/api/recipes/recommended/", True),
+    "recipe_suggest": (
+        "GET", "/api/recipes/suggest/?q={recipe_prefix}", False
+    ),
+    "ingredient_search": (
+        "GET", "/api/ingredients/?name={ingredient_prefix}", False
+    ),
+    "ingredient_fuzzy_search": (
+        "GET", "/api/ingredients/?search={ingredient_typo}", False
+    ),
+    "sync": ("GET", "/api/sync/?since=0", True),
+    "subscriptions": (
+        "GET", "/api/users/subscriptions/?recipes_limit=3", True
+    ),
+    "favorite_toggle": ("TOGGLE", "/api/recipes/{recipe_id}/favorite/", True),
+    "cart_toggle": (
+        "TOGGLE", "/api/recipes/{recipe_id}/shopping_cart/", True
+    ),
+    "shopping_list": ("GET", "/api/recipes/download_shopping_cart/", True),
+    "shopping_list_export": (
+        "POST", "/api/recipes/download_shopping_cart/exports/", True
+    ),
+}
+
+
+def percentile(values, rank):
+    """Перцентиль по методу ближайшего ранга для отсортированного списка."""
+    if not values:
+        return None
+    index = max(0, min(len(values) - 1, round(rank / 100 * len(values)) - 1))
+    return values[index]
+
+
+class ClientTransport:
+    """Запросы через тестовый клиент Django с подсчетом SQL-запросов."""
+
+    def __init__(self, user):
+        setup_test_environment()
+        self.anonymous = APIClient()
+        self.authorized = APIClient()
+        self.authorized.force_authenticate(user)
+
+    def request(self, method, path, auth):
+        client = self.authorized if auth else self.anonymous
+        counter = QueryCounter()
+        with ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(
+                    connections[alias].execute_wrapper(counter)
+                )
+            response = getattr(client, method.lower())(path)
+            if response.streaming:
+                b"".join(response.streaming_content)
+
+        return response.status_code, counter.count
+
+
+class HttpTransport:
+    """Запросы к запущенному серверу, например локальному gunicorn."""
+
+    def __init__(self, base_url, user):
+        self.base_url = base_url.rstrip("/")
+        self.token = Token.objects.get_or_create(user=user)[0].key
+
+    def request(self, method, path, auth):
+        headers = {"Authorization": f"Token {self.token}"} if auth else {}
+        http_request = Request(
+            self.base_url + quote(path, safe="/?&=%"),
+            method=method,
+            headers=headers
+        )
+        try:
+            with urlopen(http_request) as response:
+                response.read()
+                return response.status, None
+        except HTTPError as error:
+            return error.code, None
+
+
+class Command(BaseCommand):
+    """Нагрузочный прогон сценариев API с перцентилями задержек."""
+
+    help = (
+        "Прогоняет сценарии API на текущей базе и сохраняет p50/p95/p99, "
+        "пропускную способность и число SQL-запросов в JSON"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--scenario", action="append",
+            choices=[*SCENARIOS, "postman"],
+            help="Сценарий; по умолчанию все, кроме postman"
+        )
+        parser.add_argument("--requests", type=int, default=100)
+        parser.add_argument("--warmup", type=int, default=5)
+        parser.add_argument(
+            "--base-url",
+            help="Адрес запущенного сервера вместо тестового клиента"
+        )
+        parser.add_argument(
+            "--concurrency", type=int, default=1,
+            help="Число параллельных запросов (только с --base-url)"
+        )
+        parser.add_argument("--user", type=int, help="id пользователя")
+        parser.add_argument("--postman", default=str(POSTMAN_COLLECTION))
+        parser.add_argument("--output", help="Файл для JSON с результатами")
+        parser.add_argument(
+            "--compare", help="JSON предыдущего прогона для сравнения"
+        )
+        parser.add_argument(
+            "--threshold", type=float, default=0.2,
+            help="Допустимый относительный рост p95 при сравнении"
+        )
+
+    def handle(self, *args, **options):
+        if options["concurrency"] > 1 and not options["base_url"]:
+            raise CommandError(
+                "Параллельные запросы поддерживаются только с --base-url."
+            )
+
+        user = self.get_user(options["user"])
+        self.context = self.get_context(user)
+        if options["base_url"]:
+            transport = HttpTransport(options["base_url"], user)
+        else:
+            transport = ClientTransport(user)
+
+        results = {}
+        for name in options["scenario"] or list(SCENARIOS):
+            requests = self.build_requests(name, options["postman"])
+            if SCENARIOS.get(name, ("GET",))[0] == "TOGGLE":
+                transport.request("DELETE", *requests[1][1:])
+            results[name] = self.run_scenario(
+                transport, requests, options["requests"],
+                options["warmup"], options["concurrency"]
+            )
+            self.report(name, results[name])
+
+        report = {
+            "meta": {
+                "commit": self.get_commit(),
+                "timestamp": timezone.now().isoformat(),
+                "mode": options["base_url"] or "client",
+                "concurrency": options["concurrency"],
+                "requests": options["requests"],
+                "user": user.id,
+            },
+            "scenarios": results,
+        }
+        if options["output"]:
+            with open(options["output"], "w", encoding="utf-8") as file:
+                json.dump(report, file, ensure_ascii=False, indent=2)
+
+        if options["compare"]:
+            self.compare(options["compare"], results, options["threshold"])
+
+    def get_user(self, user_id):
+        """Пользователь для авторизованных сценариев."""
+        if user_id:
+            return CustomUser.objects.get(pk=user_id)
+
+        user = CustomUser.objects.annotate(
+            carts=Count("shopping_user")
+        ).order_by("-carts", "id").first()
+        if user is None:
+            raise CommandError(
+                "База пуста, заполните ее командой seed."
+            )
+        return user
+
+    def get_context(self, user):
+        """Значения для подстановки в адреса сценариев."""
+        tags = list(Tag.objects.values_list("id", "slug")[:3])
+        recipe = Recipe.objects.exclude(author=user).first()
+        ingredient = Ingredient.objects.first()
+        if not tags or recipe is None or ingredient is None:
+            raise CommandError("В базе нет тегов, рецептов или ингредиентов.")
+
+        return {
+            "tag_id": tags[0][0],
+            "tag_slug": tags[0][1],
+            "second_tag_slug": tags[min(1, len(tags) - 1)][1],
+            "third_tag_slug": tags[-1][1],
+            "author_id": recipe.author_id,
+            "recipe_id": recipe.id,
+            "recipe_prefix": recipe.name[:3],
+            "recipe_ids": ",".join(
+                str(pk) for pk in Recipe.objects.order_by(
+                    "-pub_date"
+                ).values_list("id", flat=True)[:20]
+            ),
+            "ingredient_id": ingredient.id,
+            "ingredient_prefix": ingredient.name[:2],
+            # Название с пропущенной буквой — запрос с опечаткой.
+            "ingredient_typo": ingredient.name[:1] + ingredient.name[2:],
+            "user_id": user.id,
+        }
+
+    def build_requests(self, name, postman_path):
+        """Список запросов сценария вида (метод, путь, авторизация)."""
+        if name == "postman":
+            return self.load_postman(postman_path)
+
+        method, path, auth = SCENARIOS[name]
+        path = path.format(**self.context)
+        if method == "TOGGLE":
+            return [("POST", path, auth), ("DELETE", path, auth)]
+        return [(method, path, auth)]
+
+    def load_postman(self, path):
+        """Безопасные запросы postman-коллекции с подставленными данными."""
+        with open(path, encoding="utf-8") as file:
+            collection = json.load(file)
+
+        variables = {
+            "userId": self.context["user_id"],
+            "firstTagId": self.context["tag_id"],
+            "secondTagSlug": self.context["second_tag_slug"],
+            "thirdTagSlug": self.context["third_tag_slug"],
+            "firstRecipeId": self.context["recipe_id"],
+            "firstIndredientId": self.context["ingredient_id"],
+            "ingredientNameFirstLatter": self.context["ingredient_prefix"],
+        }
+        requests = []
+        items = list(collection["item"])
+        while items:
+            item = items.pop(0)
+            if "item" in item:
+                items[:0] = item["item"]
+                continue
+
+            request = item["request"]
+            if request["method"] != "GET":
+                continue
+            url = re.sub(r"^{{baseUrl}}", "", request["url"]["raw"])
+            url = re.sub(
+                r"{{(\w+)}}",
+                lambda match: str(variables.get(match[1], match[0])),
+                url
+            )
+            if "{{" in url:
+                continue
+            auth = (request.get("auth") or {}).get("type") == "apikey"
+            requests.append(("GET", url, auth))
+
+        return requests
+
+    def run_scenario(self, transport, requests, count, warmup, concurrency):
+        """Выполнить сценарий и посчитать статистику."""
+        def call(number):
+            method, path, auth = requests[number % len(requests)]
+            start = time.perf_counter()
+            status, queries = transport.request(method, path, auth)
+            return time.perf_counter() - start, status, queries
+
+        # Прогрев кратен длине сценария, чтобы замер начинался с начала.
+        for number in range(-(-warmup // len(requests)) * len(requests)):
+            call(number)
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            samples = list(executor.map(call, range(count)))
+        elapsed = time.perf_counter() - started
+
+        latencies = sorted(sample[0] * 1000 for sample in samples)
+        queries = [sample[2] for sample in samples if sample[2] is not None]
+
+        return {
+            "requests": count,
+            "errors": sum(1 for sample in samples if sample[1] >= 400),
+            "p50_ms": percentile(latencies, 50),
+            "p95_ms": percentile(latencies, 95),
+            "p99_ms": percentile(latencies, 99),
+            "mean_ms": sum(latencies) / len(latencies),
+            "rps": count / elapsed,
+            "queries_mean": (
+                sum(queries) / len(queries) if queries else None
+            ),
+            "queries_max": max(queries) if queries else None,
+        }
+
+    def report(self, name, result):
+        """Вывести строку результата сценария."""
+        queries = result["queries_mean"]
+        self.stdout.write(
+            f"{name:<24} p50={result['p50_ms']:.1f}ms "
+            f"p95={result['p95_ms']:.1f}ms p99={result['p99_ms']:.1f}ms "
+            f"rps={result['rps']:.1f} errors={result['errors']} "
+            f"queries={'-' if queries is None else f'{queries:.1f}'}"
+        )
+
+    def compare(self, path, results, threshold):
+        """Сравнить с предыдущим прогоном и упасть при регрессии."""
+        with open(path, encoding="utf-8") as file:
+            previous = json.load(file)["scenarios"]
+
+        regressions = []
+        for name, result in results.items():
+            before = previous.get(name)
+            if before is None:
+                continue
+            change = result["p95_ms"] / before["p95_ms"] - 1
+            self.stdout.write(f"{name:<24} p95 {change:+.1%}")
+            if change > threshold:
+                regressions.append(f"{name}: p95 {change:+.1%}")
+            if (
+                result["queries_max"] is not None
+                and before.get("queries_max") is not None
+                and result["queries_max"] > before["queries_max"]
+            ):
+                regressions.append(
+                    f"{name}: запросов {before['queries_max']} -> "
+                    f"{result['queries_max']}"
+                )
+
+        if regressions:
+            raise CommandError(
+                "Обнаружены регрессии:\n" + "\n".join(regressions)
+            )
+        self.stdout.write(self.style.SUCCESS("Регрессий нет."))
+
+    @staticmethod
+    def get_commit():
+        """Текущий коммит, если доступен git."""
+        try:
+            return subprocess.run(
+                ["git", "rev-parse", "--short", "HEAD"],
+                capture_output=True, text=True, check=True,
+                cwd=settings.BASE_DIR
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
@@ -0,0 +1,116 @@
+import json
+import os
+import socket
+import subprocess
+import tempfile
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+
+# Развертывания: название -> класс воркеров gunicorn.
+DEPLOYMENTS = {
+    "WSGI": "gthread",
+    "ASGI": "uvicorn.workers.UvicornWorker",
+}
+SCENARIOS = (
+    "recipe_list", "recipe_list_tags", "tag_list", "ingredient_search"
+)
+
+
+class Command(BaseCommand):
+    """Сравнение пропускной способности WSGI и ASGI развертываний."""
+
+    help = (
+        "Поочередно запускает gunicorn с WSGI (gthread) и ASGI (uvicorn) "
+        "воркерами и прогоняет на них сценарии benchapi с высокой "
+        "конкурентностью"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--scenario", action="append", choices=SCENARIOS,
+            help="Сценарий; по умолчанию все списки"
+        )
+        parser.add_argument("--requests", type=int, default=1000)
+        parser.add_argument("--concurrency", type=int, default=64)
+        parser.add_argument("--workers", type=int, default=2)
+        parser.add_argument("--port", type=int, default=8765)
+        parser.add_argument("--output", help="Файл для JSON с результатами")
+
+    def handle(self, *args, **options):
+        scenarios = options["scenario"] or list(SCENARIOS)
+        results = {}
+        for name, worker_class in DEPLOYMENTS.items():
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                f"{name} ({worker_class})"
+            ))
+            with self.run_server(worker_class, options) as base_url:
+                results[name] = self.run_bench(base_url, scenarios, options)
+
+        self.stdout.write(self.style.MIGRATE_HEADING("Итог"))
+        for scenario in scenarios:
+            wsgi = results["WSGI"][scenario]
+            asgi = results["ASGI"][scenario]
+            self.stdout.write(
+                f"{scenario:<20} rps {wsgi['rps']:>7.1f} -> "
+                f"{asgi['rps']:>7.1f} (x{asgi['rps'] / wsgi['rps']:.2f}), "
+                f"p95 {wsgi['p95_ms']:.0f}ms -> {asgi['p95_ms']:.0f}ms"
+            )
+
+        if options["output"]:
+            with open(options["output"], "w", encoding="utf-8") as file:
+                json.dump(results, file, ensure_ascii=False, indent=2)
+
+    @contextmanager
+    def run_server(self, worker_class, options):
+        """Запустить gunicorn и дождаться, пока он начнет принимать запросы."""
+        address = ("localhost", options["port"])
+        env = {
+            **os.environ,
+            "GUNICORN_BIND": "{}:{}".format(*address),
+            "GUNICORN_WORKER_CLASS": worker_class,
+            "GUNICORN_WORKERS": str(options["workers"]),
+        }
+        server = subprocess.Popen(
+            ["gunicorn", "--config", "gunicorn.conf.py"],
+            cwd=settings.BASE_DIR, env=env,
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        try:
+            deadline = time.monotonic() + 30
+            while True:
+                try:
+                    socket.create_connection(address, timeout=1).close()
+                    break
+                except OSError:
+                    if server.poll() is not None:
+                        raise CommandError(
+                            f"gunicorn с {worker_class} не запустился."
+                        )
+                    if time.monotonic() > deadline:
+                        raise CommandError(
+                            f"gunicorn с {worker_class} не ответил за 30 с."
+                        )
+                    time.sleep(0.2)
+            yield "http://{}:{}".format(*address)
+        finally:
+            server.terminate()
+            server.wait()
+
+    def run_bench(self, base_url, scenarios, options):
+        """Прогнать сценарии benchapi и вернуть их результаты."""
+        with tempfile.NamedTemporaryFile(suffix=".json") as output:
+            call_command(
+                "benchapi",
+                scenario=scenarios,
+                base_url=base_url,
+                requests=options["requests"],
+                concurrency=options["concurrency"],
+                output=output.name,
+                stdout=self.stdout,
+            )
+            with open(output.name, encoding="utf-8") as file:
+                return json.load(file)["scenarios"]
@@ -0,0 +1,113 @@
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+from django.test import RequestFactory
+from rest_framework.renderers import JSONRenderer
+
+from api.fast_serializers import (RECIPE_SUMMARY_FIELDS, get_recipe_columns,
+                                  serialize_recipes)
+from api.serializers import RecipeSerializer
+from api.utils import annotate_recipe_flags, get_recipe_queryset
+from recipes.models import Recipe
+from users.models import CustomUser
+
+
+class Command(BaseCommand):
+    """Микробенчмарк сериализации списка рецептов."""
+
+    help = (
+        "Сравнивает RecipeSerializer, быстрый сериализатор строк и краткое "
+        "представление списка по числу рецептов в секунду и пиковой памяти, "
+        "проверяет совпадение JSON"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--size", type=int, default=100)
+        parser.add_argument("--rounds", type=int, default=20)
+        parser.add_argument("--user", type=int, help="id пользователя")
+
+    def handle(self, *args, **options):
+        size = options["size"]
+        request = RequestFactory().get("/api/recipes/")
+        request.user = self.get_user(options["user"])
+
+        def drf():
+            recipes = list(get_recipe_queryset(request.user)[:size])
+            return RecipeSerializer(
+                recipes, many=True, context={"request": request}
+            ).data
+
+        def fast():
+            rows = list(annotate_recipe_flags(
+                Recipe.objects.all(), request.user
+            ).values(*get_recipe_columns())[:size])
+            return serialize_recipes(rows, request)
+
+        def summary():
+            rows = list(annotate_recipe_flags(
+                Recipe.objects.all(), request.user
+            ).values(*get_recipe_columns(RECIPE_SUMMARY_FIELDS))[:size])
+            return serialize_recipes(rows, request, RECIPE_SUMMARY_FIELDS)
+
+        recipes = list(get_recipe_queryset(request.user)[:size])
+        if not recipes:
+            raise CommandError("В базе нет рецептов, запустите seed.")
+
+        def drf_only():
+            return RecipeSerializer(
+                recipes, many=True, context={"request": request}
+            ).data
+
+        renderer = JSONRenderer()
+        identical = renderer.render(drf()) == renderer.render(fast())
+
+        functions = {
+            "RecipeSerializer (с запросами)": drf,
+            "RecipeSerializer (без запросов)": drf_only,
+            "serialize_recipes (с запросами)": fast,
+            "краткий список (с запросами)": summary,
+        }
+        baseline = self.measure(drf, options)
+        for name, function in functions.items():
+            rate = self.measure(function, options)
+            peak = self.measure_memory(function)
+            size_kb = len(renderer.render(function())) / 1024
+            self.stdout.write(
+                f"{name:<34} {rate * len(recipes):>10.0f} рецептов/с "
+                f"(x{rate / baseline:.1f}) память {peak / 1024:>8.0f} КБ "
+                f"JSON {size_kb:>7.0f} КБ"
+            )
+
+        if identical:
+            self.stdout.write(self.style.SUCCESS("JSON совпадает побайтно."))
+        else:
+            raise CommandError("JSON быстрого сериализатора отличается!")
+
+    def measure(self, function, options):
+        """Число вызовов в секунду."""
+        function()
+        start = time.perf_counter()
+        for _ in range(options["rounds"]):
+            function()
+        return options["rounds"] / (time.perf_counter() - start)
+
+    @staticmethod
+    def measure_memory(function):
+        """Пиковый объем памяти, выделенной за один вызов."""
+        tracemalloc.start()
+        try:
+            function()
+            return tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    def get_user(self, user_id):
+        """Пользователь, от имени которого сериализуются рецепты."""
+        if user_id:
+            return CustomUser.objects.get(pk=user_id)
+
+        return CustomUser.objects.annotate(
+            carts=Count("shopping_user")
+        ).order_by("-carts", "id").first()
@@ -0,0 +1,87 @@
+import statistics
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import F
+
+from recipes.models import Recipe, Tag, get_tags_mask
+
+
+class Command(BaseCommand):
+    """Бенчмарк фильтрации рецептов по тегам: JOIN против битовой маски."""
+
+    help = (
+        "Сравнивает фильтр по тегам через таблицу связей с DISTINCT и через "
+        "маску tags_mask: COUNT и первая страница для условий ИЛИ и И, "
+        "с проверкой совпадения результатов"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rounds", type=int, default=20)
+
+    def handle(self, *args, **options):
+        tags = list(Tag.objects.order_by("id"))
+        if len(tags) < 2 or not Recipe.objects.exists():
+            raise CommandError("Нужны хотя бы два тега и рецепты, см. seed.")
+
+        cases = {
+            "один тег": (tags[:1], False),
+            "два тега, ИЛИ": (tags[:2], False),
+            "все теги, ИЛИ": (tags, False),
+            "два тега, И": (tags[:2], True),
+        }
+        page_size = settings.REST_FRAMEWORK["PAGE_SIZE"]
+        for name, (selected, conjoined) in cases.items():
+            join = self.join_queryset(selected, conjoined)
+            mask = self.mask_queryset(selected, conjoined)
+            for operation, run in (
+                ("COUNT", lambda queryset: queryset.count()),
+                ("страница", lambda queryset: list(
+                    queryset.values_list("id", flat=True)[:page_size]
+                )),
+            ):
+                if run(join) != run(mask):
+                    raise CommandError(
+                        f"{name}, {operation}: результаты JOIN и маски "
+                        f"различаются!"
+                    )
+                join_ms = self.measure(run, join, options["rounds"])
+                mask_ms = self.measure(run, mask, options["rounds"])
+                self.stdout.write(
+                    f"{name:<16} {operation:<9} JOIN {join_ms:>8.2f} мс  "
+                    f"маска {mask_ms:>8.2f} мс  (x{join_ms / mask_ms:.1f})"
+                )
+
+        self.stdout.write(self.style.SUCCESS("Результаты совпадают."))
+
+    @staticmethod
+    def join_queryset(tags, conjoined):
+        """Фильтр через таблицу связей, как до появления маски."""
+        queryset = Recipe.objects.all()
+        if not conjoined:
+            return queryset.filter(tags__in=tags).distinct()
+        for tag in tags:
+            queryset = queryset.filter(tags=tag)
+        return queryset
+
+    @staticmethod
+    def mask_queryset(tags, conjoined):
+        """Фильтр по маске, как в RecipeFilter."""
+        mask = get_tags_mask(tags)
+        queryset = Recipe.objects.alias(
+            matched_tags=F("tags_mask").bitand(mask)
+        )
+        if conjoined:
+            return queryset.filter(matched_tags=mask)
+        return queryset.exclude(matched_tags=0)
+
+    @staticmethod
+    def measure(run, queryset, rounds):
+        """Медианное время выполнения в миллисекундах."""
+        timings = []
+        for _ in range(rounds):
+            start = time.perf_counter()
+            run(queryset)
+            timings.append((time.perf_counter() - start) * 1000)
+        return statistics.median(timings)
@@ -0,0 +1,463 @@
+import base64
+import difflib
+import io
+import tempfile
+from collections import Counter
+from contextlib import ExitStack
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.tokens import default_token_generator
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+from django.test.utils import override_settings, setup_test_environment
+from djoser.utils import encode_uid
+from PIL import Image
+from rest_framework.test import APIClient
+
+from api.ingredient_search import build_ingredient_index
+from api.recipe_suggest import build_recipe_name_index
+from api.shopping_list import build_export, start_export
+from api.urls import router, urlpatterns
+from recipes.changes import assign_positions
+from recipes.models import (Change, Favorite, Ingredient, Recipe,
+                            RecipeIngredient, RecipeNeighbor, ShoppingCart,
+                            Tag, get_tags_mask)
+from users.models import CustomUser, Subscriptions
+
+
+PAGE_SIZES = (2, 10)
+
+
+# Бюджет SQL-запросов: (маршрут, метод, адрес, авторизация, данные,
+# ожидаемый статус ответа, бюджет, проверять ли независимость от размера).
+# Размер подставляется в адрес как {size} или передается в функцию данных
+# (число ингредиентов). Письма активации выключены
+# (SEND_ACTIVATION_EMAIL), поэтому resend_activation отвечает 400.
+# Запросы выполняются с force_authenticate, поэтому поиск токена
+# в бюджет не входит.
+QUERY_BUDGETS = (
+    ("api-root", "GET", "/api/", False, None, 200, 0, False),
+    ("ingredient-list", "GET", "/api/ingredients/?name=бюд", False,
+     None, 200, 1, False),
+    ("ingredient-list", "GET", "/api/ingredients/?search=бюджте", False,
+     None, 200, 1, False),
+    ("ingredient-detail", "GET", "/api/ingredients/{ingredient}/", False,
+     None, 200, 1, False),
+    ("tag-list", "GET", "/api/tags/", False, None, 200, 1, False),
+    ("tag-detail", "GET", "/api/tags/{tag}/", False, None, 200, 1, False),
+    ("recipe-list", "GET", "/api/recipes/?limit={size}", False,
+     None, 200, 5, True),
+    ("recipe-list", "GET", "/api/recipes/?limit={size}", True,
+     None, 200, 5, True),
+    ("recipe-list", "GET", "/api/recipes/?limit={size}&is_favorited=1",
+     True, None, 200, 5, True),
+    ("recipe-list", "GET",
+     "/api/recipes/?limit={size}&is_in_shopping_cart=1", True,
+     None, 200, 5, True),
+    ("recipe-list", "GET", "/api/recipes/?limit={size}&tags={tag_slug}",
+     False, None, 200, 6, True),
+    ("recipe-list", "GET",
+     "/api/recipes/?limit={size}&tags_all={tag_slug}&tags_all={tag_slug_2}",
+     False, None, 200, 6, True),
+    ("recipe-list", "GET",
+     "/api/recipes/?limit={size}&ordering=trending&tags={tag_slug}", True,
+     None, 200, 5, True),
+    ("recipe-list", "GET", "/api/recipes/?limit={size}&ordering=popular",
+     False, None, 200, 4, True),
+    ("recipe-list", "GET",
+     "/api/recipes/?limit={size}&fields=id,name,image,cooking_time", True,
+     None, 200, 2, True),
+    ("recipe-list", "GET", "/api/recipes/?ids={recipe},{own_recipe},0",
+     True, None, 200, 4, False),
+    ("recipe-list", "POST", "/api/recipes/", True,
+     lambda fixture, size: fixture.recipe_data(size), 201, 13, True),
+    ("recipe-similar", "GET", "/api/recipes/{recipe}/similar/?limit={size}",
+     False, None, 200, 1, True),
+    ("recipe-similar-ingredients", "GET",
+     "/api/recipes/{recipe}/similar_ingredients/?limit={size}", False,
+     None, 200, 1, True),
+    ("recipe-recommended", "GET", "/api/recipes/recommended/?limit={size}",
+     True, None, 200, 1, True),
+    ("recipe-suggest", "GET", "/api/recipes/suggest/?q=рец&limit={size}",
+     False, None, 200, 0, True),
+    ("recipe-facets", "GET", "/api/recipes/facets/", False, None,
+     200, 2, False),
+    ("recipe-facets", "GET",
+     "/api/recipes/facets/?is_favorited=1&tags_all={tag_slug}", True, None,
+     200, 3, False),
+    ("recipe-detail", "GET", "/api/recipes/{recipe}/", True, None,
+     200, 4, False),
+    ("recipe-detail", "PATCH", "/api/recipes/{own_recipe}/", True,
+     lambda fixture, size: fixture.recipe_data(size), 200, 16, True),
+    ("recipe-detail", "DELETE", "/api/recipes/{own_recipe}/", True,
+     None, 204, 10, False),
+    ("recipe-favorite", "POST", "/api/recipes/{other_recipe}/favorite/",
+     True, None, 201, 4, False),
+    ("recipe-favorite", "DELETE", "/api/recipes/{recipe}/favorite/", True,
+     None, 204, 4, False),
+    ("recipe-shopping-cart", "POST",
+     "/api/recipes/{other_recipe}/shopping_cart/", True, None,
+     201, 4, False),
+    ("recipe-shopping-cart", "DELETE",
+     "/api/recipes/{recipe}/shopping_cart/", True, None, 204, 4, False),
+    ("recipe-download-shopping-cart", "GET",
+     "/api/recipes/download_shopping_cart/", True, None, 200, 1, False),
+    ("recipe-shopping-list-exports", "POST",
+     "/api/recipes/download_shopping_cart/exports/", True, None,
+     200, 2, False),
+    ("recipe-shopping-list-export", "GET",
+     "/api/recipes/download_shopping_cart/exports/{export}/", True,
+     None, 200, 1, False),
+    ("recipe-shopping-list-export-file", "GET",
+     "/api/recipes/download_shopping_cart/exports/{export}/file/", True,
+     None, 200, 1, False),
+    ("customuser-list", "GET", "/api/users/?limit={size}", False,
+     None, 200, 2, True),
+    ("customuser-list", "GET", "/api/users/?limit={size}", True,
+     None, 200, 2, True),
+    ("customuser-list", "GET", "/api/users/?ids={author},{stranger},0",
+     True, None, 200, 1, False),
+    ("customuser-list", "POST", "/api/users/", False,
+     lambda fixture, size: fixture.user_data(), 201, 3, False),
+    ("customuser-detail", "GET", "/api/users/{author}/", True,
+     None, 200, 1, False),
+    ("customuser-me", "GET", "/api/users/me/", True, None, 200, 1, False),
+    ("customuser-set-password", "POST", "/api/users/set_password/", True,
+     lambda fixture, size: fixture.password_data(), 204, 1, False),
+    ("customuser-subscriptions", "GET",
+     "/api/users/subscriptions/?limit={size}", True, None, 200, 4, True),
+    ("customuser-subscriptions", "GET",
+     "/api/users/subscriptions/?limit={size}&recipes_limit=1", True,
+     None, 200, 4, True),
+    ("customuser-subscriptions", "GET",
+     "/api/users/subscriptions/?limit={size}&omit=recipes", True,
+     None, 200, 3, True),
+    ("customuser-subscribe", "POST", "/api/users/{stranger}/subscribe/",
+     True, None, 201, 9, False),
+    ("customuser-subscribe", "DELETE", "/api/users/{author}/subscribe/",
+     True, None, 204, 4, False),
+    ("customuser-activation", "POST", "/api/users/activation/", False,
+     lambda fixture, size: fixture.token_data(fixture.inactive),
+     204, 2, False),
+    ("customuser-resend-activation", "POST",
+     "/api/users/resend_activation/", False,
+     lambda fixture, size: {"email": fixture.inactive.email}, 400, 1, False),
+    ("customuser-reset-password", "POST", "/api/users/reset_password/",
+     False, lambda fixture, size: {"email": fixture.user.email},
+     204, 1, False),
+    ("customuser-reset-password-confirm", "POST",
+     "/api/users/reset_password_confirm/", False,
+     lambda fixture, size: {
+         **fixture.token_data(fixture.user),
+         "new_password": "Budget-Passw0rd",
+     }, 204, 2, False),
+    ("customuser-set-username", "POST", "/api/users/set_username/", True,
+     lambda fixture, size: {
+         "new_email": "budget-renamed@example.com",
+         "current_password": fixture.password,
+     }, 204, 4, False),
+    ("customuser-reset-username", "POST", "/api/users/reset_username/",
+     False, lambda fixture, size: {"email": fixture.user.email},
+     204, 1, False),
+    ("customuser-reset-username-confirm", "POST",
+     "/api/users/reset_username_confirm/", False,
+     lambda fixture, size: {
+         **fixture.token_data(fixture.user),
+         "new_email": "budget-renamed@example.com",
+     }, 204, 5, False),
+    ("sync", "GET", "/api/sync/", True, None, 200, 2, False),
+    ("sync", "GET", "/api/sync/?since=0", True, None, 200, 7, False),
+    ("login", "POST", "/api/auth/token/login/", False,
+     lambda fixture, size: fixture.login_data(), 200, 6, False),
+    ("logout", "POST", "/api/auth/token/logout/", True, None, 204, 1, False),
+)
+
+
+class QueryRecorder:
+    """Обертка выполнения SQL, запоминающая тексты запросов."""
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        self.queries.append(sql)
+        return execute(sql, params, many, context)
+
+
+class Fixture:
+    """Набор данных, на котором проверяются бюджеты запросов."""
+
+    password = "budget-password"
+
+    def __init__(self, authors):
+        self.tags = [
+            Tag.objects.create(
+                name=f"Бюджет {number}", color=f"#00000{number}",
+                slug=f"budget-{number}"
+            )
+            for number in range(2)
+        ]
+        self.ingredients = [
+            Ingredient.objects.create(
+                name=f"бюджет {number}", measurement_unit="г"
+            )
+            for number in range(max(PAGE_SIZES))
+        ]
+        build_ingredient_index()
+        self.password_hash = make_password(self.password)
+        self.user = self.create_user("budget-user")
+        self.stranger = self.create_user("budget-stranger")
+        self.inactive = self.create_user("budget-inactive", is_active=False)
+        self.authors = [
+            self.create_user(f"budget-author-{number}")
+            for number in range(authors)
+        ]
+
+        recipes = [
+            self.create_recipe(author)
+            for author in [*self.authors, self.stranger] for _ in range(2)
+        ]
+        self.own_recipe = self.create_recipe(self.user)
+        self.other_recipe = self.create_recipe(self.stranger)
+        Subscriptions.objects.bulk_create(
+            Subscriptions(user=self.user, author=author)
+            for author in self.authors
+        )
+        Favorite.objects.bulk_create(
+            Favorite(user=self.user, recipe=recipe) for recipe in recipes
+        )
+        ShoppingCart.objects.bulk_create(
+            ShoppingCart(user=self.user, recipe=recipe) for recipe in recipes
+        )
+        self.recipe = recipes[0]
+        RecipeNeighbor.objects.bulk_create(
+            RecipeNeighbor(recipe=recipe, neighbor=neighbor, score=0.5)
+            for recipe in [*recipes, self.own_recipe, self.other_recipe]
+            for neighbor in [*recipes, self.own_recipe, self.other_recipe]
+            if neighbor != recipe
+        )
+        build_recipe_name_index()
+        Change.objects.bulk_create(
+            Change(kind=kind, object_id=recipe.id, user=self.user)
+            for kind in (Change.FAVORITE, Change.SHOPPING_CART)
+            for recipe in recipes
+        )
+        assign_positions()
+
+        self.export = start_export(self.user)[0]
+        build_export(self.export.pk)
+
+        buffer = io.BytesIO()
+        Image.new("RGB", (1, 1)).save(buffer, "PNG")
+        self.image = (
+            "data:image/png;base64,"
+            + base64.b64encode(buffer.getvalue()).decode()
+        )
+
+    def create_user(self, username, is_active=True):
+        user = CustomUser(
+            username=username, email=f"{username}@example.com",
+            first_name="Имя", last_name="Фамилия", is_active=is_active
+        )
+        user.password = self.password_hash
+        user.save()
+        return user
+
+    def create_recipe(self, author):
+        recipe = Recipe.objects.create(
+            author=author, name="Рецепт", text="Текст", cooking_time=10,
+            image="recipes/images/budget.png",
+            tags_mask=get_tags_mask(self.tags)
+        )
+        recipe.tags.set(self.tags)
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(recipe=recipe, ingredient=ingredient, amount=1)
+            for ingredient in self.ingredients[:3]
+        )
+        recipe.update_ingredients_minhash()
+        return recipe
+
+    def context(self):
+        return {
+            "tag": self.tags[0].id,
+            "tag_slug": self.tags[0].slug,
+            "tag_slug_2": self.tags[1].slug,
+            "ingredient": self.ingredients[0].id,
+            "recipe": self.recipe.id,
+            "own_recipe": self.own_recipe.id,
+            "other_recipe": self.other_recipe.id,
+            "author": self.authors[0].id,
+            "stranger": self.stranger.id,
+            "export": self.export.pk,
+        }
+
+    def recipe_data(self, size):
+        return {
+            "ingredients": [
+                {"id": ingredient.id, "amount": 2}
+                for ingredient in self.ingredients[:size]
+            ],
+            "tags": [tag.id for tag in self.tags],
+            "image": self.image,
+            "name": "Новый рецепт",
+            "text": "Текст",
+            "cooking_time": 5,
+        }
+
+    def user_data(self):
+        return {
+            "email": "budget-new@example.com",
+            "username": "budget-new",
+            "first_name": "Имя",
+            "last_name": "Фамилия",
+            "password": "Budget-Passw0rd",
+        }
+
+    def password_data(self):
+        return {
+            "new_password": "Budget-Passw0rd",
+            "current_password": self.password,
+        }
+
+    def token_data(self, user):
+        return {
+            "uid": encode_uid(user.pk),
+            "token": default_token_generator.make_token(user),
+        }
+
+    def login_data(self):
+        return {"email": self.user.email, "password": self.password}
+
+
+def summarize(queries):
+    """Сгруппировать одинаковые запросы для читаемого отчета."""
+    return [
+        f"  [{count}x] {sql}"
+        for sql, count in Counter(queries).most_common()
+    ]
+
+
+class Command(BaseCommand):
+    """Проверка бюджетов SQL-запросов для всех маршрутов API."""
+
+    help = (
+        "Проверяет, что каждый маршрут API укладывается в заданное число "
+        "SQL-запросов и не растет линейно с размером страницы"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--verbose-sql", action="store_true",
+            help="Печатать SQL для всех проверок, а не только упавших"
+        )
+
+    def handle(self, *args, **options):
+        self.check_coverage()
+        setup_test_environment()
+
+        failures = []
+        with ExitStack() as stack:
+            stack.enter_context(override_settings(
+                MEDIA_ROOT=stack.enter_context(tempfile.TemporaryDirectory())
+            ))
+            stack.enter_context(transaction.atomic())
+            fixture = Fixture(authors=max(PAGE_SIZES) + 1)
+            for budget in QUERY_BUDGETS:
+                failures.extend(
+                    self.check_budget(fixture, *budget, options["verbose_sql"])
+                )
+            transaction.set_rollback(True)
+
+        if failures:
+            raise CommandError(
+                "Не пройдены проверки запросов:\n\n" + "\n\n".join(failures)
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f"Все {len(QUERY_BUDGETS)} проверок уложились в бюджет."
+        ))
+
+    def check_coverage(self):
+        """Убедиться, что для каждого маршрута API задан бюджет."""
+        names = {url.name for url in router.urls}
+        for pattern in urlpatterns:
+            names.update(
+                url.name
+                for url in getattr(pattern, "url_patterns", [pattern])
+            )
+        missing = names - {budget[0] for budget in QUERY_BUDGETS} - {None}
+        if missing:
+            raise CommandError(
+                "Не заданы бюджеты для маршрутов: "
+                + ", ".join(sorted(missing))
+            )
+
+    def check_budget(self, fixture, route, method, path, auth, data,
+                     expected_status, limit, constant, verbose_sql):
+        """Проверить бюджет маршрута на одном или двух размерах."""
+        sizes = PAGE_SIZES if constant else PAGE_SIZES[:1]
+        runs = {}
+        for size in sizes:
+            url = path.format(size=size, **fixture.context())
+            runs[size] = (url, self.run_request(
+                fixture, method, url, auth,
+                data(fixture, size) if data else None
+            ))
+
+        title = f"{route} {method} {path} (авторизация: {auth})"
+        failures = []
+        for size, (url, (status, queries)) in runs.items():
+            if status != expected_status:
+                failures.append(
+                    f"{title}: ответ {status} вместо {expected_status} "
+                    f"для {url}"
+                )
+            if len(queries) > limit:
+                failures.append("\n".join([
+                    f"{title}: {len(queries)} запросов при бюджете {limit} "
+                    f"для {url}",
+                    *summarize(queries),
+                ]))
+
+        if constant:
+            (small_url, (_, small)), (large_url, (_, large)) = runs.items()
+            if len(large) != len(small):
+                failures.append("\n".join([
+                    f"{title}: число запросов зависит от размера "
+                    f"({len(small)} -> {len(large)})",
+                    *difflib.unified_diff(
+                        small, large, small_url, large_url, lineterm=""
+                    ),
+                ]))
+
+        status = "FAIL" if failures else "ok"
+        counts = "/".join(str(len(run[1][1])) for run in runs.values())
+        self.stdout.write(f"{status:<4} {counts:>7} <= {limit:<3} {title}")
+        if verbose_sql and not failures:
+            for _, (_, queries) in runs.values():
+                self.stdout.write("\n".join(summarize(queries)))
+
+        return failures
+
+    def run_request(self, fixture, method, url, auth, data):
+        """Выполнить запрос в точке сохранения и вернуть SQL."""
+        client = APIClient()
+        if auth:
+            client.force_authenticate(fixture.user)
+
+        recorder = QueryRecorder()
+        with transaction.atomic(), ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(
+                    connections[alias].execute_wrapper(recorder)
+                )
+            response = getattr(client, method.lower())(
+                url, data, format="json"
+            )
+            if response.streaming:
+                b"".join(response.streaming_content)
+            transaction.set_rollback(True)
+        # Представление могло изменить пользователя в памяти (например,
+        # пароль), а в базе изменения откатились.
+        fixture.user.refresh_from_db()
+
+        return response.status_code, recorder.queries
@@ -0,0 +1,245 @@
+import re
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count, Sum
+from django.test import RequestFactory
+
+from api.filters import RECIPE_ORDERINGS, IngredientFilter, RecipeFilter
+from api.paginations import KeysetPagination
+from api.sync import get_changes_queryset
+from api.utils import (SHORT_RECIPE_FIELDS, get_facet_queryset,
+                       get_recipe_queryset, get_recommended_recipes,
+                       get_same_ingredients_recipes,
+                       get_subscriptions_queryset)
+from recipes.models import Ingredient, Recipe, RecipeIngredient, Tag
+from users.models import CustomUser
+
+
+# Признаки проблем в планах: (регулярное выражение, описание).
+POSTGRESQL_WARNINGS = (
+    (r"Seq Scan on (\w+)", "последовательное сканирование {0}"),
+    (r"Sort Method: external \w+\s+Disk: (\d+kB)",
+     "сортировка ушла на диск ({0})"),
+    (r"Rows Removed by Filter: (\d{4,})",
+     "фильтр отбросил {0} строк, возможно, не хватает индекса"),
+    (r"Batches: ([2-9]|\d{2,})", "хеш-таблица не поместилась в work_mem"),
+)
+SQLITE_WARNINGS = (
+    (r"SCAN (?:TABLE )?(?!counted\b)(\w+)\b(?! USING (?:COVERING )?INDEX)",
+     "полное сканирование {0}"),
+    (r"USE TEMP B-TREE FOR (ORDER BY|GROUP BY|DISTINCT)",
+     "временная сортировка для {0}"),
+    (r"AUTOMATIC (?:COVERING |PARTIAL )*INDEX ON (\w+\(.*?\))",
+     "не хватает индекса {0}"),
+)
+# Меняющиеся от запуска к запуску числа, скрываемые флагом --stable.
+VOLATILE = re.compile(
+    r"(actual time=[\d.]+\.\.[\d.]+|"
+    r"(?:Planning|Execution) Time: [\d.]+ ms|"
+    r"Buffers: [^\n]+|"
+    r"Memory Usage: \d+kB)"
+)
+
+
+class Command(BaseCommand):
+    """Аудит планов выполнения основных запросов API."""
+
+    help = (
+        "Выполняет EXPLAIN для запросов основных эндпоинтов и отмечает "
+        "последовательные сканирования, сортировки на диске и "
+        "недостающие индексы"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user", type=int, help="id пользователя")
+        parser.add_argument(
+            "--output", help="Файл для отчета вместо стандартного вывода"
+        )
+        parser.add_argument(
+            "--stable", action="store_true",
+            help="Скрыть время и буферы, чтобы отчеты можно было сравнивать"
+        )
+
+    def handle(self, *args, **options):
+        user = self.get_user(options["user"])
+        request = RequestFactory().get("/")
+        request.user = user
+
+        lines = [f"# EXPLAIN API ({connection.vendor})", ""]
+        warnings_total = 0
+        page_size = settings.REST_FRAMEWORK["PAGE_SIZE"]
+        for name, queryset, paginated in self.get_querysets(request):
+            if not paginated:
+                checks = [(name, *queryset.query.sql_with_params())]
+            else:
+                sql, params = queryset.order_by().query.sql_with_params()
+                checks = [
+                    (name, *queryset[:page_size].query.sql_with_params()),
+                    (
+                        f"{name} [count]",
+                        f"SELECT COUNT(*) FROM ({sql}) counted",
+                        params
+                    ),
+                ]
+            for title, check_sql, check_params in checks:
+                plan = self.explain(check_sql, check_params)
+                warnings = self.find_warnings(plan)
+                warnings_total += len(warnings)
+                if options["stable"]:
+                    plan = VOLATILE.sub("…", plan)
+                lines.extend([f"## {title}", "", "```", plan, "```", ""])
+                lines.extend(f"- ВНИМАНИЕ: {warning}" for warning in warnings)
+                lines.append("")
+
+        report = "\n".join(lines)
+        if options["output"]:
+            with open(options["output"], "w", encoding="utf-8") as file:
+                file.write(report)
+        else:
+            self.stdout.write(report)
+
+        self.stdout.write(self.style.WARNING(
+            f"Замечаний: {warnings_total}"
+        ) if warnings_total else self.style.SUCCESS("Замечаний нет."))
+
+    def get_user(self, user_id):
+        """Пользователь, от имени которого строятся запросы."""
+        if user_id:
+            return CustomUser.objects.get(pk=user_id)
+
+        user = CustomUser.objects.annotate(
+            carts=Count("shopping_user")
+        ).order_by("-carts", "id").first()
+        if user is None:
+            raise CommandError("База пуста, заполните ее командой seed.")
+        return user
+
+    def get_querysets(self, request):
+        """Запросы эндпоинтов: (название, queryset, есть ли пагинация)."""
+        user = request.user
+        page_size = settings.REST_FRAMEWORK["PAGE_SIZE"]
+        slugs = list(Tag.objects.values_list("slug", flat=True)[:2])
+        author = Recipe.objects.values_list("author_id", flat=True).first()
+        ingredient = Ingredient.objects.values_list("name", flat=True).first()
+
+        recipe_filters = {
+            "recipes": {},
+            "recipes?tags": {"tags": slugs},
+            "recipes?tags_all": {"tags_all": slugs},
+            "recipes?author": {"author": author},
+            "recipes?is_favorited": {"is_favorited": 1},
+            "recipes?is_in_shopping_cart": {"is_in_shopping_cart": 1},
+        }
+        for name, data in recipe_filters.items():
+            recipes = RecipeFilter(
+                data, queryset=get_recipe_queryset(user), request=request
+            ).qs
+            yield name, recipes, True
+
+        pagination = KeysetPagination()
+        for ordering in RECIPE_ORDERINGS:
+            recipes = pagination.get_page_queryset(RecipeFilter(
+                {"ordering": ordering, "tags": slugs},
+                queryset=get_recipe_queryset(user), request=request
+            ).qs)
+            last = recipes[page_size - 1:page_size].first()
+            if last is not None:
+                recipes = pagination.get_page_queryset(
+                    recipes, pagination.get_position(last)
+                )
+            yield f"recipes?ordering={ordering}&tags [cursor]", recipes[
+                :page_size
+            ], False
+
+        yield "recipes/facets", get_facet_queryset(
+            Recipe.objects.all()
+        ), False
+        yield "recipes/facets?is_favorited", get_facet_queryset(
+            Recipe.objects.filter(favorite_recipe__user=user)
+        ), False
+
+        recipe = Recipe.objects.values_list("pk", flat=True).first()
+        yield "recipes/similar", Recipe.objects.filter(
+            neighbor_of__recipe_id=recipe
+        ).order_by("-neighbor_of__score", "id").values(
+            *SHORT_RECIPE_FIELDS
+        )[:page_size], False
+        yield "recipes/similar_ingredients", get_same_ingredients_recipes(
+            recipe
+        )[:page_size], False
+        yield "recipes/recommended", get_recommended_recipes(user)[
+            :page_size
+        ], False
+        yield "sync", get_changes_queryset(user, 0)[
+            :settings.SYNC_PAGE_SIZE + 1
+        ], False
+
+        page = list(Recipe.objects.values_list("pk", flat=True)[:page_size])
+        yield "recipes [prefetch tags]", Tag.objects.filter(
+            recipes__in=page
+        ), False
+        yield "recipes [prefetch ingredients]", (
+            RecipeIngredient.objects.select_related("ingredient").filter(
+                recipe__in=page
+            )
+        ), False
+
+        subscriptions = get_subscriptions_queryset(
+            CustomUser.objects.filter(recipe_author__user=user), user
+        ).order_by("id")
+        yield "users/subscriptions", subscriptions, True
+
+        shopping_list = RecipeIngredient.objects.filter(
+            recipe__shopping_recipe__user=user
+        ).values(
+            "ingredient__name",
+            "ingredient__measurement_unit"
+        ).annotate(amount=Sum("amount")).order_by("ingredient__name")
+        yield "recipes/download_shopping_cart", shopping_list, False
+
+        yield "ingredients?name", IngredientFilter(
+            {"name": (ingredient or "")[:2]},
+            queryset=Ingredient.objects.all()
+        ).qs, False
+        yield "ingredients?search", IngredientFilter(
+            {"search": ingredient or ""},
+            queryset=Ingredient.objects.all()
+        ).qs, False
+
+    def explain(self, sql, params):
+        """Получить план запроса в текстовом виде."""
+        if connection.vendor == "postgresql":
+            prefix = "EXPLAIN (ANALYZE, BUFFERS, FORMAT TEXT) "
+        elif connection.vendor == "sqlite":
+            prefix = "EXPLAIN QUERY PLAN "
+        else:
+            prefix = "EXPLAIN "
+
+        with connection.cursor() as cursor:
+            cursor.execute(prefix + sql, params)
+            rows = cursor.fetchall()
+
+        if connection.vendor == "sqlite":
+            return "\n".join(str(row[-1]) for row in rows)
+        return "\n".join(str(row[0]) for row in rows)
+
+    @staticmethod
+    def find_warnings(plan):
+        """Найти в плане признаки проблем."""
+        if connection.vendor == "postgresql":
+            patterns = POSTGRESQL_WARNINGS
+        elif connection.vendor == "sqlite":
+            patterns = SQLITE_WARNINGS
+        else:
+            return []
+
+        warnings = []
+        for pattern, message in patterns:
+            for match in re.finditer(pattern, plan):
+                warning = message.format(*match.groups())
+                if warning not in warnings:
+                    warnings.append(warning)
+
+        return warnings
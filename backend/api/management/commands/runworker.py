@@ -0,0 +1,128 @@
+import os
+import signal
+import socket
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+from prometheus_client import start_http_server
+
+from api.taskqueue import (claim_tasks, enqueue_periodic, requeue_stale_tasks,
+                           run_task, update_queue_depth)
+
+# Как часто проверять зависшие задачи и обновлять метрику очереди.
+MAINTENANCE_INTERVAL = 15
+
+
+class Command(BaseCommand):
+    """Воркер фоновых задач из очереди в базе."""
+
+    help = (
+        "Выполняет фоновые задачи из таблицы очереди в нескольких потоках, "
+        "повторяет упавшие с растущей задержкой и ставит периодические "
+        "задачи из TASK_PERIODIC"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--concurrency", type=int,
+            help="Число потоков; по умолчанию TASK_WORKER_CONCURRENCY"
+        )
+        parser.add_argument(
+            "--burst", action="store_true",
+            help="Выйти, когда в очереди не останется задач со сроком"
+        )
+        parser.add_argument(
+            "--no-periodic", action="store_true",
+            help="Не ставить периодические задачи при запуске"
+        )
+        parser.add_argument(
+            "--metrics-port", type=int,
+            help="Отдавать метрики Prometheus на этом порту"
+        )
+
+    def handle(self, *args, **options):
+        if settings.TASKS_EAGER:
+            raise CommandError(
+                "С TASKS_EAGER=True задачи выполняются в запросах, "
+                "воркер не нужен."
+            )
+        concurrency = (
+            options["concurrency"] or settings.TASK_WORKER_CONCURRENCY
+        )
+        if concurrency < 1:
+            raise CommandError("Нужен хотя бы один поток.")
+        if options["metrics_port"]:
+            start_http_server(options["metrics_port"])
+
+        self.stopping = False
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(signum, self.stop)
+
+        worker = f"{socket.gethostname()}:{os.getpid()}"
+        if not options["no_periodic"]:
+            enqueue_periodic()
+        self.stdout.write(f"Воркер {worker}, потоков: {concurrency}")
+
+        self.processed = 0
+        running = {}
+        maintained_at = 0
+        with ThreadPoolExecutor(concurrency) as executor:
+            while not self.stopping:
+                if time.monotonic() - maintained_at > MAINTENANCE_INTERVAL:
+                    requeue_stale_tasks()
+                    update_queue_depth()
+                    maintained_at = time.monotonic()
+
+                free = concurrency - len(running)
+                tasks = claim_tasks(worker, free) if free else []
+                for task in tasks:
+                    running[executor.submit(run_task, task)] = task
+                if not running:
+                    if options["burst"]:
+                        break
+                    close_old_connections()
+                    time.sleep(settings.TASK_POLL_INTERVAL)
+                    continue
+
+                # Пока есть свободные потоки и задачи, очередь опрашивается
+                # сразу; иначе ждем освобождения потока не дольше
+                # интервала опроса, чтобы брать задачи, чей срок подошел.
+                done, _ = wait(
+                    running,
+                    timeout=(
+                        0 if tasks and len(running) < concurrency
+                        else settings.TASK_POLL_INTERVAL
+                    ),
+                    return_when=FIRST_COMPLETED
+                )
+                for future in done:
+                    self.report(running.pop(future), future)
+
+            if running:
+                self.stdout.write(
+                    f"Ожидание {len(running)} выполняемых задач..."
+                )
+                for future in wait(running).done:
+                    self.report(running[future], future)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Воркер остановлен, обработано задач: {self.processed}"
+        ))
+
+    def report(self, task, future):
+        """Вывести результат задачи."""
+        self.processed += 1
+        try:
+            result = future.result()
+        except Exception as error:
+            # Результат не записан: задачу вернет в очередь проверка
+            # зависших задач.
+            result = f"ошибка записи результата: {error!r}"
+        self.stdout.write(f"{task.name} #{task.pk}: {result}")
+
+    def stop(self, signum, frame):
+        """Перестать брать задачи и дождаться выполняемых."""
+        self.stopping = True
@@ -0,0 +1,223 @@
+import asyncio
+import os
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import markcoroutinefunction
+from django.http import HttpResponse
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY,
+                               CollectorRegistry, Counter, Gauge, Histogram,
+                               generate_latest, multiprocess)
+
+# Метрики нескольких процессов пишутся в файлы при создании, поэтому
+# каталог нужен до объявления метрик — в том числе в командах manage.py.
+if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+    os.makedirs(os.environ["PROMETHEUS_MULTIPROC_DIR"], exist_ok=True)
+
+
+VIEW_LATENCY = Histogram(
+    "foodgram_view_latency_seconds",
+    "Время обработки запроса представлением.",
+    ["view", "method", "status"],
+    buckets=(
+        0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+    ),
+)
+VIEW_DB_QUERIES = Histogram(
+    "foodgram_view_db_queries",
+    "Количество SQL-запросов на один запрос к представлению.",
+    ["view"],
+    buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100, 250, 500),
+)
+REQUESTS_IN_PROGRESS = Gauge(
+    "foodgram_requests_in_progress",
+    "Запросы, обрабатываемые в данный момент.",
+    multiprocess_mode="livesum",
+)
+CACHE_REQUESTS = Counter(
+    "foodgram_cache_requests_total",
+    "Обращения к кэшу с разбивкой по результату.",
+    ["cache", "result"],
+)
+IMAGE_QUEUE_DEPTH = Gauge(
+    "foodgram_image_queue_depth",
+    "Изображения, ожидающие обработки.",
+    multiprocess_mode="livesum",
+)
+DB_READS = Counter(
+    "foodgram_db_reads_total",
+    "Чтения, направленные роутером в базу данных.",
+    ["database"],
+)
+REPLICA_FAILURES = Counter(
+    "foodgram_db_replica_failures_total",
+    "Реплики, исключенные из чтения из-за недоступности или отставания.",
+    ["database"],
+)
+DB_CONNECTIONS_OPENED = Counter(
+    "foodgram_db_connections_opened_total",
+    "Открытые соединения с базой данных.",
+    ["database"],
+)
+DB_CONNECTIONS_REUSED = Counter(
+    "foodgram_db_connections_reused_total",
+    "Запросы, получившие уже открытое постоянное соединение.",
+    ["database"],
+)
+DB_CONNECTIONS_BROKEN = Counter(
+    "foodgram_db_connections_broken_total",
+    "Постоянные соединения, не прошедшие проверку перед запросом.",
+    ["database"],
+)
+TASKS_PROCESSED = Counter(
+    "foodgram_tasks_total",
+    "Выполненные фоновые задачи по результату: done, retry или failed.",
+    ["task", "result"],
+)
+TASK_DURATION = Histogram(
+    "foodgram_task_duration_seconds",
+    "Время выполнения фоновой задачи.",
+    ["task"],
+    buckets=(0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0),
+)
+TASK_DELAY = Histogram(
+    "foodgram_task_delay_seconds",
+    "Задержка запуска фоновой задачи после наступления ее срока.",
+    ["task"],
+    buckets=(0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0),
+)
+TASK_QUEUE_DEPTH = Gauge(
+    "foodgram_task_queue_depth",
+    "Фоновые задачи, срок которых наступил, в очереди.",
+    ["task"],
+    multiprocess_mode="livemax",
+)
+GUNICORN_WORKERS = Gauge(
+    "foodgram_gunicorn_workers",
+    "Количество живых воркеров gunicorn.",
+    multiprocess_mode="livesum",
+)
+GUNICORN_WORKER_REQUESTS = Counter(
+    "foodgram_gunicorn_worker_requests_total",
+    "Запросы, обработанные воркерами gunicorn.",
+)
+
+
+def observe_cache(cache, hit):
+    """Учесть попадание или промах кэша."""
+    CACHE_REQUESTS.labels(cache, "hit" if hit else "miss").inc()
+
+
+def get_view_name(request, view_func):
+    """Получить имя представления вида `RecipeViewSet.list`."""
+    view_class = getattr(view_func, "cls", None)
+    if view_class is None:
+        return f"{view_func.__module__}.{view_func.__name__}"
+
+    actions = getattr(view_func, "actions", None) or {}
+    action = actions.get(request.method.lower(), request.method.lower())
+
+    return f"{view_class.__name__}.{action}"
+
+
+class QueryCounter:
+    """Обертка выполнения SQL, считающая запросы."""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+# Счетчик текущего запроса. Контекст копируется в потоки sync_to_async,
+# поэтому в него попадают и запросы async-представлений из run_query, и
+# синхронные представления DRF под ASGI, хотя соединения у потоков свои.
+current_query_counter = ContextVar("current_query_counter", default=None)
+
+
+def count_current_query(execute, sql, params, many, context):
+    """Обертка выполнения SQL, учитывающая запрос в счетчике запроса."""
+    counter = current_query_counter.get()
+    if counter is not None:
+        counter.count += 1
+    return execute(sql, params, many, context)
+
+
+def install_query_counter(connection):
+    """Добавить соединению постоянную обертку счетчика запросов.
+
+    Обертка ставится первой: execute_wrapper() снимает последнюю.
+    """
+    if count_current_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, count_current_query)
+
+
+class MetricsMiddleware:
+    """Сбор задержек и количества SQL-запросов по представлениям."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+
+        counter = QueryCounter()
+        start = time.perf_counter()
+        token = current_query_counter.set(counter)
+
+        try:
+            with REQUESTS_IN_PROGRESS.track_inprogress():
+                response = self.get_response(request)
+        finally:
+            current_query_counter.reset(token)
+
+        self.observe(request, response, counter, start)
+        return response
+
+    async def __acall__(self, request):
+        counter = QueryCounter()
+        start = time.perf_counter()
+        token = current_query_counter.set(counter)
+
+        try:
+            with REQUESTS_IN_PROGRESS.track_inprogress():
+                response = await self.get_response(request)
+        finally:
+            current_query_counter.reset(token)
+
+        self.observe(request, response, counter, start)
+        return response
+
+    @staticmethod
+    def observe(request, response, counter, start):
+        """Записать метрики обработанного запроса."""
+        view = getattr(request, "metrics_view_name", "unresolved")
+        VIEW_LATENCY.labels(
+            view, request.method, response.status_code
+        ).observe(time.perf_counter() - start)
+        VIEW_DB_QUERIES.labels(view).observe(counter.count)
+        GUNICORN_WORKER_REQUESTS.inc()
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.metrics_view_name = get_view_name(request, view_func)
+
+
+def metrics_view(request):
+    """Отдать метрики в формате Prometheus."""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+
+    return HttpResponse(
+        generate_latest(registry),
+        content_type=CONTENT_TYPE_LATEST
+    )
@@ -0,0 +1,46 @@
+# Generated by Django 3.2.16 on 2026-10-19 09:27
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Task',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, verbose_name='Задача')),
+                ('kwargs', models.JSONField(blank=True, default=dict, verbose_name='Аргументы')),
+                ('key', models.CharField(blank=True, help_text='Задача с ключом не ставится, пока такая же ожидает.', max_length=200, null=True, verbose_name='Ключ')),
+                ('status', models.CharField(choices=[('queued', 'в очереди'), ('running', 'выполняется'), ('done', 'выполнена'), ('failed', 'не выполнена')], default='queued', max_length=16, verbose_name='Состояние')),
+                ('run_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Выполнить не раньше')),
+                ('attempts', models.PositiveSmallIntegerField(default=0, verbose_name='Попыток')),
+                ('max_attempts', models.PositiveSmallIntegerField(verbose_name='Попыток не больше')),
+                ('worker', models.CharField(blank=True, max_length=100, verbose_name='Воркер')),
+                ('locked_at', models.DateTimeField(blank=True, null=True, verbose_name='Взята воркером')),
+                ('last_error', models.TextField(blank=True, verbose_name='Последняя ошибка')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Поставлена')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='Завершена')),
+            ],
+            options={
+                'verbose_name': 'фоновая задача',
+                'verbose_name_plural': 'Фоновые задачи',
+                'ordering': ('-id',),
+            },
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['status', 'run_at'], name='task_status_run_at_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='task',
+            constraint=models.UniqueConstraint(condition=models.Q(('status__in', ('queued', 'running'))), fields=('key',), name='task_pending_key_unique'),
+        ),
+    ]
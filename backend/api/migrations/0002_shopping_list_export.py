@@ -0,0 +1,38 @@
+# Generated by Django 3.2.16 on 2026-10-19 09:30
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('api', '0001_task'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShoppingListExport',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, primary_key=True, serialize=False)),
+                ('cart_hash', models.CharField(help_text='SHA-256 ингредиентов корзины с суммами.', max_length=64, verbose_name='Хэш списка')),
+                ('status', models.CharField(choices=[('pending', 'собирается'), ('done', 'готов'), ('failed', 'ошибка')], default='pending', max_length=16, verbose_name='Состояние')),
+                ('file', models.FileField(blank=True, upload_to='shopping_lists/', verbose_name='Файл')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Создан')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='Собран')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shopping_list_exports', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'выгрузка списка покупок',
+                'verbose_name_plural': 'Выгрузки списков покупок',
+                'ordering': ('-created_at',),
+            },
+        ),
+        migrations.AddIndex(
+            model_name='shoppinglistexport',
+            index=models.Index(fields=['user', 'cart_hash'], name='export_user_cart_hash_idx'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 3.2.16 on 2026-10-19 09:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0002_shopping_list_export'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='task',
+            name='task_pending_key_unique',
+        ),
+        migrations.AlterField(
+            model_name='task',
+            name='key',
+            field=models.CharField(blank=True, help_text='Задача с ключом не ставится, пока такая же ожидает, и не берется, пока такая же выполняется.', max_length=200, null=True, verbose_name='Ключ'),
+        ),
+        migrations.AddConstraint(
+            model_name='task',
+            constraint=models.UniqueConstraint(condition=models.Q(('status', 'queued')), fields=('key',), name='task_queued_key_unique'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.16 on 2026-10-19 09:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_task_queued_key_unique'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='shoppinglistexport',
+            name='cart_hash',
+            field=models.CharField(help_text='SHA-256 рецептов корзины и времени их изменения.', max_length=64, verbose_name='Хэш списка'),
+        ),
+    ]
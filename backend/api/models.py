@@ -0,0 +1,112 @@
+import uuid
+
+from django.db import models
+from django.db.models import Q
+from django.utils import timezone
+
+from users.models import CustomUser
+
+
+class Task(models.Model):
+    """Фоновая задача в очереди, которую выполняет runworker."""
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    STATUSES = (
+        (QUEUED, "в очереди"),
+        (RUNNING, "выполняется"),
+        (DONE, "выполнена"),
+        (FAILED, "не выполнена"),
+    )
+
+    name = models.CharField("Задача", max_length=100)
+    kwargs = models.JSONField("Аргументы", default=dict, blank=True)
+    key = models.CharField(
+        "Ключ",
+        max_length=200,
+        null=True,
+        blank=True,
+        help_text=(
+            "Задача с ключом не ставится, пока такая же ожидает, "
+            "и не берется, пока такая же выполняется."
+        )
+    )
+    status = models.CharField(
+        "Состояние", max_length=16, choices=STATUSES, default=QUEUED
+    )
+    run_at = models.DateTimeField("Выполнить не раньше", default=timezone.now)
+    attempts = models.PositiveSmallIntegerField("Попыток", default=0)
+    max_attempts = models.PositiveSmallIntegerField("Попыток не больше")
+    worker = models.CharField("Воркер", max_length=100, blank=True)
+    locked_at = models.DateTimeField("Взята воркером", null=True, blank=True)
+    last_error = models.TextField("Последняя ошибка", blank=True)
+    created_at = models.DateTimeField("Поставлена", auto_now_add=True)
+    finished_at = models.DateTimeField("Завершена", null=True, blank=True)
+
+    class Meta:
+        ordering = ("-id",)
+        verbose_name = "фоновая задача"
+        verbose_name_plural = "Фоновые задачи"
+        indexes = [
+            models.Index(
+                fields=("status", "run_at"), name="task_status_run_at_idx"
+            ),
+        ]
+        constraints = [
+            # Выполняемая задача не мешает поставить такую же: она могла
+            # прочитать данные до изменения, ради которого ставится новая.
+            models.UniqueConstraint(
+                fields=("key",),
+                condition=Q(status="queued"),
+                name="task_queued_key_unique"
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.name} ({self.get_status_display()})"
+
+
+class ShoppingListExport(models.Model):
+    """Файл списка покупок, который собирает фоновая задача."""
+    PENDING = "pending"
+    DONE = "done"
+    FAILED = "failed"
+    STATUSES = (
+        (PENDING, "собирается"),
+        (DONE, "готов"),
+        (FAILED, "ошибка"),
+    )
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4)
+    user = models.ForeignKey(
+        CustomUser,
+        on_delete=models.CASCADE,
+        related_name="shopping_list_exports",
+        verbose_name="Пользователь"
+    )
+    cart_hash = models.CharField(
+        "Хэш списка",
+        max_length=64,
+        help_text="SHA-256 рецептов корзины и времени их изменения."
+    )
+    status = models.CharField(
+        "Состояние", max_length=16, choices=STATUSES, default=PENDING
+    )
+    file = models.FileField("Файл", upload_to="shopping_lists/", blank=True)
+    created_at = models.DateTimeField("Создан", auto_now_add=True)
+    finished_at = models.DateTimeField("Собран", null=True, blank=True)
+
+    class Meta:
+        ordering = ("-created_at",)
+        verbose_name = "выгрузка списка покупок"
+        verbose_name_plural = "Выгрузки списков покупок"
+        indexes = [
+            models.Index(
+                fields=("user", "cart_hash"),
+                name="export_user_cart_hash_idx"
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.user} {self.get_status_display()}"
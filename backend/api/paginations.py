@@ -1,6 +1,210 @@
-from rest_framework.pagination import PageNumberPagination
+import json
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import F, Q, QuerySet
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import (Cursor, CursorPagination,
+                                       PageNumberPagination)
+from rest_framework.response import Response
+
+from api.catalog import get_catalog_cache, get_catalog_key
+from api.filters import RECIPE_ORDERINGS
+from api.metrics import observe_cache
+
+
+def estimate_count(queryset):
+    """Оценка числа строк планировщиком PostgreSQL."""
+    sql, params = queryset.query.sql_with_params()
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
+def count_queryset(queryset):
+    """Число объектов и признак того, что оно приблизительное.
+
+    Точный COUNT(*) ограничен PAGINATION_EXACT_COUNT_LIMIT строками,
+    сверх порога на PostgreSQL берется оценка планировщика.
+    """
+    limit = settings.PAGINATION_EXACT_COUNT_LIMIT
+    if not limit or connections[queryset.db].vendor != "postgresql":
+        return queryset.count(), False
+
+    queryset = queryset.order_by()
+    count = queryset[:limit + 1].count()
+    if count <= limit:
+        return count, False
+    return max(estimate_count(queryset), count), True
+
+
+class CountingPaginator(Paginator):
+    """Пагинатор с кэшированным или приблизительным числом объектов."""
+    approximate = False
+
+    @cached_property
+    def count(self):
+        """Число объектов в списке."""
+        if not isinstance(self.object_list, QuerySet):
+            return super().count
+
+        timeout = settings.PAGINATION_COUNT_CACHE_TIMEOUT
+        key = (
+            get_catalog_key("count", self.object_list) if timeout else None
+        )
+        if key is None:
+            count, self.approximate = count_queryset(self.object_list)
+            return count
+
+        cache = get_catalog_cache()
+        cached = cache.get(key)
+        observe_cache("count", cached is not None)
+        if cached is None:
+            cached = count_queryset(self.object_list)
+            cache.set(key, cached, timeout)
+        count, self.approximate = cached
+        return count
 
 
 class CustomPagination(PageNumberPagination):
     """Кастомный пагинатор."""
     page_size_query_param = "limit"
+    django_paginator_class = CountingPaginator
+
+    def get_paginated_response(self, data):
+        """Ответ со страницей и признаком приблизительного числа."""
+        paginator = self.page.paginator
+        return Response(OrderedDict([
+            ("count", paginator.count),
+            ("count_approximate", paginator.approximate),
+            ("next", self.get_next_link()),
+            ("previous", self.get_previous_link()),
+            ("results", data),
+        ]))
+
+
+class KeysetPagination(CursorPagination):
+    """Курсорная пагинация по всем полям сортировки queryset.
+
+    Курсор хранит значения полей сортировки крайней строки страницы,
+    и следующая страница выбирается условием по ним без OFFSET и COUNT.
+    Последнее поле сортировки должно быть уникальным.
+    """
+    page_size_query_param = "limit"
+
+    def paginate_queryset(self, queryset, request, view=None):
+        """Строки страницы после или перед позицией курсора."""
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        cursor = self.decode_cursor(request)
+        reverse = cursor is not None and cursor.reverse
+        queryset = self.get_page_queryset(
+            queryset,
+            None if cursor is None else self.get_position_values(cursor),
+            reverse
+        )
+
+        rows = list(queryset[:self.page_size + 1])
+        has_following = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if reverse:
+            rows.reverse()
+            self.has_next, self.has_previous = bool(rows), has_following
+        else:
+            self.has_next = has_following
+            self.has_previous = cursor is not None and bool(rows)
+        self.positions = [
+            self.get_position(row) for row in (rows[:1] + rows[-1:])
+        ]
+        return rows
+
+    def get_page_queryset(self, queryset, position=None, reverse=False):
+        """Строки после позиции (перед ней при reverse) в порядке выдачи."""
+        ordering = tuple(queryset.query.order_by)
+        fields = [name.lstrip("-") for name in ordering]
+        descending = [name.startswith("-") != reverse for name in ordering]
+        # Значения полей сортировки выбираются под своими именами,
+        # чтобы не зависеть от колонок в values().
+        self.keys = [f"cursor_{index}" for index in range(len(fields))]
+        queryset = queryset.annotate(**{
+            key: F(field) for key, field in zip(self.keys, fields)
+        }).order_by(*(
+            f"-{key}" if desc else key
+            for key, desc in zip(self.keys, descending)
+        ))
+        if position is None:
+            return queryset
+        if len(position) != len(self.keys):
+            raise NotFound(self.invalid_cursor_message)
+        try:
+            return queryset.filter(
+                self.get_position_filter(self.keys, descending, position)
+            )
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def get_position(self, row):
+        """Значения полей сортировки строки values() или объекта."""
+        if isinstance(row, dict):
+            return [row[key] for key in self.keys]
+        return [getattr(row, key) for key in self.keys]
+
+    def get_position_values(self, cursor):
+        """Значения полей сортировки из курсора."""
+        try:
+            values = json.loads(cursor.position)
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(values, list):
+            raise NotFound(self.invalid_cursor_message)
+        return values
+
+    @staticmethod
+    def get_position_filter(keys, descending, values):
+        """Условие «строго после позиции» для лексикографического порядка."""
+        lookups = ["lt" if desc else "gt" for desc in descending]
+        after = Q()
+        for index in range(len(keys)):
+            after |= Q(
+                **dict(zip(keys[:index], values[:index])),
+                **{f"{keys[index]}__{lookups[index]}": values[index]}
+            )
+        # Условие по первому полю отдельно, чтобы база начала
+        # просмотр индекса сразу с позиции курсора.
+        bound = "lte" if descending[0] else "gte"
+        return Q(**{f"{keys[0]}__{bound}": values[0]}) & after
+
+    def get_link(self, position, reverse):
+        """Ссылка на страницу с курсором в позиции."""
+        return self.encode_cursor(Cursor(
+            offset=0, reverse=reverse, position=json.dumps(position)
+        ))
+
+    def get_next_link(self):
+        """Ссылка на страницу после последней строки."""
+        if not self.has_next:
+            return None
+        return self.get_link(self.positions[-1], False)
+
+    def get_previous_link(self):
+        """Ссылка на страницу перед первой строкой."""
+        if not self.has_previous:
+            return None
+        return self.get_link(self.positions[0], True)
+
+
+def get_recipe_pagination_class(request):
+    """Пагинация списка рецептов: курсорная для сортировок по оценкам."""
+    if request.query_params.get("ordering") in RECIPE_ORDERINGS:
+        return KeysetPagination
+    return CustomPagination
@@ -0,0 +1,231 @@
+import heapq
+import threading
+import time
+from bisect import bisect_left, insort
+from itertools import islice
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models.signals import post_delete, post_save
+
+from api.ingredient_search import normalize
+from api.metrics import observe_cache
+from recipes.models import Recipe
+
+_index = None
+# Изменения рецептов за время перестройки индекса в фоне: применяются
+# к новому индексу перед заменой, чтобы не потеряться.
+_pending = None
+_changes_lock = threading.Lock()
+_rebuild_lock = threading.Lock()
+
+
+def get_tokens(recipe_id, name):
+    """Хвосты названия с начала каждого слова: (хвост, не первое слово, id)."""
+    words = normalize(name).split()
+    return [
+        (" ".join(words[start:]), start > 0, recipe_id)
+        for start in range(len(words))
+    ]
+
+
+class RecipeNameIndex:
+    """Отсортированные хвосты названий рецептов в памяти процесса.
+
+    Поиск по началу названия или слова — бинарный поиск по списку,
+    добавление и удаление рецепта — вставки и удаления в нем же.
+    """
+
+    def __init__(self, rows):
+        self.recipes = {}
+        self.tokens = []
+        self.lock = threading.Lock()
+        for recipe_id, name, popularity in rows:
+            self.recipes[recipe_id] = (name, popularity)
+            self.tokens.extend(get_tokens(recipe_id, name))
+        self.tokens.sort()
+        self.built_at = time.monotonic()
+
+    def __len__(self):
+        return len(self.recipes)
+
+    def _remove(self, recipe_id):
+        name, popularity = self.recipes.pop(recipe_id, (None, 0))
+        if name is None:
+            return 0
+        for token in get_tokens(recipe_id, name):
+            position = bisect_left(self.tokens, token)
+            if (
+                position < len(self.tokens)
+                and self.tokens[position] == token
+            ):
+                del self.tokens[position]
+        return popularity
+
+    def add(self, recipe_id, name):
+        """Добавить рецепт или обновить его название.
+
+        Популярность меняется только пересчетом updatetrending, поэтому
+        у существующего рецепта она сохраняется до перестройки индекса.
+        """
+        with self.lock:
+            popularity = self._remove(recipe_id)
+            self.recipes[recipe_id] = (name, popularity)
+            for token in get_tokens(recipe_id, name):
+                insort(self.tokens, token)
+
+    def remove(self, recipe_id):
+        """Убрать рецепт из индекса."""
+        with self.lock:
+            self._remove(recipe_id)
+
+    def search(self, query, limit):
+        """Рецепты по началу названия или слова с учетом популярности.
+
+        Вес рецепта — популярность плюс один, для совпадения с начала
+        не первого слова умноженная на RECIPE_SUGGEST_WORD_WEIGHT.
+        Возвращает пары (id, название).
+        """
+        query = normalize(query)
+        if not query:
+            return []
+
+        weights = {}
+        # Под блокировкой: add и remove из потоков того же процесса
+        # сдвигают tokens и меняют recipes.
+        with self.lock:
+            start = bisect_left(self.tokens, (query,))
+            for tail, inner, recipe_id in islice(self.tokens, start, None):
+                if not tail.startswith(query):
+                    break
+                weight = settings.RECIPE_SUGGEST_WORD_WEIGHT if inner else 1
+                weights[recipe_id] = max(weight, weights.get(recipe_id, 0))
+
+            recipes = self.recipes
+            best = heapq.nsmallest(
+                limit,
+                (
+                    (-(recipes[recipe_id][1] + 1) * weight,
+                     recipes[recipe_id][0], recipe_id)
+                    for recipe_id, weight in weights.items()
+                )
+            )
+        return [(recipe_id, name) for _, name, recipe_id in best]
+
+
+def build_recipe_name_index():
+    """Построить индекс заново по текущим рецептам."""
+    global _index
+    _index = RecipeNameIndex(
+        Recipe.objects.order_by().values_list("id", "name", "popularity")
+    )
+    return _index
+
+
+def rebuild_recipe_name_index():
+    """Перестроить индекс, применив изменения за время перестройки."""
+    global _index, _pending
+    with _changes_lock:
+        _pending = []
+    try:
+        index = RecipeNameIndex(
+            Recipe.objects.order_by().values_list("id", "name", "popularity")
+        )
+        with _changes_lock:
+            for change in _pending:
+                change(index)
+            _index = index
+    finally:
+        with _changes_lock:
+            _pending = None
+
+
+def rebuild_in_background():
+    """Перестроить индекс в потоке, если он еще не перестраивается."""
+    if not _rebuild_lock.acquire(blocking=False):
+        return
+
+    def rebuild():
+        try:
+            rebuild_recipe_name_index()
+        finally:
+            connections.close_all()
+            _rebuild_lock.release()
+
+    threading.Thread(
+        target=rebuild, name="recipe-name-index", daemon=True
+    ).start()
+
+
+def get_recipe_name_index():
+    """Индекс процесса; старше RECIPE_SUGGEST_INDEX_TIMEOUT — перестройка.
+
+    Сигналы обновляют только индекс своего процесса, поэтому записи
+    других воркеров и новая популярность видны после перестройки.
+    Устаревший индекс перестраивается в фоновом потоке, а запросы до ее
+    окончания получают прежний; синхронно индекс строится только при
+    первом запросе процесса без прогрева.
+    """
+    index = _index
+    fresh = index is not None and (
+        time.monotonic() - index.built_at
+        < settings.RECIPE_SUGGEST_INDEX_TIMEOUT
+    )
+    observe_cache("recipe_name_index", fresh)
+    if index is None:
+        return build_recipe_name_index()
+    if not fresh:
+        rebuild_in_background()
+    return index
+
+
+def suggest_recipes(query, limit):
+    """Подсказки названий рецептов без запросов к базе."""
+    return [
+        {"id": recipe_id, "name": name}
+        for recipe_id, name in get_recipe_name_index().search(query, limit)
+    ]
+
+
+def update_recipe_name(sender, instance, created, update_fields=None,
+                       **kwargs):
+    """Добавить сохраненный рецепт в индекс после фиксации транзакции."""
+    if update_fields is not None and "name" not in update_fields:
+        return
+    recipe_id, name = instance.pk, instance.name
+    transaction.on_commit(
+        lambda: apply_change(lambda index: index.add(recipe_id, name))
+    )
+
+
+def remove_recipe_name(sender, instance, **kwargs):
+    """Убрать удаленный рецепт из индекса после фиксации транзакции."""
+    recipe_id = instance.pk
+    transaction.on_commit(
+        lambda: apply_change(lambda index: index.remove(recipe_id))
+    )
+
+
+def apply_change(change):
+    """Применить изменение к индексу и запомнить для перестраиваемого."""
+    with _changes_lock:
+        if _index is not None:
+            change(_index)
+        if _pending is not None:
+            _pending.append(change)
+
+
+def connect_recipe_name_index():
+    """Подписать индекс на сохранение и удаление рецептов.
+
+    У рецепта есть каскадно удаляемые связи, так что быстрого удаления
+    у него нет и обработчик post_delete его не замедляет.
+    """
+    post_save.connect(
+        update_recipe_name, sender=Recipe,
+        dispatch_uid="update_recipe_name"
+    )
+    post_delete.connect(
+        remove_recipe_name, sender=Recipe,
+        dispatch_uid="remove_recipe_name"
+    )
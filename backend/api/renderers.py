@@ -0,0 +1,54 @@
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class FastJSONRenderer(JSONRenderer):
+    """JSON-рендерер на orjson с запасным вариантом из стандартной библиотеки.
+
+    Выдает те же байты, что и JSONRenderer с настройками по умолчанию.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        """Преобразовать данные ответа в JSON."""
+        if orjson is None or self.get_indent(
+            accepted_media_type or "", renderer_context or {}
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        if data is None:
+            return b""
+
+        content = orjson.dumps(
+            data,
+            default=self.encoder_class().default,
+            # Даты форматирует JSONEncoder из DRF, как и раньше.
+            option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+        )
+        # JSONRenderer экранирует разделители строк для встраивания в JS.
+        return content.replace(
+            "\u2028".encode(), b"\\u2028"
+        ).replace("\u2029".encode(), b"\\u2029")
+
+
+class FastJSONParser(JSONParser):
+    """JSON-парсер на orjson с запасным вариантом из стандартной библиотеки."""
+    renderer_class = FastJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        """Разобрать тело запроса."""
+        parser_context = parser_context or {}
+        encoding = parser_context.get("encoding", settings.DEFAULT_CHARSET)
+        if orjson is None or encoding.lower().replace("-", "") != "utf8":
+            return super().parse(stream, media_type, parser_context)
+
+        try:
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError(f"JSON parse error - {exc}")
@@ -0,0 +1,215 @@
+import asyncio
+import hashlib
+import logging
+import random
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import async_to_sync, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DatabaseError, OperationalError, connections
+
+from api.metrics import DB_READS, REPLICA_FAILURES, get_view_name
+
+logger = logging.getLogger(__name__)
+
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+# Чтения, которые допустимо отдавать с небольшим отставанием реплики.
+REPLICA_VIEWS = {
+    "RecipeViewSet.list",
+    "RecipeViewSet.retrieve",
+    "RecipeViewSet.facets",
+    "RecipeViewSet.similar",
+    "RecipeViewSet.similar_ingredients",
+    "RecipeViewSet.recommended",
+    "RecipeViewSet.suggest",
+    "TagViewSet.list",
+    "TagViewSet.retrieve",
+    "IngredientViewSet.list",
+    "IngredientViewSet.retrieve",
+    "CustomUserViewSet.list",
+    "CustomUserViewSet.retrieve",
+    "api.async_views.recipe_list",
+    "api.async_views.tag_list",
+    "api.async_views.ingredient_list",
+}
+# Модели, которые всегда читаются с основной базы: токен, выданный
+# при входе, может еще не дойти до реплики.
+PRIMARY_MODELS = {"authtoken.token"}
+REPLICA_LAG_SQL = (
+    "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() "
+    "THEN 0 ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) "
+    "END"
+)
+
+# Реплика, выбранная для всех чтений текущего запроса.
+replica_alias = ContextVar("replica_alias", default=None)
+# Время, до которого реплика считается недоступной или проверенной.
+down_until = {}
+checked_until = {}
+
+
+class ReplicaLagError(Exception):
+    """Реплика отстает от основной базы сильнее допустимого."""
+
+
+def check_replica(alias):
+    """Доступна ли реплика; результат проверки кэшируется на время."""
+    now = time.monotonic()
+    if down_until.get(alias, 0) > now:
+        return False
+    if checked_until.get(alias, 0) > now:
+        return True
+
+    connection = connections[alias]
+    try:
+        connection.ensure_connection()
+        if connection.vendor == "postgresql":
+            with connection.cursor() as cursor:
+                cursor.execute(REPLICA_LAG_SQL)
+                lag = cursor.fetchone()[0]
+            if lag is not None and lag > settings.REPLICA_MAX_LAG:
+                raise ReplicaLagError(f"отставание {lag:.1f} с")
+    except (DatabaseError, ReplicaLagError) as error:
+        mark_replica_down(alias, error)
+        return False
+
+    checked_until[alias] = now + settings.REPLICA_CHECK_INTERVAL
+    return True
+
+
+def mark_replica_down(alias, error):
+    """Исключить реплику из чтения на REPLICA_RETRY_SECONDS."""
+    logger.warning("Реплика %s исключена из чтения: %s", alias, error)
+    REPLICA_FAILURES.labels(alias).inc()
+    down_until[alias] = time.monotonic() + settings.REPLICA_RETRY_SECONDS
+    checked_until.pop(alias, None)
+    connections[alias].close()
+
+
+def choose_replica():
+    """Случайная доступная реплика или None, если доступных нет."""
+    replicas = [
+        alias for alias in settings.REPLICA_DATABASES
+        if check_replica(alias)
+    ]
+    return random.choice(replicas) if replicas else None
+
+
+def get_sticky_key(request):
+    """Ключ кэша, по которому запросы клиента привязываются к основной базе."""
+    authorization = request.META.get("HTTP_AUTHORIZATION")
+    if not authorization:
+        return None
+
+    digest = hashlib.blake2b(
+        authorization.encode(), digest_size=16
+    ).hexdigest()
+    return f"replica:sticky:{digest}"
+
+
+class ReplicaRouter:
+    """Роутер: записи в основную базу, безопасные чтения API в реплики."""
+
+    def db_for_read(self, model, **hints):
+        alias = replica_alias.get()
+        if (
+            alias is None
+            or model._meta.label_lower in PRIMARY_MODELS
+            or connections["default"].in_atomic_block
+        ):
+            alias = "default"
+
+        DB_READS.labels(alias).inc()
+        return alias
+
+    def db_for_write(self, model, **hints):
+        return "default"
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == "default"
+
+
+class ReplicaMiddleware:
+    """Включает чтение из реплик для безопасных запросов к REPLICA_VIEWS.
+
+    Все чтения запроса идут в одну реплику, чтобы ответ собирался из
+    одного снимка данных. Если реплика отказала посреди запроса, он
+    повторяется на основной базе. После запроса на запись клиент на
+    REPLICA_STICKY_SECONDS привязывается к основной базе, чтобы сразу
+    видеть свои изменения; привязка хранится в общем кэше (см.
+    api.checks).
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+
+        token = replica_alias.set(None)
+        try:
+            response = self.get_response(request)
+        finally:
+            replica_alias.reset(token)
+
+        self.stick_to_primary(request)
+        return response
+
+    async def __acall__(self, request):
+        token = replica_alias.set(None)
+        try:
+            response = await self.get_response(request)
+        finally:
+            replica_alias.reset(token)
+
+        self.stick_to_primary(request)
+        return response
+
+    @staticmethod
+    def stick_to_primary(request):
+        """Привязать клиента к основной базе после запроса на запись."""
+        sticky_key = get_sticky_key(request)
+        if request.method not in SAFE_METHODS and sticky_key:
+            cache.set(sticky_key, True, settings.REPLICA_STICKY_SECONDS)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if (
+            not settings.REPLICA_DATABASES
+            or request.method not in SAFE_METHODS
+            or get_view_name(request, view_func) not in REPLICA_VIEWS
+        ):
+            return
+
+        sticky_key = get_sticky_key(request)
+        if sticky_key is not None and cache.get(sticky_key):
+            return
+
+        alias = choose_replica()
+        if alias is not None:
+            replica_alias.set(alias)
+            request.replica_view = (view_func, view_args, view_kwargs)
+
+    def process_exception(self, request, exception):
+        """Повторить чтение на основной базе, если реплика отказала."""
+        alias = replica_alias.get()
+        if alias is None or not isinstance(exception, OperationalError):
+            return None
+
+        mark_replica_down(alias, exception)
+        replica_alias.set(None)
+        view_func, view_args, view_kwargs = request.replica_view
+        if asyncio.iscoroutinefunction(view_func):
+            return async_to_sync(view_func)(
+                request, *view_args, **view_kwargs
+            )
+        return view_func(request, *view_args, **view_kwargs)
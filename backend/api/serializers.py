@@ -1,9 +1,15 @@
 import base64
 
 from django.core.files.base import ContentFile
+from django.urls import reverse
 from rest_framework import serializers
 
-from recipes.models import Favorite, Ingredient, Recipe, RecipeIngredient, Tag
+from api.metrics import IMAGE_QUEUE_DEPTH
+from api.models import ShoppingListExport
+from api.utils import get_recipe_queryset
+from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
+                            Tag, get_tags_mask)
+from recipes.tasks import enqueue_minhash_update
 from users.models import CustomUser
 
 
@@ -17,12 +23,15 @@ class Base64ImageField(serializers.ImageField):
     """Поле для декодирования изображения."""
     def to_internal_value(self, data):
         """Преобразовать изображение."""
-        if isinstance(data, str) and data.startswith("data:image"):
-            format, imgstr = data.split(";base64,")
-            ext = format.split("/")[-1]
-            data = ContentFile(base64.b64decode(imgstr), name="image." + ext)
+        with IMAGE_QUEUE_DEPTH.track_inprogress():
+            if isinstance(data, str) and data.startswith("data:image"):
+                format, imgstr = data.split(";base64,")
+                ext = format.split("/")[-1]
+                data = ContentFile(
+                    base64.b64decode(imgstr), name="image." + ext
+                )
 
-        return super().to_internal_value(data)
+            return super().to_internal_value(data)
 
 
 class SetPasswordSerializer(serializers.Serializer):
@@ -69,8 +78,18 @@ class CustomUserSerializer(serializers.ModelSerializer):
             "is_subscribed"
         ]
 
+    def __init__(self, *args, fields=None, **kwargs):
+        """Оставить только поля из fields, если они переданы."""
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
     def get_is_subscribed(self, obj):
         """Метод проверки подписки на автора."""
+        if hasattr(obj, "is_subscribed"):
+            return obj.is_subscribed
+
         user = self.context["request"].user
 
         if user.is_authenticated:
@@ -191,6 +210,9 @@ class RecipeSerializer(serializers.ModelSerializer):
 
     def get_is_favorited(self, obj):
         """Проверка, находится ли рецепт в избранном."""
+        if hasattr(obj, "is_favorited"):
+            return obj.is_favorited
+
         request = self.context["request"]
         user = request.user
 
@@ -200,6 +222,9 @@ class RecipeSerializer(serializers.ModelSerializer):
 
     def get_is_in_shopping_cart(self, obj):
         """Проверка, находится ли рецепт в избранном."""
+        if hasattr(obj, "is_in_shopping_cart"):
+            return obj.is_in_shopping_cart
+
         request = self.context["request"]
         user = request.user
 
@@ -234,9 +259,10 @@ class CreateRecipeSerializer(serializers.ModelSerializer):
 
     def to_representation(self, instance):
         """Представление рецепта."""
+        request = self.context.get("request")
         serializer = RecipeSerializer(
-            instance,
-            context={"request": self.context.get("request")}
+            get_recipe_queryset(request.user).get(pk=instance.pk),
+            context={"request": request}
         )
 
         return serializer.data
@@ -249,9 +275,12 @@ class CreateRecipeSerializer(serializers.ModelSerializer):
             )
 
         unique_ingredients = set()
+        existing_ingredients = set(Ingredient.objects.filter(
+            pk__in=[ingredient.get("id") for ingredient in ingredients]
+        ).values_list("pk", flat=True))
 
         for ingredient in ingredients:
-            if not Ingredient.objects.filter(pk=ingredient.get("id")).exists():
+            if ingredient.get("id") not in existing_ingredients:
                 raise serializers.ValidationError(
                     "Такого ингредиента нет."
                 )
@@ -279,12 +308,13 @@ class CreateRecipeSerializer(serializers.ModelSerializer):
     @staticmethod
     def add_ingredients_and_tags(recipe, ingredients, tags):
         """Добавить в рецепт ингредиенты и теги."""
+        recipe.tags_mask = get_tags_mask(tags)
         recipe.tags.set(tags)
 
         create_ingredients = [
             RecipeIngredient(
                 recipe=recipe,
-                ingredient=Ingredient.objects.get(pk=ingredient["id"]),
+                ingredient_id=ingredient["id"],
                 amount=ingredient["amount"]
             )
             for ingredient in ingredients
@@ -298,16 +328,21 @@ class CreateRecipeSerializer(serializers.ModelSerializer):
 
         recipe = Recipe.objects.create(
             author=self.context["request"].user,
+            tags_mask=get_tags_mask(tags),
             **validated_data
         )
 
         self.add_ingredients_and_tags(recipe, ingredients, tags)
+        enqueue_minhash_update(recipe)
 
         return recipe
 
     def update(self, instance, validated_data):
         """Обновить рецепт."""
         instance.ingredients_list.all().delete()
+        # Сигнатура пересчитается задачей, до этого рецепт без корзин LSH.
+        instance.bands.all().delete()
+        instance.ingredients_minhash = None
 
         ingredients = validated_data.pop("ingredients")
         tags = validated_data.pop("tags")
@@ -324,6 +359,7 @@ class CreateRecipeSerializer(serializers.ModelSerializer):
         self.add_ingredients_and_tags(instance, ingredients, tags)
 
         instance.save()
+        enqueue_minhash_update(instance)
 
         return instance
 
@@ -368,6 +404,8 @@ class SubscriptionsSerializer(CustomUserSerializer):
 
     def get_recipes_count(self, obj):
         """Получить количество рецептов автора."""
+        if hasattr(obj, "recipes_count"):
+            return obj.recipes_count
 
         return obj.recipes.count()
 
@@ -402,3 +440,21 @@ class CreateSubscribeSerializer(SubscriptionsSerializer):
             )
 
         return obj
+
+
+class ShoppingListExportSerializer(serializers.ModelSerializer):
+    """Сериализатор состояния выгрузки списка покупок."""
+    file = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ShoppingListExport
+        fields = ["id", "status", "file", "created_at", "finished_at"]
+
+    def get_file(self, obj):
+        """Адрес скачивания готового файла."""
+        if obj.status != ShoppingListExport.DONE:
+            return None
+
+        return self.context["request"].build_absolute_uri(
+            reverse("api:recipe-shopping-list-export-file", args=[obj.pk])
+        )
@@ -0,0 +1,125 @@
+import hashlib
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from api.models import ShoppingListExport
+from api.taskqueue import enqueue
+from api.utils import get_shopping_list
+from recipes.models import RecipeIngredient, ShoppingCart
+
+
+def get_cart_ingredients(user):
+    """Ингредиенты из корзины пользователя с суммарным количеством."""
+    return list(
+        RecipeIngredient.objects.filter(
+            recipe__shopping_recipe__user=user
+        ).values(
+            "ingredient__name",
+            "ingredient__measurement_unit"
+        ).annotate(amount=Sum("amount")).order_by("ingredient__name")
+    )
+
+
+def get_cart_hash(user):
+    """Хэш состояния корзины: id рецептов и время их изменения.
+
+    Не меняется, пока в корзине те же рецепты и они не редактировались,
+    поэтому готовый файл можно отдавать повторно. Считается одним
+    запросом по строкам корзины, без суммирования ингредиентов.
+    """
+    content = json.dumps([
+        (recipe_id, updated_at.isoformat())
+        for recipe_id, updated_at in ShoppingCart.objects.filter(
+            user=user
+        ).order_by("recipe_id").values_list(
+            "recipe_id", "recipe__updated_at"
+        )
+    ])
+    return hashlib.sha256(content.encode("utf8")).hexdigest()
+
+
+def delete_exports(queryset):
+    """Удалить выгрузки, а их файлы — после фиксации транзакции."""
+    names = list(queryset.exclude(file="").values_list("file", flat=True))
+    queryset.delete()
+
+    def delete_files():
+        for name in names:
+            default_storage.delete(name)
+
+    transaction.on_commit(delete_files)
+
+
+def start_export(user):
+    """Выгрузка списка покупок для текущего содержимого корзины.
+
+    Выгрузка с тем же хэшем корзины, готовая или собираемая, используется
+    повторно; иначе прежние выгрузки пользователя удаляются и ставится
+    задача сборки. Выгрузка, которая собирается дольше TASK_TIMEOUT,
+    повторно не отдается: воркер мог умереть посреди сборки, и задача
+    упала, не отметив ее. Возвращает выгрузку и признак того, что она
+    новая.
+    """
+    cart_hash = get_cart_hash(user)
+    export = user.shopping_list_exports.filter(
+        cart_hash=cart_hash
+    ).exclude(status=ShoppingListExport.FAILED).exclude(
+        status=ShoppingListExport.PENDING,
+        created_at__lt=timezone.now() - timedelta(
+            seconds=settings.TASK_TIMEOUT
+        )
+    ).first()
+    if export is not None:
+        return export, False
+
+    delete_exports(user.shopping_list_exports.all())
+    export = ShoppingListExport.objects.create(user=user, cart_hash=cart_hash)
+    enqueue("api.export_shopping_list", export_id=str(export.pk))
+    return export, True
+
+
+def build_export(export_id):
+    """Собрать файл выгрузки и отметить ее готовой.
+
+    Корзина могла измениться после постановки задачи, поэтому хэш
+    пересчитывается до чтения ингредиентов: изменение после него даст
+    новый хэш, и следующий запрос соберет новую выгрузку.
+    """
+    export = ShoppingListExport.objects.filter(
+        pk=export_id, status=ShoppingListExport.PENDING
+    ).first()
+    if export is None:
+        return
+
+    exports = ShoppingListExport.objects.filter(
+        pk=export.pk, status=ShoppingListExport.PENDING
+    )
+    try:
+        cart_hash = get_cart_hash(export.user_id)
+        ingredients = get_cart_ingredients(export.user_id)
+        name = default_storage.save(
+            export.file.field.generate_filename(export, f"{export.pk}.txt"),
+            ContentFile(get_shopping_list(ingredients).encode("utf8"))
+        )
+    except Exception:
+        exports.update(
+            status=ShoppingListExport.FAILED, finished_at=timezone.now()
+        )
+        raise
+
+    finished = exports.update(
+        status=ShoppingListExport.DONE,
+        cart_hash=cart_hash,
+        file=name,
+        finished_at=timezone.now()
+    )
+    if not finished:
+        # Выгрузку удалили, пока собирался файл.
+        default_storage.delete(name)
@@ -0,0 +1,103 @@
+from django.conf import settings
+from django.db.models import Max, Q
+from rest_framework.exceptions import ValidationError
+
+from api.fast_serializers import get_recipe_columns, serialize_recipes
+from api.utils import annotate_recipe_flags
+from recipes.changes import assign_positions
+from recipes.models import Change, ChangeLogCompaction, Recipe
+
+# Ключи ответа с добавленными и удаленными объектами по типу изменения.
+SYNC_KEYS = {
+    Change.RECIPE: ("recipes", "deleted_recipes"),
+    Change.FAVORITE: ("favorites", "deleted_favorites"),
+    Change.SHOPPING_CART: ("shopping_cart", "deleted_shopping_cart"),
+    Change.SUBSCRIPTION: ("subscriptions", "deleted_subscriptions"),
+}
+
+
+class SyncExpired(Exception):
+    """Записи после курсора удалены сжатием журнала."""
+
+
+def get_since(request):
+    """Курсор из параметра ?since= или None, если он не передан."""
+    value = request.query_params.get("since")
+    if value is None:
+        return None
+    try:
+        since = int(value)
+    except ValueError:
+        raise ValidationError({"since": "Ожидается целое число."})
+    if since < 0:
+        raise ValidationError({"since": "Ожидается неотрицательное число."})
+    return since
+
+
+def get_changes_queryset(user, since):
+    """Записи журнала после позиции since, видимые пользователю."""
+    return Change.objects.filter(
+        Q(user=None) | Q(user=user), position__gt=since
+    ).order_by("position")
+
+
+def get_sync_changes(request, since, fields):
+    """Изменения после курсора since для текущего пользователя.
+
+    Без since возвращается только текущий курсор: его нужно запросить до
+    полной загрузки данных. Позиции выдаются зафиксированным записям перед
+    чтением, см. assign_positions. Несколько записей об одном объекте в
+    странице сводятся к последней; рецепты отдаются целиком с выбранными
+    полями.
+    """
+    user = request.user
+    response = {
+        "cursor": since,
+        "has_more": False,
+        **{key: [] for keys in SYNC_KEYS.values() for key in keys},
+    }
+    if Change.objects.filter(position=None).exists():
+        assign_positions()
+    if since is None:
+        response["cursor"] = Change.objects.aggregate(
+            value=Max("position")
+        )["value"] or 0
+        return response
+
+    compacted = ChangeLogCompaction.objects.values_list(
+        "last_position", flat=True
+    ).first()
+    if compacted is not None and since < compacted:
+        raise SyncExpired()
+
+    limit = settings.SYNC_PAGE_SIZE
+    changes = list(
+        get_changes_queryset(user, since).values_list(
+            "position", "kind", "object_id", "deleted"
+        )[:limit + 1]
+    )
+    response["has_more"] = len(changes) > limit
+    changes = changes[:limit]
+    if changes:
+        response["cursor"] = changes[-1][0]
+
+    latest = {}
+    for _, kind, object_id, deleted in changes:
+        latest[kind, object_id] = deleted
+    for (kind, object_id), deleted in sorted(latest.items()):
+        response[SYNC_KEYS[kind][deleted]].append(object_id)
+
+    recipe_ids = response["recipes"]
+    rows = list(
+        annotate_recipe_flags(
+            Recipe.objects.filter(pk__in=recipe_ids), user
+        ).order_by("id").values(*get_recipe_columns(fields))
+    ) if recipe_ids else []
+    # Рецепт, удаленный после записи об изменении, отдается как удаленный:
+    # запись об удалении будет на следующих страницах.
+    found = {row["id"] for row in rows}
+    response["deleted_recipes"] = sorted(
+        {*response["deleted_recipes"], *(set(recipe_ids) - found)}
+    )
+    response["recipes"] = serialize_recipes(rows, request, fields)
+    return response
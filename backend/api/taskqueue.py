@@ -0,0 +1,222 @@
+import logging
+import random
+import time
+import traceback
+from collections import namedtuple
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.db.models import Count, F
+from django.utils import timezone
+
+from api.metrics import (TASK_DELAY, TASK_DURATION, TASK_QUEUE_DEPTH,
+                         TASKS_PROCESSED)
+from api.models import Task
+
+logger = logging.getLogger(__name__)
+
+TaskSpec = namedtuple("TaskSpec", ("function", "max_attempts"))
+# Ключи периодических задач: «periodic:» и имя из TASK_PERIODIC.
+PERIODIC_PREFIX = "periodic:"
+
+TASKS = {}
+
+
+def register_task(name, max_attempts=None):
+    """Зарегистрировать функцию как задачу очереди с именем name.
+
+    Задачи ищутся в модулях tasks приложений при запуске Django.
+    """
+    def decorator(function):
+        TASKS[name] = TaskSpec(
+            function, max_attempts or settings.TASK_MAX_ATTEMPTS
+        )
+        return function
+
+    return decorator
+
+
+def enqueue(name, key=None, delay=0, **kwargs):
+    """Поставить задачу в очередь; запрос не ждет ее выполнения.
+
+    Задача пишется в ту же базу, что и данные, поэтому при откате
+    транзакции запроса пропадает и она. С ключом задача не ставится,
+    пока такая же ждет: конфликт с частичным уникальным индексом
+    пропускается одним INSERT без проверки и точки сохранения. Если такая
+    же выполняется, новая ставится и ждет ее завершения, см. claim_tasks.
+    С TASKS_EAGER задача выполняется сразу.
+    """
+    spec = TASKS[name]
+    if settings.TASKS_EAGER:
+        spec.function(**kwargs)
+        return
+
+    Task.objects.bulk_create(
+        [
+            Task(
+                name=name,
+                kwargs=kwargs,
+                key=key,
+                run_at=timezone.now() + timedelta(seconds=delay),
+                max_attempts=spec.max_attempts
+            )
+        ],
+        ignore_conflicts=key is not None
+    )
+
+
+def enqueue_periodic(delays=None):
+    """Поставить периодические задачи из TASK_PERIODIC, которых нет в очереди.
+
+    delays задает задержку запуска по ключу, по умолчанию задачи
+    запускаются сразу.
+    """
+    for key, (name, _, kwargs) in settings.TASK_PERIODIC.items():
+        enqueue(
+            name,
+            key=PERIODIC_PREFIX + key,
+            delay=(delays or {}).get(key, 0),
+            **kwargs
+        )
+
+
+def claim_tasks(worker, limit):
+    """Взять до limit задач, срок которых наступил.
+
+    На PostgreSQL строки блокируются с SKIP LOCKED, и воркеры не ждут друг
+    друга; в остальных базах задача берется условным UPDATE по состоянию.
+    Задача не берется, пока выполняется другая с тем же ключом: иначе
+    более ранняя, завершившись позже, записала бы устаревший результат.
+    """
+    now = timezone.now()
+    due = Task.objects.filter(
+        status=Task.QUEUED, run_at__lte=now
+    ).exclude(
+        key__in=Task.objects.filter(
+            status=Task.RUNNING, key__isnull=False
+        ).values("key")
+    ).order_by("run_at", "id")
+    claim = {
+        "status": Task.RUNNING,
+        "worker": worker,
+        "locked_at": now,
+        "attempts": F("attempts") + 1,
+    }
+
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            tasks = list(due.select_for_update(skip_locked=True)[:limit])
+            Task.objects.filter(
+                pk__in=[task.pk for task in tasks]
+            ).update(**claim)
+    else:
+        tasks = [
+            task for task in due[:limit]
+            if Task.objects.filter(
+                pk=task.pk, status=Task.QUEUED
+            ).update(**claim)
+        ]
+
+    for task in tasks:
+        task.status, task.worker, task.locked_at = Task.RUNNING, worker, now
+        task.attempts += 1
+    return tasks
+
+
+def get_retry_delay(attempts):
+    """Задержка перед повтором: экспоненциально растет с числом попыток."""
+    delay = min(
+        settings.TASK_RETRY_BACKOFF * 2 ** (attempts - 1),
+        settings.TASK_RETRY_MAX_BACKOFF
+    )
+    return delay * random.uniform(0.5, 1)
+
+
+def finish_task(task, error=None):
+    """Записать результат задачи: выполнена, повтор позже или ошибка."""
+    now = timezone.now()
+    updates = {"last_error": error or "", "locked_at": None}
+    if error is None:
+        result = Task.DONE
+        updates.update(status=Task.DONE, finished_at=now)
+    elif task.attempts < task.max_attempts:
+        result = "retry"
+        updates.update(
+            status=Task.QUEUED,
+            run_at=now + timedelta(seconds=get_retry_delay(task.attempts))
+        )
+    else:
+        result = Task.FAILED
+        updates.update(status=Task.FAILED, finished_at=now)
+
+    with transaction.atomic():
+        Task.objects.filter(pk=task.pk).update(**updates)
+        periodic_key = (task.key or "").removeprefix(PERIODIC_PREFIX)
+        if result != "retry" and periodic_key in settings.TASK_PERIODIC:
+            # Следующий запуск ставится после завершения текущего,
+            # поэтому один и тот же пересчет не идет дважды параллельно.
+            enqueue_periodic({
+                periodic_key: settings.TASK_PERIODIC[periodic_key][1]
+            })
+    TASKS_PROCESSED.labels(task.name, result).inc()
+    return result
+
+
+def run_task(task):
+    """Выполнить взятую задачу и записать результат."""
+    close_old_connections()
+    TASK_DELAY.labels(task.name).observe(
+        (task.locked_at - task.run_at).total_seconds()
+    )
+    start = time.perf_counter()
+    error = None
+    try:
+        spec = TASKS.get(task.name)
+        if spec is None:
+            raise LookupError(f"Задача {task.name} не зарегистрирована.")
+        spec.function(**task.kwargs)
+    except Exception:
+        logger.exception("Задача %s #%s упала", task.name, task.pk)
+        error = traceback.format_exc()
+    finally:
+        TASK_DURATION.labels(task.name).observe(time.perf_counter() - start)
+
+    try:
+        return finish_task(task, error)
+    finally:
+        close_old_connections()
+
+
+def requeue_stale_tasks():
+    """Вернуть в очередь задачи воркеров, не завершивших их за TASK_TIMEOUT.
+
+    Попытка уже учтена, поэтому задача, исчерпавшая попытки, падает.
+    """
+    stale = Task.objects.filter(
+        status=Task.RUNNING,
+        locked_at__lt=timezone.now() - timedelta(
+            seconds=settings.TASK_TIMEOUT
+        )
+    )
+    error = "Воркер не завершил задачу за TASK_TIMEOUT."
+    failed = stale.filter(attempts__gte=F("max_attempts")).update(
+        status=Task.FAILED, finished_at=timezone.now(), last_error=error
+    )
+    requeued = stale.update(
+        status=Task.QUEUED, locked_at=None, last_error=error
+    )
+    return requeued, failed
+
+
+def update_queue_depth():
+    """Обновить метрику числа задач в очереди, срок которых наступил."""
+    counts = dict(
+        Task.objects.filter(
+            status=Task.QUEUED, run_at__lte=timezone.now()
+        ).order_by().values("name").annotate(
+            count=Count("id")
+        ).values_list("name", "count")
+    )
+    for name in TASKS.keys() | counts.keys():
+        TASK_QUEUE_DEPTH.labels(name).set(counts.get(name, 0))
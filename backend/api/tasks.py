@@ -0,0 +1,25 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from api.models import Task
+from api.shopping_list import build_export
+from api.taskqueue import register_task
+
+
+@register_task("api.cleanup_tasks")
+def cleanup_tasks():
+    """Удалить завершенные задачи старше TASK_RETENTION_DAYS."""
+    Task.objects.filter(
+        status__in=(Task.DONE, Task.FAILED),
+        finished_at__lt=(
+            timezone.now() - timedelta(days=settings.TASK_RETENTION_DAYS)
+        )
+    ).delete()
+
+
+@register_task("api.export_shopping_list", max_attempts=1)
+def export_shopping_list(export_id):
+    """Собрать файл списка покупок; ошибка сразу отмечает выгрузку."""
+    build_export(export_id)
@@ -0,0 +1,1280 @@
+import gc
+import gzip
+import io
+import itertools
+import json
+import tempfile
+import warnings
+from base64 import b64encode
+from datetime import timedelta
+from unittest import skipIf
+from unittest.mock import patch
+from urllib.parse import urlencode
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.db import connections
+from django.db.models import Max
+from django.test import (AsyncClient, TestCase, TransactionTestCase,
+                         override_settings)
+from django.utils import timezone
+from prometheus_client import REGISTRY
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from api import compression, ingredient_search, recipe_suggest
+from api.catalog import (CATALOG_VERSION_KEY, bump_catalog_version,
+                         get_catalog_cache, invalidate_catalog)
+from api.async_views import get_user_recipe_ids
+from api.checks import (check_ingredient_search_backend,
+                        check_replica_sticky_cache)
+from api.filters import RECIPE_ORDERINGS
+from api.models import ShoppingListExport, Task
+from api.paginations import count_queryset
+from api.shopping_list import build_export, start_export
+from api.taskqueue import claim_tasks, enqueue, finish_task
+from recipes.models import (MAX_TAGS, Change, Favorite, Ingredient, Recipe,
+                            RecipeIngredient, RecipeNeighbor, ShoppingCart,
+                            Tag, get_tags_mask)
+from recipes import duplicates
+from recipes.neighbors import build_neighbors
+from recipes.trending import update_scores
+from users.models import CustomUser, Subscriptions
+
+
+def create_user(username):
+    """Пользователь с паролем password."""
+    return CustomUser.objects.create_user(
+        username=username, email=f"{username}@example.com",
+        password="password"
+    )
+
+
+TAG_COLORS = itertools.count()
+
+
+def create_tag(slug):
+    """Тег с уникальным цветом."""
+    return Tag.objects.create(
+        name=slug, slug=slug, color=f"#{next(TAG_COLORS):06x}"
+    )
+
+
+def create_recipe(author, tags=(), **fields):
+    """Рецепт с тегами и заполненной маской тегов."""
+    recipe = Recipe.objects.create(
+        author=author, text="Текст", image="recipes/images/recipe.png",
+        tags_mask=get_tags_mask(tags),
+        **{"name": "Рецепт", "cooking_time": 10, **fields}
+    )
+    recipe.tags.set(tags)
+    return recipe
+
+
+def get_recipe_ids(client, query):
+    """id рецептов первой страницы списка с параметрами query."""
+    response = client.get(f"/api/recipes/?limit=100&{query}")
+    assert response.status_code == 200, response.content
+    return [recipe["id"] for recipe in response.json()["results"]]
+
+
+@override_settings(ROOT_URLCONF="foodgram_backend.urls_asgi")
+class AsyncIngredientListTests(TransactionTestCase):
+    """Async-представление списка ингредиентов."""
+
+    def setUp(self):
+        Ingredient.objects.create(name="картофель", measurement_unit="г")
+        Ingredient.objects.create(name="морковь", measurement_unit="г")
+
+    async def test_search_builds_cold_index(self):
+        """Индекс поиска строится в потоке, а не в цикле событий."""
+        ingredient_search._index = None
+
+        response = await AsyncClient().get(
+            "/api/ingredients/?search=картошель"
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [row["name"] for row in response.json()], ["картофель"]
+        )
+
+    @override_settings(INGREDIENT_SEARCH_INDEX_TIMEOUT=0)
+    async def test_search_rebuilds_stale_index(self):
+        """Устаревший индекс перестраивается без SynchronousOnlyOperation."""
+        response = await AsyncClient().get("/api/ingredients/?search=морк")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [row["name"] for row in response.json()], ["морковь"]
+        )
+
+
+@override_settings(ROOT_URLCONF="foodgram_backend.urls_asgi")
+class AsyncRecipeListTests(TransactionTestCase):
+    """Async-представление списка рецептов."""
+
+    async def test_invalid_page_awaits_all_queries(self):
+        """Некорректный номер страницы не оставляет неожиданных корутин."""
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter("always")
+            for page, status in (("abc", 404), ("last", 200)):
+                response = await AsyncClient().get(
+                    f"/api/recipes/?page={page}"
+                )
+                self.assertEqual(response.status_code, status)
+            gc.collect()
+
+        self.assertEqual(
+            [str(warning.message) for warning in caught
+             if issubclass(warning.category, RuntimeWarning)],
+            []
+        )
+
+    async def test_ids(self):
+        """С ?ids= рецепты идут в порядке запроса, остальные — в missing."""
+        author = await sync_to_async(create_user)("author")
+        first, second = [
+            (await sync_to_async(create_recipe)(author)).id for _ in range(2)
+        ]
+
+        response = await AsyncClient().get(
+            f"/api/recipes/?ids={second},0,{first}"
+        )
+
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(
+            [recipe["id"] for recipe in data["results"]], [second, first]
+        )
+        self.assertEqual(data["missing"], [0])
+
+    async def test_flags_for_page(self):
+        """Признаки избранного и покупок — только по рецептам страницы."""
+        user = await sync_to_async(create_user)("user")
+        token = await sync_to_async(Token.objects.create)(user=user)
+        recipes = [
+            await sync_to_async(create_recipe)(user) for _ in range(3)
+        ]
+        for recipe in recipes[1:]:
+            await sync_to_async(Favorite.objects.create)(
+                user=user, recipe=recipe
+            )
+        await sync_to_async(ShoppingCart.objects.create)(
+            user=user, recipe=recipes[0]
+        )
+
+        with patch(
+            "api.async_views.get_user_recipe_ids", wraps=get_user_recipe_ids
+        ) as get_ids:
+            response = await AsyncClient().get(
+                "/api/recipes/?limit=2", authorization=f"Token {token.key}"
+            )
+
+        self.assertEqual(
+            [
+                (recipe["id"], recipe["is_favorited"],
+                 recipe["is_in_shopping_cart"])
+                for recipe in response.json()["results"]
+            ],
+            [(recipes[2].id, True, False), (recipes[1].id, True, False)]
+        )
+        for call in get_ids.call_args_list:
+            self.assertEqual(call.args[2], [recipes[2].id, recipes[1].id])
+
+
+@override_settings(ROOT_URLCONF="foodgram_backend.urls_asgi")
+class AsyncQueryMetricsTests(TransactionTestCase):
+    """Счетчик SQL-запросов в метриках под ASGI."""
+
+    def setUp(self):
+        self.tag = Tag.objects.create(
+            name="Завтрак", color="#000000", slug="breakfast"
+        )
+
+    def get_queries(self, view):
+        return REGISTRY.get_sample_value(
+            "foodgram_view_db_queries_sum", {"view": view}
+        ) or 0
+
+    async def test_sync_view_queries_counted(self):
+        """Запросы синхронного представления DRF попадают в метрику."""
+        before = self.get_queries("TagViewSet.retrieve")
+
+        response = await AsyncClient().get(f"/api/tags/{self.tag.pk}/")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.get_queries("TagViewSet.retrieve") - before, 1)
+
+    async def test_async_view_queries_counted(self):
+        """Запросы async-представления из потоков run_query учитываются."""
+        view = "api.async_views.tag_list"
+        before = self.get_queries(view)
+
+        response = await AsyncClient().get("/api/tags/")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.get_queries(view) - before, 1)
+
+
+class TaskQueueTests(TestCase):
+    """Очередь фоновых задач."""
+
+    def test_keyed_task_requeued_while_running(self):
+        """Задачу с ключом можно поставить, пока такая же выполняется.
+
+        Новая ждет, пока выполняемая не завершится, и не теряется.
+        """
+        name = "recipes.update_ingredients_minhash"
+        enqueue(name, key="minhash:1", recipe_id=1)
+        enqueue(name, key="minhash:1", recipe_id=1)
+        [running] = claim_tasks("worker", 10)
+
+        enqueue(name, key="minhash:1", recipe_id=1)
+        enqueue(name, key="minhash:1", recipe_id=1)
+        self.assertEqual(
+            Task.objects.filter(key="minhash:1", status=Task.QUEUED).count(),
+            1
+        )
+        self.assertEqual(claim_tasks("worker", 10), [])
+
+        finish_task(running)
+        [queued] = claim_tasks("worker", 10)
+        self.assertNotEqual(queued.pk, running.pk)
+
+
+class ReplicaChecksTests(TestCase):
+    """Проверка настроек реплик."""
+
+    @override_settings(REPLICA_DATABASES=["replica1"], CACHES={
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache"
+        }
+    })
+    def test_replicas_require_shared_cache(self):
+        """Привязка к основной базе в кэше процесса — ошибка."""
+        errors = check_replica_sticky_cache(None)
+
+        self.assertEqual([error.id for error in errors], ["api.E001"])
+
+    @override_settings(REPLICA_DATABASES=["replica1"], CACHES={
+        "default": {
+            "BACKEND": "django.core.cache.backends.db.DatabaseCache",
+            "LOCATION": "cache",
+        }
+    })
+    def test_shared_cache_accepted(self):
+        """С общим кэшем ошибки нет."""
+        self.assertEqual(check_replica_sticky_cache(None), [])
+
+
+class SetUsernameTests(TestCase):
+    """Смена адреса почты, по которому входит пользователь."""
+
+    def test_set_username_changes_email(self):
+        """Новый адрес сохраняется и по нему можно войти."""
+        user = CustomUser.objects.create_user(
+            username="user", email="old@example.com", password="password"
+        )
+        client = APIClient()
+        client.force_authenticate(user)
+
+        response = client.post("/api/users/set_username/", {
+            "new_email": "new@example.com",
+            "current_password": "password",
+        })
+
+        self.assertEqual(response.status_code, 204)
+        user.refresh_from_db()
+        self.assertEqual(user.email, "new@example.com")
+        self.assertEqual(user.username, "user")
+
+
+class ShoppingListExportTests(TestCase):
+    """Фоновая выгрузка списка покупок."""
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        media_root = override_settings(MEDIA_ROOT=media.name)
+        media_root.enable()
+        self.addCleanup(media_root.disable)
+        self.user = CustomUser.objects.create_user(
+            username="user", email="user@example.com", password="password"
+        )
+        self.recipe = Recipe.objects.create(
+            author=self.user, name="Рецепт", text="Текст", cooking_time=10,
+            image="recipes/images/recipe.png"
+        )
+        RecipeIngredient.objects.create(
+            recipe=self.recipe,
+            ingredient=Ingredient.objects.create(
+                name="картофель", measurement_unit="г"
+            ),
+            amount=100
+        )
+        ShoppingCart.objects.create(user=self.user, recipe=self.recipe)
+
+    def test_export_reused_until_cart_changes(self):
+        """Та же корзина отдает ту же выгрузку, правка рецепта — новую."""
+        export, created = start_export(self.user)
+        self.assertTrue(created)
+        build_export(export.pk)
+
+        self.assertEqual(start_export(self.user), (export, False))
+
+        self.recipe.save()
+        new_export, created = start_export(self.user)
+        self.assertTrue(created)
+        self.assertNotEqual(new_export.pk, export.pk)
+
+    @override_settings(TASK_TIMEOUT=60)
+    def test_stale_pending_export_replaced(self):
+        """Выгрузка, застрявшая в сборке, не отдается повторно."""
+        export, _ = start_export(self.user)
+        ShoppingListExport.objects.filter(pk=export.pk).update(
+            created_at=timezone.now() - timedelta(seconds=61)
+        )
+
+        new_export, created = start_export(self.user)
+
+        self.assertTrue(created)
+        self.assertFalse(
+            ShoppingListExport.objects.filter(pk=export.pk).exists()
+        )
+        build_export(new_export.pk)
+        new_export.refresh_from_db()
+        self.assertEqual(new_export.status, ShoppingListExport.DONE)
+
+
+class TagMaskTests(TestCase):
+    """Фильтр рецептов по битовой маске тегов."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.author = create_user("author")
+        self.tags = [create_tag(slug) for slug in ("a", "b", "c")]
+        a, b, c = self.tags
+        for tags in ((), (a,), (b,), (a, b), (b, c), (a, b, c)):
+            create_recipe(self.author, tags)
+
+    def get_joined_ids(self, *slugs, match_all=False):
+        """Ожидаемый результат по соединению с тегами."""
+        recipes = Recipe.objects.all()
+        if match_all:
+            for slug in slugs:
+                recipes = recipes.filter(tags__slug=slug)
+        else:
+            recipes = recipes.filter(tags__slug__in=slugs).distinct()
+        return set(recipes.values_list("id", flat=True))
+
+    def test_new_tag_takes_lowest_free_bit(self):
+        """Новый тег занимает наименьший свободный бит."""
+        self.assertEqual([tag.bit for tag in self.tags], [0, 1, 2])
+
+        self.tags[1].delete()
+
+        self.assertEqual(create_tag("d").bit, 1)
+
+    def test_tag_limit(self):
+        """Больше MAX_TAGS тегов маска не вмещает."""
+        for number in range(MAX_TAGS - len(self.tags)):
+            create_tag(f"tag-{number}")
+
+        with self.assertRaises(ValidationError):
+            create_tag("extra")
+
+    def test_any_tags_matches_join(self):
+        """?tags= совпадает с фильтром tags__slug__in."""
+        for slugs in (("a",), ("b",), ("a", "c"), ("a", "b", "c")):
+            query = "&".join(f"tags={slug}" for slug in slugs)
+            with self.subTest(slugs=slugs):
+                self.assertEqual(
+                    set(get_recipe_ids(self.client, query)),
+                    self.get_joined_ids(*slugs)
+                )
+
+    def test_all_tags_matches_join(self):
+        """?tags_all= совпадает с цепочкой фильтров по каждому тегу."""
+        for slugs in (("a",), ("a", "b"), ("b", "c"), ("a", "b", "c")):
+            query = "&".join(f"tags_all={slug}" for slug in slugs)
+            with self.subTest(slugs=slugs):
+                self.assertEqual(
+                    set(get_recipe_ids(self.client, query)),
+                    self.get_joined_ids(*slugs, match_all=True)
+                )
+
+    def test_deleted_tag_bit_cleared(self):
+        """Бит удаленного тега снимается с масок и не достается новому."""
+        self.tags[0].delete()
+
+        self.assertFalse(
+            Recipe.objects.filter(tags_mask__in=(1, 3, 7)).exists()
+        )
+        new_tag = create_tag("d")
+        self.assertEqual(new_tag.bit, 0)
+        self.assertEqual(get_recipe_ids(self.client, "tags=d"), [])
+        self.assertEqual(
+            set(get_recipe_ids(self.client, "tags=b")),
+            self.get_joined_ids("b")
+        )
+
+
+class FacetsTests(TestCase):
+    """Число рецептов по тегам и времени приготовления."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user("user")
+        a, b = create_tag("a"), create_tag("b")
+        for tags, cooking_time in (
+            ((a,), 10), ((b,), 20), ((a, b), 45), ((), 200)
+        ):
+            create_recipe(self.user, tags, cooking_time=cooking_time)
+        Favorite.objects.create(
+            user=self.user,
+            recipe=create_recipe(self.user, (a,), cooking_time=90)
+        )
+
+    def get_facets(self, query=""):
+        """Итог, числа по тегам и по интервалам времени."""
+        response = self.client.get(f"/api/recipes/facets/?{query}")
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        return (
+            data["count"],
+            {tag["slug"]: tag["count"] for tag in data["tags"]},
+            [bucket["count"] for bucket in data["cooking_time"]],
+        )
+
+    def test_without_filters(self):
+        """Все рецепты по тегам и интервалам 1-15, 16-30, ..., 121+."""
+        self.assertEqual(
+            self.get_facets(), (5, {"a": 3, "b": 2}, [1, 1, 1, 1, 1])
+        )
+
+    def test_any_tags(self):
+        """?tags= сужает итог и интервалы, но не числа у тегов."""
+        self.assertEqual(
+            self.get_facets("tags=a"), (3, {"a": 3, "b": 2}, [1, 0, 1, 1, 0])
+        )
+
+    def test_all_tags(self):
+        """?tags_all= сужает и числа у тегов."""
+        self.assertEqual(
+            self.get_facets("tags_all=b"),
+            (2, {"a": 1, "b": 2}, [0, 1, 1, 0, 0])
+        )
+
+    def test_other_filters(self):
+        """Остальные фильтры учитываются во всех числах."""
+        self.client.force_authenticate(self.user)
+
+        self.assertEqual(
+            self.get_facets("is_favorited=1"),
+            (1, {"a": 1, "b": 0}, [0, 0, 0, 1, 0])
+        )
+
+    def test_cooking_time_bounds(self):
+        """Границы интервалов соответствуют FACETS_COOKING_TIME_BUCKETS."""
+        response = self.client.get("/api/recipes/facets/")
+
+        self.assertEqual(
+            [(bucket["min"], bucket["max"])
+             for bucket in response.json()["cooking_time"]],
+            [(1, 15), (16, 30), (31, 60), (61, 120), (121, None)]
+        )
+
+
+class KeysetPaginationTests(TestCase):
+    """Курсорная пагинация сортировок trending и popular."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.author = create_user("author")
+        # Повторяющиеся значения: страницы делятся внутри групп равных.
+        for popularity, trending_score in (
+            (5, 0.5), (5, 0.5), (5, 2.0), (3, 2.0), (3, 0.5), (1, 0.0),
+            (0, 0.0)
+        ):
+            create_recipe(
+                self.author, popularity=popularity,
+                trending_score=trending_score
+            )
+
+    def get_expected_ids(self, ordering):
+        return list(Recipe.objects.order_by(
+            *RECIPE_ORDERINGS[ordering]
+        ).values_list("id", flat=True))
+
+    def walk(self, url, link="next"):
+        """id рецептов всех страниц по ссылкам link."""
+        pages = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            data = response.json()
+            pages.append([recipe["id"] for recipe in data["results"]])
+            url = data[link]
+        return pages
+
+    def test_pages_follow_ordering(self):
+        """Страницы идут подряд без пропусков и повторов."""
+        for ordering in RECIPE_ORDERINGS:
+            with self.subTest(ordering=ordering):
+                pages = self.walk(
+                    f"/api/recipes/?ordering={ordering}&limit=2"
+                )
+                self.assertEqual(
+                    [len(page) for page in pages], [2, 2, 2, 1]
+                )
+                self.assertEqual(
+                    sum(pages, []), self.get_expected_ids(ordering)
+                )
+
+    def test_previous_pages(self):
+        """Ссылки назад возвращают те же страницы в обратном порядке."""
+        pages = self.walk("/api/recipes/?ordering=popular&limit=2")
+        response = self.client.get(
+            "/api/recipes/?ordering=popular&limit=2"
+        )
+        for _ in pages[1:]:
+            response = self.client.get(response.json()["next"])
+
+        previous = self.walk(response.json()["previous"], "previous")
+
+        self.assertEqual(previous, pages[-2::-1])
+
+    def test_insert_before_cursor(self):
+        """Новый рецепт перед курсором не сдвигает следующую страницу."""
+        response = self.client.get("/api/recipes/?ordering=popular&limit=2")
+        expected = self.get_expected_ids("popular")[2:4]
+        create_recipe(self.author, popularity=10)
+
+        response = self.client.get(response.json()["next"])
+
+        self.assertEqual(
+            [recipe["id"] for recipe in response.json()["results"]],
+            expected
+        )
+
+    def test_invalid_cursor(self):
+        """Испорченный курсор дает 404."""
+        for position in ("not json", json.dumps([5]), json.dumps({})):
+            cursor = b64encode(
+                urlencode({"p": position}).encode()
+            ).decode()
+            with self.subTest(position=position):
+                response = self.client.get(
+                    f"/api/recipes/?ordering=popular&cursor={cursor}"
+                )
+                self.assertEqual(response.status_code, 404)
+
+        response = self.client.get(
+            "/api/recipes/?ordering=popular&cursor=garbage"
+        )
+        self.assertEqual(response.status_code, 404)
+
+
+class SyncTests(TestCase):
+    """Журнал изменений /api/sync/ и его сжатие."""
+
+    def setUp(self):
+        self.user = create_user("user")
+        self.author = create_user("author")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.recipe = create_recipe(self.author, name="Суп")
+
+    def sync(self, since=None, status=200):
+        url = "/api/sync/" if since is None else f"/api/sync/?since={since}"
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status, response.content)
+        return response.json()
+
+    def test_cursor_without_since(self):
+        """Без since отдается только текущий курсор."""
+        data = self.sync()
+
+        self.assertEqual(
+            data["cursor"],
+            Change.objects.aggregate(value=Max("position"))["value"]
+        )
+        self.assertEqual(data["recipes"], [])
+        self.assertEqual(self.sync(data["cursor"])["recipes"], [])
+
+    def test_recipe_changes(self):
+        """Создание, изменение и удаление рецепта идут после курсора."""
+        cursor = self.sync()["cursor"]
+        recipe = create_recipe(self.author, name="Каша")
+
+        data = self.sync(cursor)
+        self.assertEqual(
+            [(item["id"], item["name"]) for item in data["recipes"]],
+            [(recipe.id, "Каша")]
+        )
+        self.assertGreater(data["cursor"], cursor)
+        cursor = data["cursor"]
+
+        recipe.name = "Овсянка"
+        recipe.save()
+        data = self.sync(cursor)
+        self.assertEqual(
+            [(item["id"], item["name"]) for item in data["recipes"]],
+            [(recipe.id, "Овсянка")]
+        )
+        cursor = data["cursor"]
+
+        recipe_id = recipe.id
+        recipe.delete()
+        data = self.sync(cursor)
+        self.assertEqual(data["recipes"], [])
+        self.assertEqual(data["deleted_recipes"], [recipe_id])
+        self.assertEqual(self.sync(data["cursor"])["deleted_recipes"], [])
+
+    def test_user_changes(self):
+        """Избранное видно только владельцу, удаление — отметкой."""
+        cursor = self.sync()["cursor"]
+        favorite = Favorite.objects.create(user=self.user, recipe=self.recipe)
+        Favorite.objects.create(user=self.author, recipe=self.recipe)
+
+        data = self.sync(cursor)
+        self.assertEqual(data["favorites"], [self.recipe.id])
+        self.assertEqual(data["deleted_favorites"], [])
+
+        favorite.delete()
+        data = self.sync(data["cursor"])
+        self.assertEqual(data["favorites"], [])
+        self.assertEqual(data["deleted_favorites"], [self.recipe.id])
+
+    @override_settings(SYNC_PAGE_SIZE=2)
+    def test_pages(self):
+        """Курсор продвигается по страницам до конца журнала."""
+        cursor = self.sync()["cursor"]
+        recipes = [create_recipe(self.author) for _ in range(3)]
+
+        first = self.sync(cursor)
+        second = self.sync(first["cursor"])
+
+        self.assertTrue(first["has_more"])
+        self.assertFalse(second["has_more"])
+        self.assertEqual(
+            [item["id"] for item in first["recipes"] + second["recipes"]],
+            [recipe.id for recipe in recipes]
+        )
+        self.assertEqual(self.sync(second["cursor"])["recipes"], [])
+
+    def test_late_commit(self):
+        """Запись с меньшим id, ставшая видна позже, не пропускается."""
+        cursor = self.sync()["cursor"]
+        late = Change.objects.create(kind=Change.RECIPE, object_id=0)
+        recipe = create_recipe(self.author)
+        # Запись late еще не зафиксирована, когда клиент читает журнал.
+        late_id = late.id
+        late.delete()
+        cursor = self.sync(cursor)["cursor"]
+
+        Change.objects.create(
+            id=late_id, kind=Change.RECIPE, object_id=self.recipe.id
+        )
+        data = self.sync(cursor)
+
+        self.assertEqual(
+            [item["id"] for item in data["recipes"]], [self.recipe.id]
+        )
+        self.assertGreater(
+            Change.objects.get(id=late_id).position,
+            Change.objects.get(object_id=recipe.id).position
+        )
+
+    def test_author_change(self):
+        """Изменение профиля автора отдает его рецепты заново."""
+        cursor = self.sync()["cursor"]
+        self.author.first_name = "Новое имя"
+        self.author.save()
+
+        data = self.sync(cursor)
+
+        self.assertEqual(
+            [item["author"]["first_name"] for item in data["recipes"]],
+            ["Новое имя"]
+        )
+
+    def test_author_login_not_logged(self):
+        """Сохранение пользователя без изменения профиля не пишется."""
+        count = Change.objects.count()
+        self.author.last_login = timezone.now()
+        self.author.save()
+
+        self.assertEqual(Change.objects.count(), count)
+
+    def test_compaction_keeps_latest(self):
+        """Сжатие оставляет последнее состояние каждого объекта."""
+        self.recipe.name = "Борщ"
+        self.recipe.save()
+        favorite = Favorite.objects.create(user=self.user, recipe=self.recipe)
+        favorite.delete()
+        ShoppingCart.objects.create(user=self.user, recipe=self.recipe)
+        before = self.sync(0)
+
+        call_command("compactchanges", stdout=io.StringIO())
+        after = self.sync(0)
+
+        # По одной записи о рецепте, избранном и покупках.
+        self.assertEqual(Change.objects.count(), 3)
+        for key in ("recipes", "deleted_favorites", "shopping_cart"):
+            with self.subTest(key=key):
+                self.assertEqual(after[key], before[key])
+        self.assertEqual(after["recipes"][0]["name"], "Борщ")
+        self.assertEqual(after["favorites"], [])
+        self.assertEqual(after["cursor"], before["cursor"])
+
+    def test_compaction_expires_cursor(self):
+        """Клиенту с курсором до удаленных записей отвечается 410."""
+        cursor = self.sync()["cursor"]
+        Change.objects.update(created_at=timezone.now() - timedelta(days=2))
+        recipe = create_recipe(self.author)
+
+        call_command("compactchanges", days=1, stdout=io.StringIO())
+
+        self.sync(0, status=410)
+        data = self.sync(cursor)
+        self.assertEqual(
+            [item["id"] for item in data["recipes"]], [recipe.id]
+        )
+
+
+class BatchIdsTests(TestCase):
+    """Выборка рецептов и пользователей по ?ids=."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.author = create_user("author")
+        self.other = create_user("other")
+        self.tag = create_tag("tag")
+        self.recipes = [
+            create_recipe(self.author, tags=[self.tag]),
+            create_recipe(self.author),
+            create_recipe(self.other, tags=[self.tag]),
+        ]
+
+    def get(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, response.content)
+        data = response.json()
+        return [item["id"] for item in data["results"]], data["missing"]
+
+    def test_recipes_order(self):
+        """Рецепты идут в порядке переданных id, без повторов."""
+        first, second, third = (recipe.id for recipe in self.recipes)
+
+        self.assertEqual(
+            self.get(f"/api/recipes/?ids={third},{first},{third},{second}"),
+            ([third, first, second], [])
+        )
+
+    def test_recipes_missing(self):
+        """Несуществующие и отфильтрованные id попадают в missing."""
+        first, second, third = (recipe.id for recipe in self.recipes)
+        absent = third + 100
+
+        self.assertEqual(
+            self.get(
+                f"/api/recipes/?ids={second},{absent},{first},{third}"
+                f"&author={self.author.id}&tags={self.tag.slug}"
+            ),
+            ([first], [second, absent, third])
+        )
+
+    def test_recipes_fields(self):
+        """?fields= выбирает поля рецептов из пачки."""
+        response = self.client.get(
+            f"/api/recipes/?ids={self.recipes[0].id}&fields=id,name"
+        )
+
+        self.assertEqual(
+            response.json()["results"],
+            [{"id": self.recipes[0].id, "name": "Рецепт"}]
+        )
+
+    def test_users(self):
+        """Пользователи идут в порядке id, отсутствующие — в missing."""
+        absent = self.other.id + 100
+        self.client.force_authenticate(
+            CustomUser.objects.create_user(
+                username="admin", email="admin@example.com", is_staff=True
+            )
+        )
+
+        self.assertEqual(
+            self.get(
+                f"/api/users/?ids={self.other.id},{absent},{self.author.id}"
+            ),
+            ([self.other.id, self.author.id], [absent])
+        )
+
+    def test_users_hidden(self):
+        """Обычному пользователю остальные пользователи не видны."""
+        self.client.force_authenticate(self.author)
+
+        self.assertEqual(
+            self.get(f"/api/users/?ids={self.other.id},{self.author.id}"),
+            ([self.author.id], [self.other.id])
+        )
+
+    def test_invalid_ids(self):
+        """Нечисловые id дают 400."""
+        for url in ("/api/recipes/", "/api/users/"):
+            for ids in ("1,a", "1.5", "-"):
+                with self.subTest(url=url, ids=ids):
+                    response = self.client.get(f"{url}?ids={ids}")
+                    self.assertEqual(response.status_code, 400)
+                    self.assertIn("ids", response.json())
+
+    @override_settings(BATCH_MAX_IDS=2)
+    def test_too_many_ids(self):
+        """Больше BATCH_MAX_IDS разных id дают 400, повторы не считаются."""
+        for url in ("/api/recipes/", "/api/users/"):
+            with self.subTest(url=url):
+                self.assertEqual(
+                    self.client.get(f"{url}?ids=1,2,3").status_code, 400
+                )
+                self.assertEqual(
+                    self.client.get(f"{url}?ids=1,2,1,2").status_code, 200
+                )
+
+
+class SparseFieldsTests(TestCase):
+    """Выбор полей ответа параметрами ?fields= и ?omit=."""
+
+    def setUp(self):
+        self.user = create_user("user")
+        self.author = create_user("author")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.recipe = create_recipe(self.author)
+        Subscriptions.objects.create(user=self.user, author=self.author)
+
+    def get(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def test_recipe_fields(self):
+        """?fields= оставляет в рецептах только перечисленные поля."""
+        data = self.get("/api/recipes/?fields=id,name,cooking_time")
+
+        self.assertEqual(
+            data["results"],
+            [{"id": self.recipe.id, "name": "Рецепт", "cooking_time": 10}]
+        )
+
+    def test_recipe_omit(self):
+        """?omit= убирает поля из списка и страницы рецепта."""
+        for url in (
+            "/api/recipes/?omit=ingredients,author",
+            f"/api/recipes/{self.recipe.id}/?omit=ingredients,author",
+        ):
+            with self.subTest(url=url):
+                data = self.get(url)
+                recipe = data["results"][0] if "results" in data else data
+                self.assertNotIn("ingredients", recipe)
+                self.assertNotIn("author", recipe)
+                self.assertIn("tags", recipe)
+
+    def test_fields_and_omit(self):
+        """?omit= применяется после ?fields=."""
+        data = self.get("/api/recipes/?fields=id,name&omit=name")
+
+        self.assertEqual(data["results"], [{"id": self.recipe.id}])
+
+    def test_users(self):
+        """Поля выбираются и у пользователей, и у подписок."""
+        self.assertEqual(
+            self.get("/api/users/me/?fields=id,username"),
+            {"id": self.user.id, "username": "user"}
+        )
+        subscriptions = self.get("/api/users/subscriptions/?omit=recipes")
+        self.assertNotIn("recipes", subscriptions["results"][0])
+        self.assertIn("recipes_count", subscriptions["results"][0])
+
+    def test_unknown_field(self):
+        """Неизвестное поле дает 400 с его названием."""
+        for url in (
+            "/api/recipes/?fields=id,secret",
+            "/api/recipes/?omit=secret",
+            "/api/users/me/?fields=password",
+        ):
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn("fields", response.json())
+
+
+class CompressionTests(TestCase):
+    """Сжатие ответов по заголовку Accept-Encoding."""
+
+    def setUp(self):
+        self.client = APIClient()
+        Ingredient.objects.bulk_create(
+            Ingredient(name=f"ингредиент {number}", measurement_unit="г")
+            for number in range(100)
+        )
+        self.plain = self.client.get("/api/ingredients/").content
+
+    def get(self, accept_encoding, url="/api/ingredients/"):
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING=accept_encoding)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("Accept-Encoding", response["Vary"])
+        return response
+
+    def test_gzip(self):
+        """gzip-ответ распаковывается в исходное тело."""
+        response = self.get("gzip, deflate")
+
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(gzip.decompress(response.content), self.plain)
+        self.assertEqual(
+            response["Content-Length"], str(len(response.content))
+        )
+
+    @skipIf(compression.brotli is None, "пакет brotli не установлен")
+    def test_brotli(self):
+        """brotli предпочитается gzip при равном q."""
+        response = self.get("gzip, deflate, br")
+
+        self.assertEqual(response["Content-Encoding"], "br")
+        self.assertEqual(
+            compression.brotli.decompress(response.content), self.plain
+        )
+
+    def test_quality(self):
+        """Кодировка выбирается по q, q=0 ее запрещает."""
+        for accept_encoding, encoding in (
+            ("br;q=0.5, gzip", "gzip"),
+            ("br;q=0, gzip;q=0.1", "gzip"),
+            ("*;q=0", None),
+            ("identity", None),
+            ("", None),
+        ):
+            with self.subTest(accept_encoding=accept_encoding):
+                response = self.get(accept_encoding)
+                self.assertEqual(response.get("Content-Encoding"), encoding)
+                if encoding is None:
+                    self.assertEqual(response.content, self.plain)
+
+    def test_cached_body(self):
+        """Повторный ответ без авторизации берется из кэша сжатия."""
+        self.get("gzip")
+
+        with patch.object(compression, "compress") as compress:
+            response = self.get("gzip")
+
+        compress.assert_not_called()
+        self.assertEqual(gzip.decompress(response.content), self.plain)
+
+    def test_small_response(self):
+        """Ответ меньше COMPRESSION_MIN_SIZE не сжимается."""
+        ingredient = Ingredient.objects.first()
+
+        response = self.client.get(
+            f"/api/ingredients/{ingredient.id}/", HTTP_ACCEPT_ENCODING="gzip"
+        )
+
+        self.assertFalse(response.has_header("Content-Encoding"))
+        self.assertEqual(response.json()["id"], ingredient.id)
+
+
+class PaginationCountTests(TestCase):
+    """Число объектов в постраничных списках и его кэш."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.author = create_user("author")
+        for _ in range(5):
+            create_recipe(self.author)
+        cache = get_catalog_cache()
+        cache.delete(CATALOG_VERSION_KEY)
+        self.addCleanup(cache.delete, CATALOG_VERSION_KEY)
+
+    def get(self, url="/api/recipes/?limit=2"):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_exact_count(self):
+        """Точное число помечается count_approximate: false."""
+        data = self.get()
+
+        self.assertEqual(data["count"], 5)
+        self.assertIs(data["count_approximate"], False)
+
+    @override_settings(PAGINATION_EXACT_COUNT_LIMIT=3)
+    def test_approximate_count(self):
+        """Сверх порога берется оценка и ставится флаг."""
+        other = create_user("other")
+        with patch.object(connections["default"], "vendor", "postgresql"):
+            with patch(
+                "api.paginations.estimate_count", return_value=4000
+            ):
+                data = self.get()
+                filtered = self.get(
+                    f"/api/recipes/?limit=2&author={other.id}"
+                )
+
+        self.assertEqual(data["count"], 4000)
+        self.assertIs(data["count_approximate"], True)
+        self.assertEqual(filtered["count"], 0)
+        self.assertIs(filtered["count_approximate"], False)
+
+    @override_settings(PAGINATION_COUNT_CACHE_TIMEOUT=60)
+    def test_count_cache(self):
+        """Число берется из кэша до смены версии каталога."""
+        with patch(
+            "api.paginations.count_queryset", wraps=count_queryset
+        ) as counter:
+            self.get()
+            self.get()
+            self.assertEqual(counter.call_count, 1)
+
+            bump_catalog_version()
+            self.assertEqual(self.get()["count"], 5)
+            self.assertEqual(counter.call_count, 2)
+
+    def test_user_update_keeps_catalog(self):
+        """Сохранение пользователя без создания не сбрасывает каталог."""
+        with self.captureOnCommitCallbacks() as callbacks:
+            invalidate_catalog(CustomUser, instance=self.author, created=False)
+        self.assertEqual(callbacks, [])
+
+        for sender, created in ((CustomUser, True), (Recipe, False)):
+            with self.subTest(sender=sender, created=created):
+                with self.captureOnCommitCallbacks() as callbacks:
+                    invalidate_catalog(sender, created=created)
+                self.assertEqual(callbacks, [bump_catalog_version])
+
+
+class RecipeSuggestTests(TestCase):
+    """Подсказки названий рецептов /api/recipes/suggest/."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.author = create_user("author")
+        self.soup = create_recipe(self.author, name="Борщ", popularity=1)
+        self.green = create_recipe(
+            self.author, name="Зеленый борщ", popularity=5
+        )
+        self.porridge = create_recipe(self.author, name="Овсяная каша")
+        recipe_suggest.build_recipe_name_index()
+        self.addCleanup(setattr, recipe_suggest, "_index", None)
+
+    def suggest(self, query, limit=10):
+        response = self.client.get(
+            "/api/recipes/suggest/", {"q": query, "limit": limit}
+        )
+        self.assertEqual(response.status_code, 200)
+        return [recipe["id"] for recipe in response.json()]
+
+    def test_order(self):
+        """Порядок по популярности, совпадение со слова весит вдвое меньше."""
+        self.assertEqual(self.suggest("бор"), [self.green.id, self.soup.id])
+        self.assertEqual(self.suggest("Бор", limit=1), [self.green.id])
+        self.assertEqual(self.suggest("каш"), [self.porridge.id])
+        self.assertEqual(self.suggest(" "), [])
+
+    def test_add_and_remove(self):
+        """Сохраненные и удаленные рецепты видны сразу после фиксации."""
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe = create_recipe(self.author, name="Борщевик")
+        self.assertIn(recipe.id, self.suggest("борщ"))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe.name = "Щи"
+            recipe.save()
+        self.assertNotIn(recipe.id, self.suggest("борщ"))
+        self.assertEqual(self.suggest("щи"), [recipe.id])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.soup.delete()
+        self.assertEqual(self.suggest("борщ"), [self.green.id])
+
+    def test_stale_index(self):
+        """Устаревший индекс отвечает, пока перестраивается в фоне."""
+        index = recipe_suggest._index
+        index.built_at -= settings.RECIPE_SUGGEST_INDEX_TIMEOUT
+
+        with patch.object(recipe_suggest, "rebuild_in_background") as rebuild:
+            self.assertIs(recipe_suggest.get_recipe_name_index(), index)
+
+        rebuild.assert_called_once_with()
+
+    def test_changes_during_rebuild(self):
+        """Изменения за время перестройки попадают в новый индекс."""
+        build = recipe_suggest.RecipeNameIndex
+
+        def build_and_delete(rows):
+            index = build(rows)
+            # Рецепт удаляется, пока строится новый индекс.
+            recipe_suggest.apply_change(
+                lambda index: index.remove(self.soup.id)
+            )
+            return index
+
+        with patch.object(
+            recipe_suggest, "RecipeNameIndex", side_effect=build_and_delete
+        ):
+            recipe_suggest.rebuild_recipe_name_index()
+
+        self.assertEqual(self.suggest("борщ"), [self.green.id])
+        self.assertIsNone(recipe_suggest._pending)
+
+
+class IngredientSearchTests(TestCase):
+    """Поиск ингредиентов ?search= в памяти и выбор пути поиска."""
+
+    def setUp(self):
+        self.client = APIClient()
+        Ingredient.objects.create(name="Свёкла отварная", measurement_unit="г")
+        Ingredient.objects.create(name="сок свекольный", measurement_unit="мл")
+        ingredient_search.build_ingredient_index()
+        self.addCleanup(setattr, ingredient_search, "_index", None)
+
+    def search(self, query):
+        response = self.client.get("/api/ingredients/", {"search": query})
+        self.assertEqual(response.status_code, 200)
+        return [row["name"] for row in response.json()]
+
+    def test_yo(self):
+        """ё и е, регистр и разделители не влияют на поиск."""
+        for query in ("свекл", "СВЁКЛ", "свекла-отварная"):
+            with self.subTest(query=query):
+                self.assertEqual(self.search(query)[0], "Свёкла отварная")
+
+        self.assertEqual(
+            self.search("свёкольный"), ["сок свекольный"]
+        )
+
+    @override_settings(INGREDIENT_SEARCH_BACKEND="database")
+    def test_database_backend(self):
+        """С INGREDIENT_SEARCH_BACKEND=database индекс в памяти не нужен."""
+        with patch(
+            "api.ingredient_search.search_in_database",
+            side_effect=lambda queryset, query, limit: queryset[:1]
+        ) as search, patch(
+            "api.ingredient_search.get_ingredient_index"
+        ) as get_index:
+            self.assertEqual(len(self.search("свекла")), 1)
+
+        self.assertEqual(search.call_args.args[1:], ("свекла", 20))
+        get_index.assert_not_called()
+
+    def test_backend_check(self):
+        """database без PostgreSQL — ошибка api.E002."""
+        for backend, engine, errors in (
+            ("memory", "django.db.backends.sqlite3", []),
+            ("database", "django.db.backends.postgresql", []),
+            ("database", "django.db.backends.sqlite3", ["api.E002"]),
+            ("trigram", "django.db.backends.postgresql", ["api.E002"]),
+        ):
+            with self.subTest(backend=backend, engine=engine):
+                with override_settings(INGREDIENT_SEARCH_BACKEND=backend):
+                    with patch.dict(
+                        settings.DATABASES["default"], ENGINE=engine
+                    ):
+                        self.assertEqual(
+                            [error.id for error in
+                             check_ingredient_search_backend(None)],
+                            errors
+                        )
+
+
+class IncrementalWatermarkTests(TestCase):
+    """Инкрементальные пересчеты не теряют поздно зафиксированные строки."""
+
+    def setUp(self):
+        self.author = create_user("author")
+        self.users = [create_user(f"user{number}") for number in range(2)]
+        self.recipes = [create_recipe(self.author) for _ in range(3)]
+
+    def add_late_favorite(self, run):
+        """Избранное с меньшим id становится видно после запуска run."""
+        Favorite.objects.create(user=self.users[0], recipe=self.recipes[0])
+        late = Favorite.objects.create(
+            user=self.users[0], recipe=self.recipes[1]
+        )
+        Favorite.objects.create(user=self.users[1], recipe=self.recipes[0])
+        # Строка late еще не зафиксирована во время запуска.
+        late_id = late.id
+        late.delete()
+        result = run()
+        self.assertEqual(result.favorite_pending, [late_id])
+
+        Favorite.objects.create(
+            id=late_id, user=self.users[0], recipe=self.recipes[1]
+        )
+
+    def test_trending(self):
+        """Поздняя строка учитывается следующим запуском ровно один раз."""
+        update_scores()
+        self.add_late_favorite(update_scores)
+
+        self.assertEqual(update_scores().favorite_pending, [])
+        update_scores()
+
+        self.assertEqual(
+            [recipe.popularity for recipe in Recipe.objects.filter(
+                pk__in=[recipe.pk for recipe in self.recipes]
+            ).order_by("pk")],
+            [2, 1, 0]
+        )
+
+    def test_neighbors(self):
+        """Рецепт с поздней строкой пересчитывается следующим запуском."""
+        build_neighbors()
+        self.add_late_favorite(build_neighbors)
+
+        build = build_neighbors()
+
+        self.assertEqual(build.recipes, 1)
+        self.assertEqual(build.favorite_pending, [])
+        self.assertTrue(
+            RecipeNeighbor.objects.filter(recipe=self.recipes[1]).exists()
+        )
+
+
+class FindDuplicatesTests(TestCase):
+    """Поиск дубликатов рецептов по составу."""
+
+    def setUp(self):
+        author = create_user("author")
+        ingredients = [
+            Ingredient.objects.create(name=name, measurement_unit="г")
+            for name in ("картофель", "морковь", "лук")
+        ]
+        self.recipes = [create_recipe(author) for _ in range(3)]
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(recipe=recipe, ingredient=ingredient, amount=1)
+            for recipe in self.recipes
+            for ingredient in ingredients
+        )
+        duplicates.update_signatures()
+
+    def test_recipe_deleted_after_candidate_pairs(self):
+        """Рецепт, удаленный после выбора пар, пропускается."""
+        get_candidate_pairs = duplicates.get_candidate_pairs
+
+        def delete_after_pairs():
+            pairs = get_candidate_pairs()
+            self.recipes[1].delete()
+            return pairs
+
+        with patch.object(
+            duplicates, "get_candidate_pairs", delete_after_pairs
+        ):
+            clusters = duplicates.find_duplicates(0.9)
+
+        self.assertEqual(
+            clusters, [[self.recipes[0].pk, self.recipes[2].pk]]
+        )
@@ -2,7 +2,7 @@ from django.urls import include, path
 from rest_framework import routers
 
 from api.views import (CustomUserViewSet, IngredientViewSet, RecipeViewSet,
-                       TagViewSet)
+                       SyncView, TagViewSet)
 
 
 app_name = "api"
@@ -17,4 +17,5 @@ router.register("users", CustomUserViewSet)
 urlpatterns = [
     path("", include(router.urls)),
     path("auth/", include("djoser.urls.authtoken")),
+    path("sync/", SyncView.as_view(), name="sync"),
 ]
@@ -1,3 +1,24 @@
+from operator import itemgetter
+
+from django.conf import settings
+from django.db.models import (BooleanField, Case, Count, Exists, IntegerField,
+                              OuterRef, Prefetch, Q, Subquery, Sum, Value,
+                              When)
+from rest_framework.exceptions import ValidationError
+
+from api.catalog import get_catalog_cache, get_catalog_key
+from api.metrics import observe_cache
+from recipes.models import (MIN_COOKING_TIME, Favorite, Recipe, RecipeBand,
+                            RecipeIngredient, ShoppingCart, Tag,
+                            get_tags_mask)
+from users.models import CustomUser, Subscriptions
+
+# Поля краткого рецепта, как в PostFavoriteShoppingSerializer.
+SHORT_RECIPE_FIELDS = ("id", "name", "image", "cooking_time")
+# Фильтры по тегам, которые фасеты применяют к группам в Python.
+TAG_FILTERS = ("tags", "tags_all")
+
+
 def get_shopping_list(ingredients):
     """Создать список покупок для передачи в файл."""
     shopping_dict = {}
@@ -24,3 +45,252 @@ def get_shopping_list(ingredients):
         )
 
     return output_ingredients
+
+
+def get_sparse_fields(request, fields, default=None):
+    """Поля ответа с учетом параметров запроса ?fields= и ?omit=."""
+    requested = request.query_params.get("fields")
+    omitted = request.query_params.get("omit")
+    if requested:
+        selected = set(requested.split(","))
+    else:
+        selected = set(fields if default is None else default)
+    excluded = set(omitted.split(",")) if omitted else set()
+
+    unknown = (selected | excluded) - set(fields)
+    if unknown:
+        raise ValidationError({
+            "fields": f"Неизвестные поля: {', '.join(sorted(unknown))}."
+        })
+
+    return tuple(field for field in fields if field in selected - excluded)
+
+
+def get_requested_ids(request):
+    """id из параметра ?ids= без повторов в порядке запроса или None."""
+    value = request.query_params.get("ids")
+    if value is None:
+        return None
+    try:
+        ids = list(dict.fromkeys(
+            int(item) for item in value.split(",") if item.strip()
+        ))
+    except ValueError:
+        raise ValidationError({"ids": "Ожидаются целые числа через запятую."})
+    if len(ids) > settings.BATCH_MAX_IDS:
+        raise ValidationError({
+            "ids": f"Не больше {settings.BATCH_MAX_IDS} id за запрос."
+        })
+
+    return ids
+
+
+def order_by_ids(objects, ids, get_id=itemgetter("id")):
+    """Объекты в порядке ids и id, для которых объектов нет."""
+    by_id = {get_id(obj): obj for obj in objects}
+    return (
+        [by_id[pk] for pk in ids if pk in by_id],
+        [pk for pk in ids if pk not in by_id],
+    )
+
+
+def get_limit(request, default, maximum):
+    """Число объектов из параметра ?limit= в пределах от 1 до maximum."""
+    value = request.query_params.get("limit", default)
+    try:
+        limit = int(value)
+    except ValueError:
+        raise ValidationError({"limit": "Ожидается целое число."})
+
+    return min(max(limit, 1), maximum)
+
+
+def annotate_is_subscribed(queryset, user):
+    """Добавить к пользователям признак подписки текущего пользователя."""
+    if not user.is_authenticated:
+        return queryset.annotate(is_subscribed=Value(False, BooleanField()))
+
+    return queryset.annotate(
+        is_subscribed=Exists(
+            Subscriptions.objects.filter(user=user, author=OuterRef("pk"))
+        )
+    )
+
+
+def annotate_recipe_flags(queryset, user):
+    """Добавить к рецептам признаки избранного и списка покупок."""
+    if not user.is_authenticated:
+        return queryset.annotate(
+            is_favorited=Value(False, BooleanField()),
+            is_in_shopping_cart=Value(False, BooleanField())
+        )
+
+    return queryset.annotate(
+        is_favorited=Exists(
+            Favorite.objects.filter(user=user, recipe=OuterRef("pk"))
+        ),
+        is_in_shopping_cart=Exists(
+            ShoppingCart.objects.filter(user=user, recipe=OuterRef("pk"))
+        )
+    )
+
+
+def get_recipe_queryset(user):
+    """Рецепты со всеми связанными данными для RecipeSerializer."""
+    return annotate_recipe_flags(
+        Recipe.objects.defer("ingredients_minhash").prefetch_related(
+            Prefetch(
+                "author",
+                queryset=annotate_is_subscribed(CustomUser.objects.all(), user)
+            ),
+            "tags",
+            Prefetch(
+                "ingredients_list",
+                queryset=RecipeIngredient.objects.select_related(
+                    "ingredient"
+                ).order_by("pk")
+            )
+        ),
+        user
+    )
+
+
+def get_subscriptions_queryset(queryset, user, recipes_limit=None,
+                               recipes=None, fields=None):
+    """Авторы с числом рецептов и рецептами для SubscriptionsSerializer."""
+    if fields is None:
+        fields = ("is_subscribed", "recipes", "recipes_count")
+    if "is_subscribed" in fields:
+        queryset = annotate_is_subscribed(queryset, user)
+    if "recipes_count" in fields:
+        queryset = queryset.annotate(
+            recipes_count=Count("recipes", distinct=True)
+        )
+    if "recipes" not in fields:
+        return queryset
+
+    if recipes is None:
+        recipes = Recipe.objects.all()
+    if recipes_limit:
+        recipes = recipes.filter(pk__in=Subquery(
+            Recipe.objects.filter(
+                author=OuterRef("author")
+            ).values("pk")[:recipes_limit]
+        ))
+
+    return queryset.prefetch_related(Prefetch("recipes", queryset=recipes))
+
+
+def get_facet_queryset(queryset):
+    """GROUP BY рецептов по маске тегов и интервалу времени приготовления."""
+    bounds = settings.FACETS_COOKING_TIME_BUCKETS
+    return queryset.order_by().annotate(
+        bucket=Case(
+            *(
+                When(cooking_time__lte=bound, then=Value(index))
+                for index, bound in enumerate(bounds)
+            ),
+            default=Value(len(bounds)),
+            output_field=IntegerField()
+        )
+    ).values("tags_mask", "bucket").annotate(
+        count=Count("id")
+    ).values_list("tags_mask", "bucket", "count")
+
+
+def get_facet_groups(queryset):
+    """Число рецептов по сочетаниям маски тегов и интервала времени.
+
+    С FACETS_CACHE_TIMEOUT результат кэшируется по SQL запроса до смены
+    версии каталога.
+    """
+    groups = get_facet_queryset(queryset)
+    timeout = settings.FACETS_CACHE_TIMEOUT
+    key = get_catalog_key("facets", groups) if timeout else None
+    if key is None:
+        return list(groups)
+
+    cache = get_catalog_cache()
+    cached = cache.get(key)
+    observe_cache("facets", cached is not None)
+    if cached is None:
+        cached = list(groups)
+        cache.set(key, cached, timeout)
+    return cached
+
+
+def get_recipe_facets(filterset):
+    """Число рецептов по тегам и интервалам времени приготовления.
+
+    Фильтры по тегам применяются к группам уже после запроса. Число
+    у тега показывает, сколько рецептов даст его выбор при остальных
+    фильтрах и ?tags_all=; итог и интервалы учитывают все фильтры.
+    """
+    data = filterset.form.cleaned_data
+    queryset = filterset.queryset
+    for name, value in data.items():
+        if name not in TAG_FILTERS:
+            queryset = filterset.filters[name].filter(queryset, value)
+    groups = get_facet_groups(queryset)
+
+    any_mask = get_tags_mask(data.get("tags") or ())
+    all_mask = get_tags_mask(data.get("tags_all") or ())
+    groups = [
+        (mask, bucket, count) for mask, bucket, count in groups
+        if mask & all_mask == all_mask
+    ]
+
+    tags = []
+    for tag in Tag.objects.values("id", "name", "color", "slug", "bit"):
+        bit = 1 << tag.pop("bit")
+        tag["count"] = sum(
+            count for mask, _, count in groups if mask & bit
+        )
+        tags.append(tag)
+
+    bounds = settings.FACETS_COOKING_TIME_BUCKETS
+    buckets = [
+        {"min": lower + 1, "max": upper, "count": 0}
+        for lower, upper in zip(
+            (MIN_COOKING_TIME - 1, *bounds), (*bounds, None)
+        )
+    ]
+    for mask, bucket, count in groups:
+        if not any_mask or mask & any_mask:
+            buckets[bucket]["count"] += count
+
+    return {
+        "count": sum(bucket["count"] for bucket in buckets),
+        "tags": tags,
+        "cooking_time": buckets,
+    }
+
+
+def get_recommended_recipes(user):
+    """Рекомендации пользователю по соседям его избранного и покупок.
+
+    Близость соседей суммируется, уже добавленные рецепты исключаются.
+    """
+    favorites = Favorite.objects.filter(user=user).values("recipe_id")
+    carts = ShoppingCart.objects.filter(user=user).values("recipe_id")
+    return Recipe.objects.filter(
+        Q(neighbor_of__recipe_id__in=favorites)
+        | Q(neighbor_of__recipe_id__in=carts)
+    ).exclude(pk__in=favorites).exclude(pk__in=carts).values(
+        *SHORT_RECIPE_FIELDS
+    ).annotate(score=Sum("neighbor_of__score")).order_by("-score", "id")
+
+
+def get_same_ingredients_recipes(recipe_id):
+    """Рецепты с похожим набором ингредиентов по корзинам LSH.
+
+    Сначала идут рецепты, совпавшие с исходным в большем числе полос
+    MinHash-сигнатуры.
+    """
+    return Recipe.objects.filter(
+        bands__bucket__in=RecipeBand.objects.filter(
+            recipe_id=recipe_id
+        ).values("bucket")
+    ).exclude(pk=recipe_id).values(*SHORT_RECIPE_FIELDS).annotate(
+        matched_bands=Count("bands")
+    ).order_by("-matched_bands", "id")
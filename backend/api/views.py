@@ -1,28 +1,50 @@
 from io import BytesIO
+from operator import attrgetter
 
-from django.db.models import Sum
-from django.http import FileResponse
+from django.conf import settings
+from django.http import FileResponse, HttpResponse
 from django.shortcuts import get_object_or_404
+from django.utils import timezone
 from django_filters.rest_framework import DjangoFilterBackend
+from django_filters.utils import translate_validation
+from djoser.compat import get_user_email
+from djoser.conf import settings as djoser_settings
 from djoser.views import UserViewSet
 from rest_framework import mixins, permissions, status, viewsets
 from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound
+from rest_framework.generics import get_object_or_404 as get_row_or_404
 from rest_framework.response import Response
+from rest_framework.views import APIView
 
+from api.fast_serializers import (RECIPE_FIELDS, RECIPE_SUMMARY_FIELDS,
+                                  get_recipe_columns, serialize_recipes,
+                                  serialize_short_recipes)
 from api.filters import IngredientFilter, RecipeFilter
-from api.paginations import CustomPagination
+from api.models import ShoppingListExport
+from api.paginations import CustomPagination, get_recipe_pagination_class
 from api.permissions import IsAuthorOrReadOnly
+from api.recipe_suggest import suggest_recipes
 from api.serializers import (CreateCustomUserSerializer,
                              CreateRecipeSerializer, CreateSubscribeSerializer,
                              CustomUserSerializer, IngredientSerializer,
                              PostFavoriteShoppingSerializer, RecipeSerializer,
-                             SetPasswordSerializer, SubscriptionsSerializer,
-                             TagSerializer)
-from api.utils import get_shopping_list
-from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
-                            ShoppingCart, Tag)
+                             SetPasswordSerializer,
+                             ShoppingListExportSerializer,
+                             SubscriptionsSerializer, TagSerializer)
+from api.shopping_list import get_cart_ingredients, start_export
+from api.sync import SyncExpired, get_since, get_sync_changes
+from api.utils import (SHORT_RECIPE_FIELDS, annotate_is_subscribed,
+                       annotate_recipe_flags, get_limit, get_recipe_facets,
+                       get_recipe_queryset, get_recommended_recipes,
+                       get_requested_ids, get_same_ingredients_recipes,
+                       get_shopping_list, get_sparse_fields,
+                       get_subscriptions_queryset, order_by_ids)
+from recipes.models import Favorite, Ingredient, Recipe, ShoppingCart, Tag
 from users.models import CustomUser, Subscriptions
 
+SHOPPING_LIST_FILENAME = "shopping_list.txt"
+
 
 class CreateListRetrieveViewSet(
     mixins.CreateModelMixin,
@@ -40,9 +62,24 @@ class CustomUserViewSet(UserViewSet):
     serializer_class = CustomUserSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
     pagination_class = CustomPagination
+    sparse_actions = ("list", "retrieve", "me", "subscriptions")
+    # Действия djoser с учетной записью: их данные проверяют сериализаторы
+    # djoser (uid и токен, email, текущий пароль).
+    djoser_actions = (
+        "activation",
+        "resend_activation",
+        "reset_password",
+        "reset_password_confirm",
+        "set_username",
+        "reset_username",
+        "reset_username_confirm",
+    )
 
     def get_serializer_class(self):
         """Получить сериализатор."""
+        if self.action in self.djoser_actions:
+            return super().get_serializer_class()
+
         serializer_classes = {
             "set_password": SetPasswordSerializer,
             "subscribe": SubscriptionsSerializer,
@@ -54,6 +91,49 @@ class CustomUserViewSet(UserViewSet):
 
         return serializer_classes.get(self.action, CreateCustomUserSerializer)
 
+    def get_sparse_fields(self):
+        """Поля ответа, выбранные параметрами ?fields= и ?omit=."""
+        return get_sparse_fields(
+            self.request, self.get_serializer_class().Meta.fields
+        )
+
+    def get_serializer(self, *args, **kwargs):
+        """Получить сериализатор только с выбранными полями."""
+        if self.action in self.sparse_actions:
+            kwargs.setdefault("fields", self.get_sparse_fields())
+
+        return super().get_serializer(*args, **kwargs)
+
+    def get_queryset(self):
+        """Получить пользователей с признаком подписки."""
+        queryset = super().get_queryset()
+
+        if self.action in ("list", "retrieve"):
+            fields = self.get_sparse_fields()
+            queryset = queryset.only(
+                "id", *(field for field in fields if field != "is_subscribed")
+            )
+            if "is_subscribed" in fields:
+                return annotate_is_subscribed(queryset, self.request.user)
+
+        return queryset
+
+    def list(self, request, *args, **kwargs):
+        """Список пользователей; с ?ids= — выбранные, без пагинации."""
+        ids = get_requested_ids(request)
+        if ids is None:
+            return super().list(request, *args, **kwargs)
+
+        users, missing = order_by_ids(
+            self.filter_queryset(self.get_queryset()).filter(pk__in=ids),
+            ids,
+            attrgetter("pk")
+        )
+        return Response({
+            "results": self.get_serializer(users, many=True).data,
+            "missing": missing,
+        })
+
     @action(
         detail=False,
         methods=["GET"],
@@ -83,6 +163,40 @@ class CustomUserViewSet(UserViewSet):
             status=status.HTTP_204_NO_CONTENT
         )
 
+    @action(detail=False, methods=["POST"])
+    def set_username(self, request):
+        """Сменить адрес почты, по которому входит пользователь.
+
+        djoser читает новое значение из new_username, а его сериализатор
+        при LOGIN_FIELD = "email" заполняет new_email.
+        """
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        return self.change_login(request.user, serializer)
+
+    @action(detail=False, methods=["POST"])
+    def reset_username_confirm(self, request):
+        """Сменить адрес почты по ссылке из письма."""
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        serializer.user.last_login = timezone.now()
+
+        return self.change_login(serializer.user, serializer)
+
+    def change_login(self, user, serializer):
+        """Сохранить новое значение поля входа пользователя."""
+        field = djoser_settings.LOGIN_FIELD
+        setattr(user, field, serializer.data[f"new_{field}"])
+        user.save()
+
+        if djoser_settings.USERNAME_CHANGED_EMAIL_CONFIRMATION:
+            djoser_settings.EMAIL.username_changed_confirmation(
+                self.request, {"user": user}
+            ).send([get_user_email(user)])
+
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
     @action(
         detail=True,
         methods=["POST"],
@@ -107,6 +221,15 @@ class CustomUserViewSet(UserViewSet):
         serializer.is_valid(raise_exception=True)
         Subscriptions.objects.create(user=request.user, author=author)
 
+        serializer = CreateSubscribeSerializer(
+            get_subscriptions_queryset(
+                CustomUser.objects.all(),
+                user,
+                recipes=get_recipe_queryset(user)
+            ).get(pk=author.pk),
+            context={"request": request}
+        )
+
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     @subscribe.mapping.delete
@@ -136,11 +259,15 @@ class CustomUserViewSet(UserViewSet):
     )
     def subscriptions(self, request):
         """Посмотреть список подписок."""
-        subscriptions = CustomUser.objects.filter(
-            recipe_author__user=request.user
-        )
-
-        if subscriptions:
+        recipes_limit = request.query_params.get("recipes_limit")
+        subscriptions = get_subscriptions_queryset(
+            CustomUser.objects.filter(recipe_author__user=request.user),
+            request.user,
+            recipes_limit=int(recipes_limit) if recipes_limit else None,
+            fields=self.get_sparse_fields()
+        ).order_by("id")
+
+        if subscriptions.exists():
             paginate_subscriptions = self.paginate_queryset(subscriptions)
             serializer = self.get_serializer(
                 paginate_subscriptions,
@@ -174,15 +301,76 @@ class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
 
 class RecipeViewSet(viewsets.ModelViewSet):
     """Вьюсет, позволяющий получать, создавать, изменять и удалять рецепты."""
-    queryset = Recipe.objects.select_related("author").prefetch_related(
-        "tags", "ingredients"
-    )
+    queryset = Recipe.objects.all()
     http_method_names = ["get", "post", "patch", "delete"]
     permission_classes = [IsAuthorOrReadOnly]
     pagination_class = CustomPagination
     filter_backends = [DjangoFilterBackend]
     filterset_class = RecipeFilter
 
+    def get_queryset(self):
+        """Получить рецепты со связанными данными для чтения."""
+
+        if self.action in ("list", "retrieve"):
+            return annotate_recipe_flags(
+                super().get_queryset(), self.request.user
+            )
+
+        if self.request.method in permissions.SAFE_METHODS:
+            return get_recipe_queryset(self.request.user)
+
+        return super().get_queryset()
+
+    @property
+    def paginator(self):
+        """Пагинатор; сортировки по оценкам листаются курсором."""
+        if not hasattr(self, "_paginator") and self.action == "list":
+            self._paginator = get_recipe_pagination_class(self.request)()
+        return super().paginator
+
+    def list(self, request, *args, **kwargs):
+        """Список рецептов через быстрый сериализатор строк.
+
+        С ?ids= отдаются выбранные рецепты в порядке запроса без пагинации
+        и список id, которых нет или которые не прошли фильтры.
+        """
+        fields = get_sparse_fields(
+            request,
+            RECIPE_FIELDS,
+            RECIPE_SUMMARY_FIELDS if settings.RECIPE_LIST_SUMMARY else None
+        )
+        queryset = self.filter_queryset(
+            self.get_queryset()
+        ).values(*get_recipe_columns(fields))
+
+        ids = get_requested_ids(request)
+        if ids is not None:
+            rows, missing = order_by_ids(queryset.filter(pk__in=ids), ids)
+            return Response({
+                "results": serialize_recipes(rows, request, fields),
+                "missing": missing,
+            })
+
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(
+                serialize_recipes(page, request, fields)
+            )
+
+        return Response(serialize_recipes(list(queryset), request, fields))
+
+    def retrieve(self, request, *args, **kwargs):
+        """Рецепт через быстрый сериализатор строк."""
+        fields = get_sparse_fields(request, RECIPE_FIELDS)
+        row = get_row_or_404(
+            self.filter_queryset(self.get_queryset()).values(
+                *get_recipe_columns(fields)
+            ),
+            pk=kwargs["pk"]
+        )
+
+        return Response(serialize_recipes([row], request, fields)[0])
+
     def get_serializer_class(self):
         """Получить сериализатор."""
 
@@ -191,6 +379,92 @@ class RecipeViewSet(viewsets.ModelViewSet):
 
         return CreateRecipeSerializer
 
+    @action(detail=True, methods=["GET"])
+    def similar(self, request, pk):
+        """Похожие рецепты по совместным добавлениям в избранное и покупки."""
+        limit = get_limit(
+            request,
+            settings.REST_FRAMEWORK["PAGE_SIZE"],
+            settings.NEIGHBORS_TOP_K
+        )
+        try:
+            recipe_id = int(pk)
+        except ValueError:
+            raise NotFound()
+
+        rows = list(
+            Recipe.objects.filter(
+                neighbor_of__recipe_id=recipe_id
+            ).order_by("-neighbor_of__score", "id").values(
+                *SHORT_RECIPE_FIELDS
+            )[:limit]
+        )
+        if not rows and not Recipe.objects.filter(pk=recipe_id).exists():
+            raise NotFound()
+
+        return Response(serialize_short_recipes(rows, request))
+
+    @action(detail=True, methods=["GET"])
+    def similar_ingredients(self, request, pk):
+        """Рецепты с почти тем же набором ингредиентов."""
+        limit = get_limit(
+            request,
+            settings.REST_FRAMEWORK["PAGE_SIZE"],
+            settings.NEIGHBORS_TOP_K
+        )
+        try:
+            recipe_id = int(pk)
+        except ValueError:
+            raise NotFound()
+
+        rows = list(get_same_ingredients_recipes(recipe_id)[:limit])
+        if not rows and not Recipe.objects.filter(pk=recipe_id).exists():
+            raise NotFound()
+
+        return Response(serialize_short_recipes(rows, request))
+
+    @action(
+        detail=False,
+        methods=["GET"],
+        permission_classes=[permissions.IsAuthenticated]
+    )
+    def recommended(self, request):
+        """Рекомендации по избранному и списку покупок пользователя."""
+        limit = get_limit(
+            request,
+            settings.REST_FRAMEWORK["PAGE_SIZE"],
+            settings.NEIGHBORS_TOP_K
+        )
+        rows = get_recommended_recipes(request.user)[:limit]
+
+        return Response(serialize_short_recipes(rows, request))
+
+    @action(detail=False, methods=["GET"])
+    def suggest(self, request):
+        """Подсказки названий рецептов по началу названия или слова."""
+        limit = get_limit(
+            request,
+            settings.RECIPE_SUGGEST_LIMIT,
+            settings.RECIPE_SUGGEST_MAX_LIMIT
+        )
+
+        return Response(
+            suggest_recipes(request.query_params.get("q", ""), limit)
+        )
+
+    @action(detail=False, methods=["GET"])
+    def facets(self, request):
+        """Число рецептов по тегам и времени приготовления при фильтрах."""
+        filterset = RecipeFilter(
+            request.query_params,
+            queryset=Recipe.objects.all(),
+            request=request
+        )
+        if not filterset.is_valid():
+            raise translate_validation(filterset.errors)
+
+        return Response(get_recipe_facets(filterset))
+
     @action(
         detail=True,
         methods=["POST"],
@@ -213,8 +487,7 @@ class RecipeViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        favorite = Favorite.objects.create(user=user, recipe=recipe)
-        favorite.save()
+        Favorite.objects.create(user=user, recipe=recipe)
 
         serializer = PostFavoriteShoppingSerializer(
             recipe,
@@ -268,8 +541,7 @@ class RecipeViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        shopping_cart = ShoppingCart.objects.create(user=user, recipe=recipe)
-        shopping_cart.save()
+        ShoppingCart.objects.create(user=user, recipe=recipe)
 
         serializer = PostFavoriteShoppingSerializer(
             recipe,
@@ -308,18 +580,107 @@ class RecipeViewSet(viewsets.ModelViewSet):
     )
     def download_shopping_cart(self, request):
         """Создать файл с покупками."""
-        ingredients = RecipeIngredient.objects.filter(
-            recipe__shopping_recipe__user=request.user
-        ).values(
-            "ingredient__name",
-            "ingredient__measurement_unit"
-        ).annotate(amount=Sum("amount")).order_by("ingredient__name")
-
-        shopping_list = get_shopping_list(ingredients)
+        shopping_list = get_shopping_list(get_cart_ingredients(request.user))
         buffer = BytesIO(shopping_list.encode("utf8"))
 
         return FileResponse(
             buffer,
             as_attachment=True,
-            filename="shopping_list.txt"
+            filename=SHOPPING_LIST_FILENAME
+        )
+
+    @action(
+        detail=False,
+        methods=["POST"],
+        url_path="download_shopping_cart/exports",
+        url_name="shopping-list-exports",
+        permission_classes=[permissions.IsAuthenticated]
+    )
+    def shopping_list_exports(self, request):
+        """Запустить сборку файла с покупками в фоне.
+
+        Пока корзина не изменилась, возвращается та же выгрузка.
+        """
+        export, created = start_export(request.user)
+        serializer = ShoppingListExportSerializer(
+            export,
+            context={"request": request}
         )
+
+        return Response(
+            serializer.data,
+            status=(
+                status.HTTP_202_ACCEPTED if created else status.HTTP_200_OK
+            )
+        )
+
+    @action(
+        detail=False,
+        methods=["GET"],
+        url_path=r"download_shopping_cart/exports/(?P<export_id>[0-9a-f-]+)",
+        url_name="shopping-list-export",
+        permission_classes=[permissions.IsAuthenticated]
+    )
+    def shopping_list_export(self, request, export_id):
+        """Состояние выгрузки списка покупок."""
+        export = get_row_or_404(
+            request.user.shopping_list_exports.all(), pk=export_id
+        )
+        serializer = ShoppingListExportSerializer(
+            export,
+            context={"request": request}
+        )
+
+        return Response(serializer.data)
+
+    @action(
+        detail=False,
+        methods=["GET"],
+        url_path=(
+            r"download_shopping_cart/exports/(?P<export_id>[0-9a-f-]+)/file"
+        ),
+        url_name="shopping-list-export-file",
+        permission_classes=[permissions.IsAuthenticated]
+    )
+    def shopping_list_export_file(self, request, export_id):
+        """Готовый файл с покупками.
+
+        За nginx файл отдается им по X-Accel-Redirect из внутреннего
+        расположения в media, без чтения в Python.
+        """
+        export = get_row_or_404(
+            request.user.shopping_list_exports.all(),
+            pk=export_id,
+            status=ShoppingListExport.DONE
+        )
+        if not settings.SHOPPING_LIST_ACCEL_REDIRECT:
+            return FileResponse(
+                export.file.open("rb"),
+                as_attachment=True,
+                filename=SHOPPING_LIST_FILENAME
+            )
+
+        response = HttpResponse(content_type="text/plain; charset=utf-8")
+        response["Content-Disposition"] = (
+            f'attachment; filename="{SHOPPING_LIST_FILENAME}"'
+        )
+        response["X-Accel-Redirect"] = export.file.url
+        return response
+
+
+class SyncView(APIView):
+    """Изменения рецептов, избранного, покупок и подписок после курсора."""
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        """Страница журнала изменений после ?since=."""
+        fields = get_sparse_fields(request, RECIPE_FIELDS)
+        try:
+            changes = get_sync_changes(request, get_since(request), fields)
+        except SyncExpired:
+            return Response(
+                "Журнал изменений сжат, нужна полная синхронизация.",
+                status=status.HTTP_410_GONE
+            )
+
+        return Response(changes)
@@ -0,0 +1,51 @@
+import logging
+
+from django.conf import settings
+from django.db import DatabaseError, connections
+from django.test import RequestFactory
+from django.urls import resolve
+
+from api.compression import get_compressed, get_encodings
+from api.ingredient_search import build_ingredient_index
+from api.recipe_suggest import build_recipe_name_index
+
+logger = logging.getLogger(__name__)
+
+# Справочники, одинаковые для всех клиентов.
+WARMUP_PATHS = ("/api/tags/", "/api/ingredients/")
+
+
+def warm_up():
+    """Прогреть кэши справочников до приема запросов.
+
+    Ответы рендерятся и сразу сжимаются, так что первые запросы берут
+    готовые сжатые тела из кэша; строятся индекс подсказок названий
+    рецептов и, если поиск ингредиентов идет в памяти, его индекс.
+    Прогрев не обязателен: если база недоступна или еще не мигрирована,
+    ошибка пишется в лог, а кэши заполнятся при первых запросах. Иначе
+    исключение в хуке gunicorn остановило бы мастер.
+    Соединения с базой закрываются, чтобы воркеры не унаследовали их
+    от мастера.
+    """
+    factory = RequestFactory()
+    sizes = {}
+    try:
+        for path in WARMUP_PATHS:
+            # Ответы DRF побайтно совпадают с ответами async-представлений.
+            match = resolve(path, urlconf="foodgram_backend.urls")
+            response = match.func(
+                factory.get(path), *match.args, **match.kwargs
+            )
+            response.render()
+            for encoding in get_encodings():
+                get_compressed(response.content, encoding)
+            sizes[path] = len(response.content)
+        if settings.INGREDIENT_SEARCH_BACKEND == "memory":
+            sizes["ingredient_index"] = len(build_ingredient_index())
+        sizes["recipe_name_index"] = len(build_recipe_name_index())
+    except DatabaseError as error:
+        logger.warning("Прогрев кэшей пропущен: %s", error)
+    finally:
+        connections.close_all()
+
+    return sizes
@@ -0,0 +1,22 @@
+#!/bin/sh
+# Перед gunicorn применяются миграции, воркер задач ждет, пока их применят.
+# depends_on не ждет готовности PostgreSQL, поэтому команда повторяется.
+set -e
+
+case "$*" in
+    gunicorn*) check="python manage.py migrate --noinput" ;;
+    *runworker*) check="python manage.py migrate --check" ;;
+    *) exec "$@" ;;
+esac
+
+attempts=0
+until $check; do
+    attempts=$((attempts + 1))
+    if [ "$attempts" -ge "${MIGRATE_ATTEMPTS:-30}" ]; then
+        echo "Миграции не применены за $attempts попыток" >&2
+        exit 1
+    fi
+    sleep 2
+done
+
+exec "$@"
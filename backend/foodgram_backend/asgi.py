@@ -9,8 +9,18 @@ https://docs.djangoproject.com/en/3.2/howto/deployment/asgi/
 
 import os
 
+from asgiref.sync import ThreadSensitiveContext
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'foodgram_backend.settings')
+os.environ.setdefault("DJANGO_ROOT_URLCONF", "foodgram_backend.urls_asgi")
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+
+async def application(scope, receive, send):
+    """ASGI-приложение с отдельным потоком синхронного кода на запрос."""
+    # Без контекста Django 3.2 выполняет синхронные middleware всех
+    # запросов в одном общем потоке.
+    async with ThreadSensitiveContext():
+        await django_application(scope, receive, send)
@@ -31,6 +31,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "api.metrics.MetricsMiddleware",
+    "api.compression.CompressionMiddleware",
+    "api.replicas.ReplicaMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -40,7 +43,8 @@ MIDDLEWARE = [
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
 
-ROOT_URLCONF = "foodgram_backend.urls"
+# В режиме ASGI asgi.py подключает маршруты с async-представлениями.
+ROOT_URLCONF = os.getenv("DJANGO_ROOT_URLCONF", "foodgram_backend.urls")
 
 TEMPLATES = [
     {
@@ -70,9 +74,42 @@ DATABASES = {
         "USER": os.getenv("POSTGRES_USER", "postgres"),
         "PASSWORD": os.getenv("POSTGRES_PASSWORD", "postgres"),
         "HOST": os.getenv("DB_HOST", "db"),
-        "PORT": os.getenv("DB_PORT", 5432)
+        "PORT": os.getenv("DB_PORT", 5432),
+        # Постоянные соединения: 0 закрывает соединение после запроса.
+        "CONN_MAX_AGE": int(os.getenv("DB_CONN_MAX_AGE", 60)),
+        # В режиме transaction pooling PgBouncer серверные курсоры
+        # не переживают транзакцию, поэтому их нужно отключить.
+        "DISABLE_SERVER_SIDE_CURSORS": (
+            os.getenv("DB_PGBOUNCER", "False") == "True"
+        ),
     }
 }
+# Проверять постоянное соединение перед каждым запросом.
+DB_CONN_HEALTH_CHECKS = os.getenv("DB_CONN_HEALTH_CHECKS", "True") == "True"
+
+# Реплики для чтения: адреса host[:port] PostgreSQL через пробел,
+# а для SQLite — пути к копиям файла базы.
+for number, replica in enumerate(os.getenv("DB_REPLICAS", "").split(), 1):
+    DATABASES[f"replica{number}"] = {
+        **DATABASES["default"],
+        "TEST": {"MIRROR": "default"},
+    }
+    if DATABASES["default"]["ENGINE"].endswith("sqlite3"):
+        DATABASES[f"replica{number}"]["NAME"] = replica
+    else:
+        host, _, port = replica.partition(":")
+        DATABASES[f"replica{number}"]["HOST"] = host
+        DATABASES[f"replica{number}"]["PORT"] = (
+            port or DATABASES["default"]["PORT"]
+        )
+
+DATABASE_ROUTERS = ["api.replicas.ReplicaRouter"]
+REPLICA_DATABASES = [alias for alias in DATABASES if alias != "default"]
+# Сколько секунд после записи клиент читает с основной базы.
+REPLICA_STICKY_SECONDS = int(os.getenv("REPLICA_STICKY_SECONDS", 5))
+REPLICA_MAX_LAG = float(os.getenv("REPLICA_MAX_LAG", 10))
+REPLICA_CHECK_INTERVAL = 5
+REPLICA_RETRY_SECONDS = 30
 
 # DATABASES = {
 #     "default": {
@@ -82,6 +119,15 @@ DATABASES = {
 # }
 
 
+CACHES = {
+    "default": {
+        "BACKEND": os.getenv(
+            "CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"
+        ),
+        "LOCATION": os.getenv("CACHE_LOCATION", ""),
+    }
+}
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         "NAME": "django.contrib.auth.password_validation"
@@ -130,6 +176,17 @@ REST_FRAMEWORK = {
         "rest_framework.authentication.TokenAuthentication",
     ],
 
+    "DEFAULT_RENDERER_CLASSES": [
+        "api.renderers.FastJSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ],
+
+    "DEFAULT_PARSER_CLASSES": [
+        "api.renderers.FastJSONParser",
+        "rest_framework.parsers.FormParser",
+        "rest_framework.parsers.MultiPartParser",
+    ],
+
     "DEFAULT_PAGINATION_CLASS":
         "rest_framework.pagination.PageNumberPagination",
     "PAGE_SIZE": 6,
@@ -137,10 +194,123 @@ REST_FRAMEWORK = {
 
 DJOSER = {
     "LOGIN_FIELD": "email",
+    # Ссылки из писем сброса пароля и имени пользователя; без них djoser
+    # отвечает на /users/reset_password/ и /users/reset_username/ ошибкой 500.
+    "PASSWORD_RESET_CONFIRM_URL": "password/reset/confirm/{uid}/{token}",
+    "USERNAME_RESET_CONFIRM_URL": "username/reset/confirm/{uid}/{token}",
     "PERMISSIONS": {
         "user": ["djoser.permissions.CurrentUserOrAdminOrReadOnly"],
         "user_list": ["rest_framework.permissions.IsAuthenticatedOrReadOnly"],
     },
 }
 
+# Краткое представление списка рецептов без text и ingredients.
+# Выключено для совместимости с текущим фронтендом и postman-коллекцией.
+RECIPE_LIST_SUMMARY = os.getenv("RECIPE_LIST_SUMMARY", "False") == "True"
+
+# Точный COUNT(*) для пагинации выполняется, пока совпадений не больше
+# порога; сверх него на PostgreSQL берется оценка планировщика. 0 — всегда
+# точно.
+PAGINATION_EXACT_COUNT_LIMIT = int(
+    os.getenv("PAGINATION_EXACT_COUNT_LIMIT", 10000)
+)
+# Кэши по сигнатуре фильтра, сбрасываемые сменой версии каталога при любой
+# записи в рецепты и пользователей. Требуют общего для воркеров кэша
+# (CACHE_BACKEND); 0 — выключен.
+CATALOG_CACHE = "default"
+PAGINATION_COUNT_CACHE_TIMEOUT = int(
+    os.getenv("PAGINATION_COUNT_CACHE_TIMEOUT", 0)
+)
+FACETS_CACHE_TIMEOUT = int(os.getenv("FACETS_CACHE_TIMEOUT", 0))
+# Верхние границы интервалов времени приготовления в фасетах, минуты.
+FACETS_COOKING_TIME_BUCKETS = (15, 30, 60, 120)
+
+# Похожие рецепты: сколько соседей хранится у рецепта и веса добавления
+# в избранное и в список покупок в матрице пользователь × рецепт.
+NEIGHBORS_TOP_K = int(os.getenv("NEIGHBORS_TOP_K", 20))
+NEIGHBORS_FAVORITE_WEIGHT = 1.0
+NEIGHBORS_CART_WEIGHT = 0.5
+
+# Трендовость: добавления в избранное и покупки с весами, затухающие
+# вдвое за TRENDING_HALF_LIFE_HOURS часов.
+TRENDING_HALF_LIFE_HOURS = float(os.getenv("TRENDING_HALF_LIFE_HOURS", 72))
+TRENDING_FAVORITE_WEIGHT = 1.0
+TRENDING_CART_WEIGHT = 0.5
+
+# Нечеткий поиск ингредиентов ?search=: сколько результатов отдавать,
+# минимальная доля триграмм запроса в слове названия, где искать
+# (database — через pg_trgm, только PostgreSQL; memory — по индексу в памяти
+# процесса) и сколько секунд живет индекс в памяти.
+INGREDIENT_SEARCH_LIMIT = 20
+INGREDIENT_SEARCH_THRESHOLD = 0.5
+INGREDIENT_SEARCH_BACKEND = os.getenv(
+    "INGREDIENT_SEARCH_BACKEND",
+    "database" if DATABASES["default"]["ENGINE"].endswith("postgresql")
+    else "memory"
+)
+INGREDIENT_SEARCH_INDEX_TIMEOUT = int(
+    os.getenv("INGREDIENT_SEARCH_INDEX_TIMEOUT", 300)
+)
+
+# Сколько id можно передать в ?ids= списков рецептов и пользователей.
+BATCH_MAX_IDS = 100
+
+# Подсказки названий рецептов: сколько отдавать по умолчанию и максимум,
+# вес совпадения с начала не первого слова относительно начала названия
+# и сколько секунд живет индекс в памяти процесса до перестройки.
+RECIPE_SUGGEST_LIMIT = 10
+RECIPE_SUGGEST_MAX_LIMIT = 50
+RECIPE_SUGGEST_WORD_WEIGHT = 0.5
+RECIPE_SUGGEST_INDEX_TIMEOUT = int(
+    os.getenv("RECIPE_SUGGEST_INDEX_TIMEOUT", 600)
+)
+
+# Синхронизация /api/sync/: сколько записей журнала в странице и сколько
+# дней хранить записи до сжатия командой compactchanges.
+SYNC_PAGE_SIZE = 500
+SYNC_CHANGES_RETENTION_DAYS = int(
+    os.getenv("SYNC_CHANGES_RETENTION_DAYS", 30)
+)
+
+# Фоновые задачи (runworker): с TASKS_EAGER=True задачи выполняются сразу
+# в запросе, без очереди. Повторы упавшей задачи идут с задержкой
+# TASK_RETRY_BACKOFF * 2 ** (попытка - 1), но не больше
+# TASK_RETRY_MAX_BACKOFF секунд; задача, не завершенная за TASK_TIMEOUT
+# секунд, возвращается в очередь.
+TASKS_EAGER = os.getenv("TASKS_EAGER", "False") == "True"
+TASK_MAX_ATTEMPTS = 5
+TASK_RETRY_BACKOFF = 10
+TASK_RETRY_MAX_BACKOFF = 3600
+TASK_TIMEOUT = 3600
+TASK_POLL_INTERVAL = 1
+TASK_WORKER_CONCURRENCY = int(os.getenv("TASK_WORKER_CONCURRENCY", 2))
+TASK_RETENTION_DAYS = 7
+# Периодические задачи: ключ -> (задача, интервал в секундах, аргументы).
+# Следующий запуск ставится через интервал после завершения предыдущего.
+TASK_PERIODIC = {
+    "update-trending": ("recipes.update_trending", 300, {}),
+    "update-trending-full": (
+        "recipes.update_trending", 86400, {"full": True}
+    ),
+    "build-neighbors": ("recipes.build_neighbors", 600, {}),
+    "build-neighbors-full": (
+        "recipes.build_neighbors", 86400, {"full": True}
+    ),
+    "update-signatures": ("recipes.update_signatures", 3600, {}),
+    "compact-changes": ("recipes.compact_changes", 86400, {}),
+    "cleanup-tasks": ("api.cleanup_tasks", 86400, {}),
+}
+
+# Готовые выгрузки списка покупок отдает nginx по X-Accel-Redirect из
+# внутреннего расположения /media/shopping_lists/; без nginx (runserver)
+# файл отдает Django.
+SHOPPING_LIST_ACCEL_REDIRECT = (
+    os.getenv("SHOPPING_LIST_ACCEL_REDIRECT", "False") == "True"
+)
+
+# Ответы меньше порога не сжимаются: выигрыш не окупает заголовки.
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", 1024))
+COMPRESSION_CACHE = "default"
+COMPRESSION_CACHE_TIMEOUT = 600
+
 CSV_FILES_DIR = os.path.join(BASE_DIR, 'data')
@@ -1,8 +1,11 @@
 from django.contrib import admin
 from django.urls import include, path
 
+from api.metrics import metrics_view
+
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path("metrics", metrics_view, name="metrics"),
     # path('api/auth/', include('djoser.urls')),
     # path('api/auth/', include('djoser.urls.authtoken')),
     path("api/", include("api.urls")),
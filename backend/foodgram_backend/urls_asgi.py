@@ -0,0 +1,13 @@
+from django.urls import path
+
+from api.async_views import ingredient_list, recipe_list, tag_list
+from foodgram_backend.urls import urlpatterns as wsgi_urlpatterns
+
+# Списки с большим числом обращений обслуживают async-представления,
+# остальные маршруты совпадают с WSGI.
+urlpatterns = [
+    path("api/recipes/", recipe_list),
+    path("api/tags/", tag_list),
+    path("api/ingredients/", ingredient_list),
+    *wsgi_urlpatterns,
+]
@@ -0,0 +1,126 @@
+import math
+import os
+import shutil
+
+
+def get_cpu_count():
+    """Число доступных процессу CPU с учетом квоты cgroup контейнера."""
+    try:
+        count = len(os.sched_getaffinity(0))
+    except AttributeError:
+        count = os.cpu_count() or 1
+
+    quota_files = (
+        ("/sys/fs/cgroup/cpu.max", None),
+        (
+            "/sys/fs/cgroup/cpu/cpu.cfs_quota_us",
+            "/sys/fs/cgroup/cpu/cpu.cfs_period_us",
+        ),
+    )
+    for quota_file, period_file in quota_files:
+        try:
+            with open(quota_file) as file:
+                values = file.read().split()
+            if period_file:
+                with open(period_file) as file:
+                    values.append(file.read().strip())
+        except OSError:
+            continue
+        if values[0] not in ("max", "-1"):
+            quota = math.ceil(int(values[0]) / int(values[1]))
+            return max(1, min(count, quota))
+        break
+
+    return count
+
+
+def prepare_metrics_dir():
+    """Очистить каталог метрик от прошлого запуска.
+
+    Вызывается при чтении конфигурации, до загрузки приложения: с
+    preload_app мастер импортирует api.metrics и открывает свои файлы
+    метрик раньше хука on_starting. При перечитывании конфигурации по HUP
+    мастер уже держит эти файлы, поэтому каталог очищается один раз.
+    """
+    path = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+    if not path or os.getenv(METRICS_DIR_OWNER) == str(os.getpid()):
+        return
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(path, exist_ok=True)
+    os.environ[METRICS_DIR_OWNER] = str(os.getpid())
+
+
+# Мастер, который уже очистил каталог метрик.
+METRICS_DIR_OWNER = "FOODGRAM_METRICS_DIR_OWNER"
+
+prepare_metrics_dir()
+cpu_count = get_cpu_count()
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:8000")
+
+# sync, gthread, gevent, eventlet или uvicorn.workers.UvicornWorker
+# (режим ASGI с async-представлениями списков).
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "gthread")
+if worker_class == "sync":
+    default_workers, default_threads = 2 * cpu_count + 1, 1
+elif worker_class == "gthread":
+    default_workers, default_threads = cpu_count + 1, 4
+else:
+    # Асинхронные воркеры держат много соединений в одном процессе.
+    default_workers, default_threads = cpu_count, 1
+if worker_class.startswith("uvicorn"):
+    wsgi_app = "foodgram_backend.asgi:application"
+else:
+    wsgi_app = "foodgram_backend.wsgi:application"
+workers = int(os.getenv("GUNICORN_WORKERS", default_workers))
+threads = int(os.getenv("GUNICORN_THREADS", default_threads))
+worker_connections = int(os.getenv("GUNICORN_WORKER_CONNECTIONS", 1000))
+
+# Приложение и прогретые кэши загружаются в мастере до fork
+# и разделяются воркерами через copy-on-write.
+preload_app = os.getenv("GUNICORN_PRELOAD", "True") == "True"
+
+# Перезапуск воркеров ограничивает рост памяти; разброс не дает
+# всем воркерам перезапуститься одновременно.
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", 1000))
+max_requests_jitter = int(os.getenv("GUNICORN_MAX_REQUESTS_JITTER", 100))
+
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 30))
+graceful_timeout = 30
+# Дольше keepalive_timeout в upstream nginx (60 с), чтобы соединение
+# закрывал nginx, а не gunicorn посреди отправки запроса.
+# Синхронные воркеры keep-alive не поддерживают.
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", 75))
+# Файлы сердцебиения воркеров в памяти, а не на overlayfs контейнера.
+worker_tmp_dir = "/dev/shm" if os.path.isdir("/dev/shm") else None
+
+
+def when_ready(server):
+    """Прогреть кэши в мастере до запуска воркеров."""
+    if server.cfg.preload_app:
+        from api.warmup import warm_up
+
+        server.log.info("Прогрев кэшей: %s", warm_up())
+
+
+def post_fork(server, worker):
+    """Учесть запущенный воркер в метриках."""
+    from api.metrics import GUNICORN_WORKERS
+
+    GUNICORN_WORKERS.set(1)
+
+
+def post_worker_init(worker):
+    """Без preload каждый воркер прогревает кэши сам до приема запросов."""
+    if not worker.cfg.preload_app:
+        from api.warmup import warm_up
+
+        warm_up()
+
+
+def child_exit(server, worker):
+    """Удалить метрики завершившегося воркера."""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(worker.pid)
@@ -1,7 +1,9 @@
 from django.contrib.admin import ModelAdmin, TabularInline, register
+from django.db.models import Count
 
 from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
                             ShoppingCart, Tag)
+from recipes.tasks import enqueue_minhash_update
 
 
 @register(Ingredient)
@@ -24,10 +26,21 @@ class RecipeAdmin(ModelAdmin):
     filter_horizontal = ('tags',)
     inlines = (RecipeIngredientInline,)
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related(
+            "author"
+        ).annotate(favorites_count=Count("favorite_recipe"))
+
     def get_favorites(self, obj):
-        return obj.favorite_recipe.count()
+        return obj.favorites_count
+
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        form.instance.update_tags_mask()
+        enqueue_minhash_update(form.instance)
 
     get_favorites.short_description = "Количество добавлений"
+    get_favorites.admin_order_field = "favorites_count"
 
 
 @register(Tag)
@@ -5,3 +5,8 @@ class RecipesConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "recipes"
     verbose_name = "Каталог рецептов"
+
+    def ready(self):
+        from recipes.changes import connect_change_log
+
+        connect_change_log()
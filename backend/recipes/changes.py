@@ -0,0 +1,172 @@
+from datetime import timedelta
+
+from django.db import connections, router, transaction
+from django.db.models import F, Max, Subquery
+from django.db.models.functions import Coalesce
+from django.db.models.signals import post_delete, post_init, post_save
+from django.utils import timezone
+
+from recipes.models import (Change, ChangeLogCompaction, Favorite, Recipe,
+                            ShoppingCart)
+from users.models import CustomUser, Subscriptions
+
+# Поля рецепта, которых нет в ответах API: их сохранение не попадает
+# в журнал.
+INTERNAL_RECIPE_FIELDS = {
+    "ingredients_minhash", "popularity", "trending_score", "updated_at"
+}
+# Поля пользователя, которые входят в карточку рецепта как автор.
+AUTHOR_FIELDS = ("email", "username", "first_name", "last_name")
+# Ключ рекомендательной блокировки PostgreSQL для выдачи позиций.
+POSITIONS_LOCK = 0x666F6F64
+
+
+def log_recipe_saved(sender, instance, update_fields=None, **kwargs):
+    """Записать изменение рецепта."""
+    if update_fields is not None and update_fields <= INTERNAL_RECIPE_FIELDS:
+        return
+    Change.objects.create(kind=Change.RECIPE, object_id=instance.pk)
+
+
+def log_recipe_deleted(sender, instance, **kwargs):
+    """Записать удаление рецепта."""
+    Change.objects.create(
+        kind=Change.RECIPE, object_id=instance.pk, deleted=True
+    )
+
+
+def remember_author(sender, instance, **kwargs):
+    """Запомнить загруженные поля автора, которые есть в рецептах."""
+    instance.saved_author = {
+        field: instance.__dict__[field]
+        for field in AUTHOR_FIELDS if field in instance.__dict__
+    }
+
+
+def log_author_saved(sender, instance, created, **kwargs):
+    """Записать изменение всех рецептов автора с новым профилем."""
+    saved = instance.saved_author
+    remember_author(sender, instance)
+    if not created and saved.items() - instance.saved_author.items():
+        Change.objects.bulk_create(
+            Change(kind=Change.RECIPE, object_id=recipe_id)
+            for recipe_id in instance.recipes.values_list("id", flat=True)
+        )
+
+
+def log_user_change(kind, object_field):
+    """Обработчик сохранения и удаления связи пользователя с объектом."""
+
+    def log_change(sender, instance, signal, **kwargs):
+        Change.objects.create(
+            kind=kind,
+            object_id=getattr(instance, object_field),
+            user_id=instance.user_id,
+            deleted=signal is post_delete
+        )
+
+    return log_change
+
+
+USER_CHANGES = (
+    (Favorite, log_user_change(Change.FAVORITE, "recipe_id")),
+    (ShoppingCart, log_user_change(Change.SHOPPING_CART, "recipe_id")),
+    (Subscriptions, log_user_change(Change.SUBSCRIPTION, "author_id")),
+)
+
+
+def connect_change_log():
+    """Подписать журнал изменений на записи синхронизируемых моделей.
+
+    Обработчик post_delete отключает быстрое удаление у избранного,
+    покупок и подписок: при каскадном удалении рецепта или пользователя
+    на каждую связь приходится своя запись в журнале.
+    """
+    post_save.connect(
+        log_recipe_saved, sender=Recipe, dispatch_uid="log_recipe_saved"
+    )
+    post_delete.connect(
+        log_recipe_deleted, sender=Recipe, dispatch_uid="log_recipe_deleted"
+    )
+    post_init.connect(
+        remember_author, sender=CustomUser, dispatch_uid="remember_author"
+    )
+    post_save.connect(
+        log_author_saved, sender=CustomUser, dispatch_uid="log_author_saved"
+    )
+    for model, handler in USER_CHANGES:
+        for signal in (post_save, post_delete):
+            signal.connect(
+                handler,
+                sender=model,
+                weak=False,
+                dispatch_uid=f"log_change:{model._meta.label}"
+            )
+
+
+def assign_positions():
+    """Выдать позиции записям журнала, чьи транзакции уже зафиксированы.
+
+    id выдается при вставке, а запись становится видна при фиксации, так
+    что курсор по id перескочил бы запись долгой транзакции. Позиции
+    выдаются одним UPDATE только видимым записям и под блокировкой, поэтому
+    каждая выдача фиксируется целиком и ее позиции больше всех прежних:
+    запись, зафиксированная позже, получит позицию после курсора любого
+    клиента.
+    """
+    using = router.db_for_write(Change)
+    unpositioned = Change.objects.using(using).filter(position=None)
+    first_id = unpositioned.order_by("id").values("id")[:1]
+    last_position = Change.objects.using(using).filter(
+        position__isnull=False
+    ).order_by("-position").values("position")[:1]
+    with transaction.atomic(using=using):
+        connection = connections[using]
+        if connection.vendor == "postgresql":
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT pg_advisory_xact_lock(%s)", [POSITIONS_LOCK]
+                )
+        # Записи с id меньше first_id, зафиксированные во время запроса,
+        # получат позиции при следующей выдаче.
+        return unpositioned.filter(id__gte=Subquery(first_id)).update(
+            position=(
+                F("id") - Subquery(first_id) + 1
+                + Coalesce(Subquery(last_position), 0)
+            )
+        )
+
+
+def compact_changes(retention_days):
+    """Сжать журнал изменений.
+
+    Записи, после которых в журнале есть более новые о том же объекте,
+    удаляются всегда: клиент с любым курсором увидит последнюю. Записи
+    старше retention_days удаляются целиком, а клиентам с курсором до
+    последней удаленной позиции отвечается, что нужна полная
+    синхронизация.
+    """
+    cutoff = timezone.now() - timedelta(days=retention_days)
+    previous = ChangeLogCompaction.objects.first()
+    assign_positions()
+    with transaction.atomic():
+        positioned = Change.objects.filter(position__isnull=False)
+        latest = positioned.order_by().values(
+            "kind", "object_id", "user"
+        ).annotate(last=Max("position")).values("last")
+        superseded, _ = positioned.exclude(position__in=latest).delete()
+
+        last_position = Change.objects.filter(
+            created_at__lt=cutoff
+        ).aggregate(value=Max("position"))["value"] or 0
+        expired, _ = Change.objects.filter(
+            position__lte=last_position
+        ).delete()
+
+        return ChangeLogCompaction.objects.create(
+            last_position=max(
+                last_position, previous.last_position if previous else 0
+            ),
+            superseded=superseded,
+            expired=expired
+        )
@@ -0,0 +1,156 @@
+from itertools import chain
+
+import numpy as np
+from django.db import transaction
+from scipy import sparse
+from scipy.sparse.csgraph import connected_components
+
+from recipes.minhash import (compute_signatures, get_buckets,
+                             get_similarity, load_signatures)
+from recipes.models import Recipe, RecipeBand, RecipeIngredient
+
+ITERATOR_CHUNK_SIZE = 10000
+# Ограничение числа параметров в IN для SQLite.
+IN_CHUNK_SIZE = 900
+
+
+def load_array(queryset, fields):
+    """Строки values_list целых чисел двумерным массивом numpy."""
+    values = np.fromiter(
+        chain.from_iterable(
+            queryset.order_by().values_list(*fields).iterator(
+                chunk_size=ITERATOR_CHUNK_SIZE
+            )
+        ),
+        dtype=np.int64
+    )
+    return values.reshape(-1, len(fields))
+
+
+def update_signatures(rebuild=False, chunk_size=10000, log=None):
+    """Посчитать MinHash-сигнатуры и корзины LSH рецептов.
+
+    Без rebuild считаются только рецепты без сигнатуры: созданные в обход
+    API и админки (seed, импорт) или до появления сигнатур.
+    Возвращает число обработанных рецептов.
+    """
+    recipes = Recipe.objects.all()
+    if not rebuild:
+        recipes = recipes.filter(ingredients_minhash__isnull=True)
+    recipe_ids = list(recipes.order_by("id").values_list("id", flat=True))
+
+    for start in range(0, len(recipe_ids), chunk_size):
+        chunk = recipe_ids[start:start + chunk_size]
+        chunk_recipes = recipes.filter(id__range=(chunk[0], chunk[-1]))
+        signed_ids, signatures = compute_signatures(load_array(
+            RecipeIngredient.objects.filter(recipe__in=chunk_recipes),
+            ("recipe_id", "ingredient_id")
+        ))
+        buckets = get_buckets(signatures)
+        signed_ids = signed_ids.tolist()
+        signatures = dict(zip(
+            signed_ids, (signature.tobytes() for signature in signatures)
+        ))
+        with transaction.atomic():
+            RecipeBand.objects.filter(recipe__in=chunk_recipes).delete()
+            Recipe.objects.bulk_update(
+                [
+                    Recipe(
+                        id=recipe_id,
+                        ingredients_minhash=signatures.get(recipe_id, b"")
+                    )
+                    for recipe_id in chunk
+                ],
+                ("ingredients_minhash",),
+                batch_size=1000
+            )
+            RecipeBand.objects.bulk_create(
+                (
+                    RecipeBand(recipe_id=recipe_id, bucket=bucket)
+                    for recipe_id, recipe_buckets in zip(
+                        signed_ids, buckets.tolist()
+                    )
+                    for bucket in recipe_buckets
+                ),
+                batch_size=1000
+            )
+        if log is not None:
+            log(f"Сигнатур: {start + len(chunk)}/{len(recipe_ids)}")
+
+    return len(recipe_ids)
+
+
+def get_candidate_pairs():
+    """Пары рецептов с общей корзиной LSH.
+
+    Каждый рецепт корзины сравнивается только с первым из нее: для поиска
+    кластеров этого достаточно, а число пар остается линейным.
+    """
+    bands = load_array(RecipeBand.objects.all(), ("bucket", "recipe_id"))
+    bands = bands[np.lexsort((bands[:, 1], bands[:, 0]))]
+    starts = np.flatnonzero(
+        np.concatenate(([True], bands[1:, 0] != bands[:-1, 0]))
+    )
+    leaders = np.repeat(bands[starts, 1], np.diff(np.append(
+        starts, len(bands)
+    )))
+    members = bands[:, 1]
+    pairs = np.column_stack((leaders, members))[leaders != members]
+    return np.unique(pairs, axis=0)
+
+
+def load_recipe_signatures(recipe_ids):
+    """Id найденных рецептов из recipe_ids и их сигнатуры в том же порядке.
+
+    Рецепт могли удалить после загрузки пар-кандидатов, такие id
+    пропускаются.
+    """
+    signatures = {}
+    for start in range(0, len(recipe_ids), IN_CHUNK_SIZE):
+        signatures.update(
+            Recipe.objects.filter(
+                pk__in=recipe_ids[start:start + IN_CHUNK_SIZE]
+            ).values_list("id", "ingredients_minhash")
+        )
+    found_ids = [
+        recipe_id for recipe_id in recipe_ids if recipe_id in signatures
+    ]
+    return found_ids, load_signatures(
+        signatures[recipe_id] for recipe_id in found_ids
+    )
+
+
+def find_duplicates(threshold):
+    """Кластеры рецептов с оценкой коэффициента Жаккара не ниже threshold.
+
+    Сравниваются только пары-кандидаты из общих корзин LSH, поэтому
+    время растет почти линейно с числом рецептов, а не квадратично.
+    Возвращает списки id рецептов, начиная с самых больших кластеров.
+    """
+    pairs = get_candidate_pairs()
+    recipe_ids, signatures = load_recipe_signatures(np.unique(pairs).tolist())
+    recipe_ids = np.array(recipe_ids, dtype=pairs.dtype)
+    pairs = pairs[np.isin(pairs, recipe_ids).all(axis=1)]
+    if not len(pairs):
+        return []
+
+    edges = np.searchsorted(recipe_ids, pairs)
+    similar = edges[
+        get_similarity(signatures[edges[:, 0]], signatures[edges[:, 1]])
+        >= threshold
+    ]
+    graph = sparse.coo_matrix(
+        (np.ones(len(similar)), (similar[:, 0], similar[:, 1])),
+        shape=(len(recipe_ids), len(recipe_ids))
+    )
+    _, labels = connected_components(graph, directed=False)
+
+    order = np.argsort(labels, kind="stable")
+    clusters = [
+        cluster.tolist()
+        for cluster in np.split(
+            recipe_ids[order], np.cumsum(np.bincount(labels))[:-1]
+        )
+        if len(cluster) > 1
+    ]
+    return sorted(clusters, key=lambda cluster: (-len(cluster), cluster[0]))
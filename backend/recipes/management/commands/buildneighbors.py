@@ -0,0 +1,43 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from recipes.neighbors import build_neighbors
+
+
+class Command(BaseCommand):
+    """Пересчет похожих рецептов для /api/recipes/{id}/similar/."""
+
+    help = (
+        "Считает top-K похожих рецептов по косинусной близости в матрице "
+        "пользователь × рецепт из избранного и списков покупок; без --full "
+        "пересчитывает только рецепты с новыми добавлениями"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--full", action="store_true",
+            help="Пересчитать все рецепты и учесть удаления"
+        )
+        parser.add_argument(
+            "--top-k", type=int,
+            help="Число соседей рецепта; по умолчанию NEIGHBORS_TOP_K"
+        )
+        parser.add_argument(
+            "--chunk-size", type=int, default=500,
+            help="Рецептов в блоке; ограничивает память на произведение"
+        )
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        build = build_neighbors(
+            full=options["full"],
+            top_k=options["top_k"],
+            chunk_size=options["chunk_size"],
+            log=self.stdout.write
+        )
+        kind = "Полный" if build.full else "Инкрементальный"
+        self.stdout.write(self.style.SUCCESS(
+            f"{kind} пересчет: {build.recipes} рецептов "
+            f"за {time.perf_counter() - start:.1f} с."
+        ))
@@ -0,0 +1,39 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.changes import compact_changes
+
+
+class Command(BaseCommand):
+    """Сжатие журнала изменений для /api/sync/."""
+
+    help = (
+        "Удаляет записи журнала изменений, перекрытые более новыми записями "
+        "о тех же объектах, и все записи старше срока хранения; клиентам "
+        "с более старым курсором потребуется полная синхронизация"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days", type=int,
+            help="Срок хранения записей в днях; по умолчанию "
+                 "SYNC_CHANGES_RETENTION_DAYS"
+        )
+
+    def handle(self, *args, **options):
+        days = options["days"]
+        if days is None:
+            days = settings.SYNC_CHANGES_RETENTION_DAYS
+        if days < 0:
+            raise CommandError("Срок хранения не может быть отрицательным.")
+
+        start = time.perf_counter()
+        compaction = compact_changes(days)
+        self.stdout.write(self.style.SUCCESS(
+            f"Удалено перекрытых записей: {compaction.superseded}, "
+            f"старше {days} дн.: {compaction.expired} "
+            f"за {time.perf_counter() - start:.1f} с. Полная синхронизация "
+            f"нужна клиентам с курсором меньше {compaction.last_position}."
+        ))
@@ -0,0 +1,65 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.duplicates import find_duplicates, update_signatures
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    """Поиск почти одинаковых рецептов по составу ингредиентов."""
+
+    help = (
+        "Досчитывает MinHash-сигнатуры рецептов и ищет кластеры рецептов "
+        "с близким набором ингредиентов через корзины LSH без попарного "
+        "сравнения всех рецептов"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--threshold", type=float, default=0.8,
+            help="Минимальная оценка коэффициента Жаккара для дубликатов"
+        )
+        parser.add_argument(
+            "--rebuild", action="store_true",
+            help="Пересчитать сигнатуры всех рецептов, а не только новых"
+        )
+        parser.add_argument("--chunk-size", type=int, default=10000)
+        parser.add_argument(
+            "--limit", type=int, default=20,
+            help="Сколько самых больших кластеров вывести"
+        )
+
+    def handle(self, *args, **options):
+        if not 0 < options["threshold"] <= 1:
+            raise CommandError("Порог должен быть в диапазоне (0, 1].")
+
+        start = time.perf_counter()
+        updated = update_signatures(
+            rebuild=options["rebuild"],
+            chunk_size=options["chunk_size"],
+            log=self.stdout.write
+        )
+        self.stdout.write(
+            f"Сигнатур посчитано: {updated} "
+            f"за {time.perf_counter() - start:.1f} с."
+        )
+
+        start = time.perf_counter()
+        clusters = find_duplicates(options["threshold"])
+        shown = clusters[:options["limit"]]
+        names = dict(
+            Recipe.objects.filter(
+                pk__in=[pk for cluster in shown for pk in cluster]
+            ).values_list("id", "name")
+        )
+        for number, cluster in enumerate(shown, 1):
+            self.stdout.write(f"Кластер {number}, рецептов: {len(cluster)}")
+            for pk in cluster:
+                self.stdout.write(f"  {pk}: {names[pk]}")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Кластеров: {len(clusters)}, рецептов в них: "
+            f"{sum(len(cluster) for cluster in clusters)}, "
+            f"поиск за {time.perf_counter() - start:.1f} с."
+        ))
@@ -0,0 +1,339 @@
+import csv
+import io
+import random
+from datetime import timedelta
+from itertools import accumulate
+
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+from PIL import Image
+
+from foodgram_backend.settings import CSV_FILES_DIR
+from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
+                            ShoppingCart, Tag)
+from users.models import CustomUser, Subscriptions
+
+
+SEED_PASSWORD = "seed-password"
+PLACEHOLDER_IMAGES = 16
+MIN_INGREDIENTS = 5
+MAX_INGREDIENTS = 30
+ZIPF_EXPONENT = 1.1
+PARETO_ALPHA = 1.5
+
+ADJECTIVES = (
+    "Домашний", "Быстрый", "Пряный", "Летний", "Зимний", "Праздничный",
+    "Легкий", "Сытный", "Деревенский", "Бабушкин", "Острый", "Нежный",
+)
+DISHES = (
+    "борщ", "суп", "салат", "пирог", "плов", "омлет", "рагу", "гуляш",
+    "паштет", "соус", "кекс", "хлеб", "запеканка", "каша", "десерт",
+)
+WORDS = (
+    "нарежьте", "обжарьте", "добавьте", "перемешайте", "посолите",
+    "варите", "запекайте", "подавайте", "остудите", "взбейте", "минут",
+    "до", "готовности", "на", "среднем", "огне", "с", "зеленью", "и",
+    "специями", "тесто", "овощи", "мясо", "масло", "сковороде",
+)
+
+
+def zipf_cum_weights(size, exponent=ZIPF_EXPONENT):
+    """Накопленные веса степенного распределения для `size` элементов."""
+    return list(accumulate(
+        1 / (rank ** exponent) for rank in range(1, size + 1)
+    ))
+
+
+class Command(BaseCommand):
+    """Генерация синтетических данных для нагрузочного тестирования."""
+
+    help = (
+        "Генерирует пользователей, рецепты, избранное, списки покупок "
+        "и подписки с детерминированным сидом"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=100)
+        parser.add_argument("--recipes", type=int, default=1000)
+        parser.add_argument(
+            "--favorites", type=float, default=10,
+            help="Среднее число избранных рецептов на пользователя"
+        )
+        parser.add_argument(
+            "--carts", type=float, default=3,
+            help="Среднее число рецептов в списке покупок пользователя"
+        )
+        parser.add_argument(
+            "--subscriptions", type=float, default=5,
+            help="Среднее число подписок на пользователя"
+        )
+        parser.add_argument(
+            "--text-words", type=int, default=200,
+            help="Максимальная длина описания рецепта в словах"
+        )
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--chunk-size", type=int, default=10000)
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options["seed"])
+        self.chunk_size = options["chunk_size"]
+        self.text_words = max(options["text_words"], 20)
+        self.now = timezone.now()
+
+        self.ensure_catalog()
+        self.ingredient_ids = list(
+            Ingredient.objects.order_by("id").values_list("id", flat=True)
+        )
+        self.tag_bits = dict(
+            Tag.objects.order_by("id").values_list("id", "bit")
+        )
+        self.tag_ids = list(self.tag_bits)
+        self.images = self.create_placeholder_images()
+
+        user_ids = self.create_users(options["users"])
+        recipe_ids = self.create_recipes(options["recipes"], user_ids)
+        self.create_interactions(
+            Favorite, user_ids, recipe_ids, options["favorites"]
+        )
+        self.create_interactions(
+            ShoppingCart, user_ids, recipe_ids, options["carts"]
+        )
+        self.create_subscriptions(user_ids, options["subscriptions"])
+
+        if connection.vendor == "postgresql":
+            self.reset_sequences()
+
+        self.stdout.write(self.style.SUCCESS("Данные сгенерированы."))
+
+    def ensure_catalog(self):
+        """Загрузить ингредиенты и теги из data, если их еще нет."""
+        if not Ingredient.objects.exists():
+            with open(
+                f"{CSV_FILES_DIR}/ingredients.csv", newline="",
+                encoding="utf-8"
+            ) as csvfile:
+                Ingredient.objects.bulk_create(
+                    Ingredient(name=row[0], measurement_unit=row[1])
+                    for row in csv.reader(csvfile, delimiter=",")
+                )
+        if not Tag.objects.exists():
+            with open(
+                f"{CSV_FILES_DIR}/tags.csv", newline="", encoding="utf-8"
+            ) as csvfile:
+                Tag.objects.bulk_create(
+                    Tag(name=row[0], color=row[1], slug=row[2], bit=bit)
+                    for bit, row in enumerate(
+                        csv.reader(csvfile, delimiter=",")
+                    )
+                )
+
+    def create_placeholder_images(self):
+        """Создать небольшой набор общих изображений-заглушек.
+
+        Цвет выбирается и для уже существующих файлов, чтобы повторный
+        запуск с тем же --seed генерировал те же данные.
+        """
+        names = []
+        for number in range(PLACEHOLDER_IMAGES):
+            name = f"recipes/images/seed_{number}.png"
+            color = tuple(self.rng.randrange(256) for _ in range(3))
+            if not default_storage.exists(name):
+                buffer = io.BytesIO()
+                Image.new("RGB", (8, 8), color).save(buffer, "PNG")
+                name = default_storage.save(
+                    name, ContentFile(buffer.getvalue())
+                )
+            names.append(name)
+
+        return names
+
+    def next_id(self, model):
+        """Получить первый свободный первичный ключ модели."""
+        return (model.objects.aggregate(max_id=Max("id"))["max_id"] or 0) + 1
+
+    def create_users(self, count):
+        """Создать пользователей с общим заранее вычисленным паролем."""
+        password = make_password(SEED_PASSWORD)
+        first_id = self.next_id(CustomUser)
+        user_ids = range(first_id, first_id + count)
+        columns = (
+            "id", "password", "is_superuser", "username", "first_name",
+            "last_name", "email", "is_staff", "is_active", "date_joined"
+        )
+        joined = connection.ops.adapt_datetimefield_value(self.now)
+        self.write_rows(CustomUser, columns, (
+            (
+                user_id, password, False, f"seed{user_id}", "Имя",
+                "Фамилия", f"seed{user_id}@example.com", False, True, joined
+            )
+            for user_id in user_ids
+        ))
+        self.stdout.write(f"Пользователей: {count}")
+
+        return user_ids
+
+    def create_recipes(self, count, user_ids):
+        """Создать рецепты с ингредиентами и тегами."""
+        first_id = self.next_id(Recipe)
+        recipe_ids = range(first_id, first_id + count)
+        authors = list(user_ids)
+        self.rng.shuffle(authors)
+        author_weights = zipf_cum_weights(len(authors))
+
+        for start in range(0, count, self.chunk_size):
+            chunk = recipe_ids[start:start + self.chunk_size]
+            recipes, tags, ingredients = [], [], []
+            for recipe_id in chunk:
+                row = self.recipe_row(recipe_id, authors, author_weights)
+                tags_mask = 0
+                for tag_id in self.rng.sample(
+                    self.tag_ids, self.rng.randint(1, len(self.tag_ids))
+                ):
+                    tags.append((recipe_id, tag_id))
+                    tags_mask |= 1 << self.tag_bits[tag_id]
+                recipes.append((*row, row[-1], tags_mask, 0, 0))
+                for ingredient_id in self.rng.sample(
+                    self.ingredient_ids,
+                    self.rng.randint(MIN_INGREDIENTS, MAX_INGREDIENTS)
+                ):
+                    ingredients.append(
+                        (recipe_id, ingredient_id, self.rng.randint(1, 500))
+                    )
+
+            with transaction.atomic():
+                self.write_rows(Recipe, (
+                    "id", "author_id", "image", "name", "text",
+                    "cooking_time", "pub_date", "updated_at", "tags_mask",
+                    "popularity", "trending_score"
+                ), recipes)
+                self.write_rows(
+                    Recipe.tags.through, ("recipe_id", "tag_id"), tags
+                )
+                self.write_rows(
+                    RecipeIngredient,
+                    ("recipe_id", "ingredient_id", "amount"),
+                    ingredients
+                )
+            self.stdout.write(f"Рецептов: {start + len(chunk)}/{count}")
+
+        return recipe_ids
+
+    def recipe_row(self, recipe_id, authors, author_weights):
+        """Сгенерировать строку рецепта."""
+        rng = self.rng
+        text = " ".join(
+            rng.choices(WORDS, k=rng.randint(20, self.text_words))
+        )
+        pub_date = self.now - timedelta(seconds=rng.randrange(365 * 86400))
+
+        return (
+            recipe_id,
+            rng.choices(authors, cum_weights=author_weights)[0],
+            rng.choice(self.images),
+            f"{rng.choice(ADJECTIVES)} {rng.choice(DISHES)} {recipe_id}",
+            text.capitalize() + ".",
+            rng.randint(1, 240),
+            connection.ops.adapt_datetimefield_value(pub_date),
+        )
+
+    def sample_count(self, mean, limit):
+        """Число связей пользователя по распределению Парето."""
+        if mean <= 0:
+            return 0
+        scale = mean * (PARETO_ALPHA - 1) / PARETO_ALPHA
+        return min(int(self.rng.paretovariate(PARETO_ALPHA) * scale), limit)
+
+    def sample_unique(self, population, cum_weights, count, exclude=None):
+        """Выбрать `count` различных элементов с учетом весов."""
+        chosen = set()
+        attempts = count * 4
+        while len(chosen) < count and attempts:
+            item = self.rng.choices(population, cum_weights=cum_weights)[0]
+            if item != exclude:
+                chosen.add(item)
+            attempts -= 1
+
+        return sorted(chosen)
+
+    def create_interactions(self, model, user_ids, recipe_ids, mean):
+        """Создать избранное или список покупок."""
+        popular = list(recipe_ids)
+        self.rng.shuffle(popular)
+        weights = zipf_cum_weights(len(popular))
+        rows = []
+        for user_id in user_ids:
+            count = self.sample_count(mean, len(popular))
+            rows.extend(
+                (user_id, recipe_id)
+                for recipe_id in self.sample_unique(popular, weights, count)
+            )
+            if len(rows) >= self.chunk_size:
+                self.write_rows(model, ("user_id", "recipe_id"), rows)
+                rows = []
+        self.write_rows(model, ("user_id", "recipe_id"), rows)
+        self.stdout.write(f"{model._meta.verbose_name_plural}: готово")
+
+    def create_subscriptions(self, user_ids, mean):
+        """Создать подписки на популярных авторов."""
+        authors = list(user_ids)
+        self.rng.shuffle(authors)
+        weights = zipf_cum_weights(len(authors))
+        rows = []
+        for user_id in user_ids:
+            count = self.sample_count(mean, len(authors) - 1)
+            rows.extend(
+                (author_id, user_id)
+                for author_id in self.sample_unique(
+                    authors, weights, count, exclude=user_id
+                )
+            )
+            if len(rows) >= self.chunk_size:
+                self.write_rows(Subscriptions, ("author_id", "user_id"), rows)
+                rows = []
+        self.write_rows(Subscriptions, ("author_id", "user_id"), rows)
+        self.stdout.write("Подписки: готово")
+
+    def write_rows(self, model, columns, rows):
+        """Записать строки пачкой: COPY в PostgreSQL, иначе executemany."""
+        rows = list(rows)
+        if not rows:
+            return
+
+        meta = model._meta
+        table = connection.ops.quote_name(meta.db_table)
+        names = ", ".join(
+            connection.ops.quote_name(meta.get_field(column).column)
+            for column in columns
+        )
+
+        with connection.cursor() as cursor:
+            if connection.vendor == "postgresql":
+                buffer = io.StringIO()
+                csv.writer(buffer).writerows(rows)
+                buffer.seek(0)
+                cursor.copy_expert(
+                    f"COPY {table} ({names}) FROM STDIN WITH (FORMAT csv)",
+                    buffer
+                )
+            else:
+                placeholders = ", ".join(["%s"] * len(columns))
+                cursor.executemany(
+                    f"INSERT INTO {table} ({names}) "
+                    f"VALUES ({placeholders})",
+                    rows
+                )
+
+    def reset_sequences(self):
+        """Сдвинуть последовательности первичных ключей после COPY."""
+        statements = connection.ops.sequence_reset_sql(
+            no_style(), [CustomUser, Recipe]
+        )
+        with connection.cursor() as cursor:
+            for sql in statements:
+                cursor.execute(sql)
@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from recipes.trending import update_scores
+
+
+class Command(BaseCommand):
+    """Пересчет популярности и трендовости для ?ordering=popular/trending."""
+
+    help = (
+        "Добавляет к оценкам рецептов новые добавления в избранное и списки "
+        "покупок с момента прошлого запуска; с --full пересчитывает "
+        "популярность заново с учетом удалений"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--full", action="store_true",
+            help="Пересчитать популярность всех рецептов"
+        )
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        update = update_scores(full=options["full"])
+        kind = "Полный" if update.full else "Инкрементальный"
+        self.stdout.write(self.style.SUCCESS(
+            f"{kind} пересчет: {update.recipes} рецептов с новыми "
+            f"добавлениями за {time.perf_counter() - start:.1f} с."
+        ))
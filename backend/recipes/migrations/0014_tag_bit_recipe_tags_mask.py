@@ -0,0 +1,57 @@
+import django.core.validators
+from django.db import migrations, models
+
+BATCH_SIZE = 10000
+
+
+def fill_masks(apps, schema_editor):
+    Tag = apps.get_model('recipes', 'Tag')
+    Recipe = apps.get_model('recipes', 'Recipe')
+
+    bits = {}
+    for bit, tag in enumerate(Tag.objects.order_by('id')):
+        tag.bit = bit
+        tag.save(update_fields=['bit'])
+        bits[tag.id] = 1 << bit
+
+    masks = {}
+    for recipe_id, tag_id in Recipe.tags.through.objects.values_list(
+        'recipe_id', 'tag_id'
+    ).iterator():
+        masks[recipe_id] = masks.get(recipe_id, 0) | bits[tag_id]
+
+    recipes = [
+        Recipe(id=recipe_id, tags_mask=mask)
+        for recipe_id, mask in masks.items()
+    ]
+    Recipe.objects.bulk_update(recipes, ['tags_mask'], batch_size=BATCH_SIZE)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0013_alter_recipe_cooking_time_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tag',
+            name='bit',
+            field=models.PositiveSmallIntegerField(editable=False, null=True, verbose_name='Бит в маске тегов'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='tags_mask',
+            field=models.BigIntegerField(default=0, editable=False, help_text='Копия tags для фильтрации без соединения таблиц.', verbose_name='Маска тегов'),
+        ),
+        migrations.RunPython(fill_masks, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='tag',
+            name='bit',
+            field=models.PositiveSmallIntegerField(editable=False, unique=True, validators=[django.core.validators.MaxValueValidator(62)], verbose_name='Бит в маске тегов'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['-pub_date', 'tags_mask'], name='recipe_pub_date_tags_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 3.2.16 on 2026-10-19 09:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0014_tag_bit_recipe_tags_mask'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['tags_mask', 'cooking_time'], name='recipe_tags_cooking_time_idx'),
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 3.2.16 on 2026-10-19 09:02
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0015_recipe_tags_cooking_time_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecipeNeighborsBuild',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('finished_at', models.DateTimeField(auto_now_add=True, verbose_name='Завершен')),
+                ('full', models.BooleanField(verbose_name='Полный пересчет')),
+                ('favorite_id', models.BigIntegerField(verbose_name='Последний учтенный id избранного')),
+                ('cart_id', models.BigIntegerField(verbose_name='Последний учтенный id списка покупок')),
+                ('recipes', models.PositiveIntegerField(verbose_name='Пересчитано рецептов')),
+            ],
+            options={
+                'verbose_name': 'пересчет похожих рецептов',
+                'verbose_name_plural': 'Пересчеты похожих рецептов',
+                'ordering': ('-finished_at',),
+            },
+        ),
+        migrations.CreateModel(
+            name='RecipeNeighbor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField(verbose_name='Косинусная близость')),
+                ('neighbor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='neighbor_of', to='recipes.recipe', verbose_name='Похожий рецепт')),
+                ('recipe', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='neighbors', to='recipes.recipe', verbose_name='Рецепт')),
+            ],
+            options={
+                'verbose_name': 'похожий рецепт',
+                'verbose_name_plural': 'Похожие рецепты',
+                'ordering': ('recipe', '-score'),
+            },
+        ),
+        migrations.AddIndex(
+            model_name='recipeneighbor',
+            index=models.Index(fields=['recipe', '-score'], name='recipe_neighbor_score_idx'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 3.2.16 on 2026-10-19 09:07
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0016_recipeneighbor'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='ingredients_minhash',
+            field=models.BinaryField(help_text='Пустая у рецепта без ингредиентов, NULL — не посчитана.', null=True, verbose_name='MinHash-сигнатура ингредиентов'),
+        ),
+        migrations.CreateModel(
+            name='RecipeBand',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.BigIntegerField(db_index=True, verbose_name='Хэш полосы')),
+                ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='bands', to='recipes.recipe', verbose_name='Рецепт')),
+            ],
+            options={
+                'verbose_name': 'корзина LSH',
+                'verbose_name_plural': 'Корзины LSH',
+            },
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 3.2.16 on 2026-10-19 09:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0017_recipe_ingredients_minhash_recipeband'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecipeScoresUpdate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('finished_at', models.DateTimeField(auto_now_add=True, verbose_name='Завершен')),
+                ('full', models.BooleanField(verbose_name='Полный пересчет')),
+                ('favorite_id', models.BigIntegerField(verbose_name='Последний учтенный id избранного')),
+                ('cart_id', models.BigIntegerField(verbose_name='Последний учтенный id списка покупок')),
+                ('reference_time', models.DateTimeField(help_text='Добавление в этот момент имеет в trending_score свой вес.', verbose_name='Опорное время затухания')),
+                ('recipes', models.PositiveIntegerField(verbose_name='Обновлено рецептов')),
+            ],
+            options={
+                'verbose_name': 'пересчет популярности',
+                'verbose_name_plural': 'Пересчеты популярности',
+                'ordering': ('-finished_at',),
+            },
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='popularity',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='Число добавлений в избранное и покупки, см. updatetrending.', verbose_name='Популярность'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='trending_score',
+            field=models.FloatField(default=0, editable=False, help_text='Затухающая сумма добавлений, умноженная на общий для всех рецептов множитель, см. updatetrending.', verbose_name='Трендовость'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['-trending_score', '-id', 'tags_mask'], name='recipe_trending_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['-popularity', '-id', 'tags_mask'], name='recipe_popularity_idx'),
+        ),
+    ]
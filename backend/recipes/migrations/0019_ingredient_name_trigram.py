@@ -0,0 +1,29 @@
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+
+def create_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS ingredient_name_trgm_idx '
+        'ON recipes_ingredient USING gin (name gin_trgm_ops)'
+    )
+
+
+def drop_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS ingredient_name_trgm_idx')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0018_recipe_popularity_trending_score'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.RunPython(create_trigram_index, drop_trigram_index),
+    ]
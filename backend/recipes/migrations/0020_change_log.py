@@ -0,0 +1,51 @@
+# Generated by Django 3.2.16 on 2026-10-19 09:21
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipes', '0019_ingredient_name_trigram'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeLogCompaction',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('finished_at', models.DateTimeField(auto_now_add=True, verbose_name='Завершено')),
+                ('last_id', models.BigIntegerField(help_text='Клиентам с курсором меньше нужна полная синхронизация.', verbose_name='Последний удаленный id журнала')),
+                ('superseded', models.PositiveIntegerField(verbose_name='Удалено перекрытых записей')),
+                ('expired', models.PositiveIntegerField(verbose_name='Удалено старых записей')),
+            ],
+            options={
+                'verbose_name': 'сжатие журнала изменений',
+                'verbose_name_plural': 'Сжатия журнала изменений',
+                'ordering': ('-finished_at',),
+            },
+        ),
+        migrations.CreateModel(
+            name='Change',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('recipe', 'рецепт'), ('favorite', 'избранное'), ('shopping_cart', 'список покупок'), ('subscription', 'подписка')], max_length=16, verbose_name='Тип')),
+                ('object_id', models.BigIntegerField(help_text='Для подписок — id автора, иначе — id рецепта.', verbose_name='id рецепта или автора')),
+                ('deleted', models.BooleanField(default=False, verbose_name='Удаление')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Время')),
+                ('user', models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='changes', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'изменение',
+                'verbose_name_plural': 'Журнал изменений',
+                'ordering': ('id',),
+            },
+        ),
+        migrations.AddIndex(
+            model_name='change',
+            index=models.Index(fields=['user', 'id'], name='change_user_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.16 on 2026-10-19 09:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0020_change_log'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, help_text='Меняется при сохранении рецепта целиком, в том числе ингредиентов; по ней видно, что список покупок устарел.', verbose_name='Дата изменения'),
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 3.2.16 on 2026-10-19 10:20
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def keep_cursors(apps, schema_editor):
+    """Позиция существующих записей — их id, курсоры клиентов не меняются."""
+    Change = apps.get_model('recipes', 'Change')
+    Change.objects.update(position=F('id'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0021_recipe_updated_at'),
+    ]
+
+    operations = [
+        migrations.RenameField(
+            model_name='changelogcompaction',
+            old_name='last_id',
+            new_name='last_position',
+        ),
+        migrations.AlterField(
+            model_name='changelogcompaction',
+            name='last_position',
+            field=models.BigIntegerField(help_text='Клиентам с курсором меньше нужна полная синхронизация.', verbose_name='Последняя удаленная позиция журнала'),
+        ),
+        migrations.AddField(
+            model_name='change',
+            name='position',
+            field=models.BigIntegerField(editable=False, help_text='Выдается уже зафиксированной записи, см. assign_positions; пустая — запись еще не отдавалась.', null=True, unique=True, verbose_name='Позиция'),
+        ),
+        migrations.RunPython(keep_cursors, migrations.RunPython.noop),
+        migrations.RemoveIndex(
+            model_name='change',
+            name='change_user_idx',
+        ),
+        migrations.AddIndex(
+            model_name='change',
+            index=models.Index(fields=['user', 'position'], name='change_user_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='change',
+            index=models.Index(condition=models.Q(('position', None)), fields=['id'], name='change_unpositioned_idx'),
+        ),
+    ]
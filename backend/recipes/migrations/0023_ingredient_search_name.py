@@ -0,0 +1,48 @@
+from django.db import migrations
+
+# То же, что api.ingredient_search.normalize: нижний регистр, ё как е,
+# слова через один пробел.
+CREATE_FUNCTION = '''
+CREATE OR REPLACE FUNCTION normalize_search_text(text) RETURNS text
+LANGUAGE sql IMMUTABLE STRICT PARALLEL SAFE AS $$
+    SELECT btrim(regexp_replace(
+        replace(lower($1), 'ё', 'е'), '[^[:alnum:]_]+', ' ', 'g'
+    ))
+$$
+'''
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(CREATE_FUNCTION)
+    schema_editor.execute('DROP INDEX IF EXISTS ingredient_name_trgm_idx')
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS ingredient_search_name_trgm_idx '
+        'ON recipes_ingredient '
+        'USING gin (normalize_search_text(name) gin_trgm_ops)'
+    )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        'DROP INDEX IF EXISTS ingredient_search_name_trgm_idx'
+    )
+    schema_editor.execute('DROP FUNCTION IF EXISTS normalize_search_text(text)')
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS ingredient_name_trgm_idx '
+        'ON recipes_ingredient USING gin (name gin_trgm_ops)'
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0022_change_position'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
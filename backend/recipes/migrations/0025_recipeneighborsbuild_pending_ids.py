@@ -0,0 +1,23 @@
+# Generated by Django 3.2.16 on 2026-10-19 10:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0024_recipescoresupdate_pending_ids'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipeneighborsbuild',
+            name='cart_pending',
+            field=models.JSONField(default=list, verbose_name='Пропущенные id списка покупок'),
+        ),
+        migrations.AddField(
+            model_name='recipeneighborsbuild',
+            name='favorite_pending',
+            field=models.JSONField(default=list, help_text='id перед границей без строк: их транзакции могли быть еще не зафиксированы, следующий запуск проверит их снова.', verbose_name='Пропущенные id избранного'),
+        ),
+    ]
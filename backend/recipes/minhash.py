@@ -0,0 +1,76 @@
+import numpy as np
+
+MINHASH_PERMUTATIONS = 64
+LSH_BANDS = 8
+LSH_ROWS = MINHASH_PERMUTATIONS // LSH_BANDS
+# Наибольшее простое число меньше 2**32: значения хэшей помещаются в uint32,
+# а a * x + b для id ингредиента меньше 2**32 не переполняет uint64.
+PRIME = 4294967291
+# Коэффициенты хэш-функций фиксированы: от них зависят сохраненные
+# сигнатуры, при смене нужен finddupes --rebuild.
+COEFFICIENTS = np.random.RandomState(0).randint(
+    1, PRIME, size=(2, MINHASH_PERMUTATIONS), dtype=np.uint64
+)
+BUCKET_MULTIPLIER = np.uint64(0x9E3779B97F4A7C15)
+SIGNATURE_DTYPE = np.dtype("<u4")
+
+
+def compute_signatures(pairs):
+    """MinHash-сигнатуры рецептов по массиву пар (рецепт, ингредиент).
+
+    Возвращает отсортированные id рецептов и матрицу их сигнатур.
+    """
+    pairs = pairs[np.argsort(pairs[:, 0], kind="stable")]
+    recipe_ids, starts = np.unique(pairs[:, 0], return_index=True)
+    if not len(recipe_ids):
+        return recipe_ids, np.empty(
+            (0, MINHASH_PERMUTATIONS), dtype=SIGNATURE_DTYPE
+        )
+    ingredients = pairs[:, 1:2].astype(np.uint64)
+    hashes = (ingredients * COEFFICIENTS[0] + COEFFICIENTS[1]) % PRIME
+    return recipe_ids, np.minimum.reduceat(hashes, starts, axis=0).astype(
+        SIGNATURE_DTYPE
+    )
+
+
+def get_signature(ingredient_ids):
+    """Сигнатура набора ингредиентов в байтах; пустая для пустого набора."""
+    ingredient_ids = np.fromiter(ingredient_ids, dtype=np.int64)
+    if not len(ingredient_ids):
+        return b""
+    pairs = np.column_stack((np.zeros_like(ingredient_ids), ingredient_ids))
+    return compute_signatures(pairs)[1][0].tobytes()
+
+
+def load_signatures(values):
+    """Матрица сигнатур из сохраненных байтов одинаковой длины."""
+    return np.frombuffer(
+        b"".join(bytes(value) for value in values), dtype=SIGNATURE_DTYPE
+    ).reshape(-1, MINHASH_PERMUTATIONS)
+
+
+def get_buckets(signatures):
+    """Корзины LSH: по одному 64-битному хэшу на полосу сигнатуры.
+
+    Рецепты, совпадающие хотя бы в одной полосе, попадают в общую
+    корзину; вероятность этого растет с коэффициентом Жаккара.
+    """
+    bands = signatures.reshape(-1, LSH_BANDS, LSH_ROWS).astype(np.uint64)
+    buckets = np.broadcast_to(
+        np.arange(LSH_BANDS, dtype=np.uint64), bands.shape[:2]
+    ).copy()
+    for row in range(LSH_ROWS):
+        buckets = buckets * BUCKET_MULTIPLIER + bands[:, :, row]
+    # Перемешивание битов splitmix64, чтобы близкие значения
+    # не давали близких корзин.
+    buckets ^= buckets >> np.uint64(30)
+    buckets *= np.uint64(0xBF58476D1CE4E5B9)
+    buckets ^= buckets >> np.uint64(27)
+    buckets *= np.uint64(0x94D049BB133111EB)
+    buckets ^= buckets >> np.uint64(31)
+    return buckets.view(np.int64)
+
+
+def get_similarity(left, right):
+    """Оценка коэффициента Жаккара по долям совпавших значений сигнатур."""
+    return (left == right).mean(axis=-1)
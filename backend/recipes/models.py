@@ -1,7 +1,12 @@
+from django.core.exceptions import ValidationError
 from django.core.validators import (MaxValueValidator, MinValueValidator,
                                     RegexValidator)
 from django.db import models
+from django.db.models import F
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
 
+from recipes.minhash import get_buckets, get_signature, load_signatures
 from users.models import CustomUser
 
 
@@ -11,6 +16,8 @@ MIN_COOKING_TIME = 1
 MAX_COOKING_TIME = 32000
 MIN_AMOUNT_INGREDIENT = 1
 MAX_AMOUNT_INGREDIENT = 32000
+# Маска тегов хранится в знаковом BigIntegerField.
+MAX_TAGS = 63
 
 
 class Tag(models.Model):
@@ -32,6 +39,12 @@ class Tag(models.Model):
         unique=True,
         max_length=MAX_LEN_TITLE,
     )
+    bit = models.PositiveSmallIntegerField(
+        "Бит в маске тегов",
+        unique=True,
+        editable=False,
+        validators=[MaxValueValidator(MAX_TAGS - 1)]
+    )
 
     class Meta:
         ordering = ("name",)
@@ -41,6 +54,26 @@ class Tag(models.Model):
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        """Сохранить тег, назначив новому тегу свободный бит маски."""
+        if self.bit is None:
+            used = set(Tag.objects.values_list("bit", flat=True))
+            free = [bit for bit in range(MAX_TAGS) if bit not in used]
+            if not free:
+                raise ValidationError(
+                    f"Нельзя создать больше {MAX_TAGS} тегов."
+                )
+            self.bit = free[0]
+        super().save(*args, **kwargs)
+
+
+def get_tags_mask(tags):
+    """Битовая маска набора тегов."""
+    mask = 0
+    for tag in tags:
+        mask |= 1 << tag.bit
+    return mask
+
 
 class Ingredient(models.Model):
     """Модель ингредиента."""
@@ -101,15 +134,97 @@ class Recipe(models.Model):
         ]
     )
     pub_date = models.DateTimeField("Дата создания", auto_now_add=True)
+    updated_at = models.DateTimeField(
+        "Дата изменения",
+        auto_now=True,
+        help_text=(
+            "Меняется при сохранении рецепта целиком, в том числе "
+            "ингредиентов; по ней видно, что список покупок устарел."
+        )
+    )
+    tags_mask = models.BigIntegerField(
+        "Маска тегов",
+        default=0,
+        editable=False,
+        help_text="Копия tags для фильтрации без соединения таблиц."
+    )
+    ingredients_minhash = models.BinaryField(
+        "MinHash-сигнатура ингредиентов",
+        null=True,
+        editable=False,
+        help_text="Пустая у рецепта без ингредиентов, NULL — не посчитана."
+    )
+    popularity = models.PositiveIntegerField(
+        "Популярность",
+        default=0,
+        editable=False,
+        help_text="Число добавлений в избранное и покупки, см. updatetrending."
+    )
+    trending_score = models.FloatField(
+        "Трендовость",
+        default=0,
+        editable=False,
+        help_text=(
+            "Затухающая сумма добавлений, умноженная на общий для всех "
+            "рецептов множитель, см. updatetrending."
+        )
+    )
 
     class Meta:
         ordering = ("-pub_date",)
         verbose_name = "рецепт"
         verbose_name_plural = "Рецепты"
+        indexes = [
+            # Страница списка идет по индексу в порядке ordering,
+            # а условие по маске тегов проверяется по той же записи индекса.
+            models.Index(
+                fields=("-pub_date", "tags_mask"),
+                name="recipe_pub_date_tags_idx"
+            ),
+            # Покрывающий индекс для GROUP BY фасетов без чтения таблицы.
+            models.Index(
+                fields=("tags_mask", "cooking_time"),
+                name="recipe_tags_cooking_time_idx"
+            ),
+            # Курсорная пагинация сортировок ?ordering=trending и popular.
+            models.Index(
+                fields=("-trending_score", "-id", "tags_mask"),
+                name="recipe_trending_idx"
+            ),
+            models.Index(
+                fields=("-popularity", "-id", "tags_mask"),
+                name="recipe_popularity_idx"
+            ),
+        ]
 
     def __str__(self):
         return self.name
 
+    def update_tags_mask(self):
+        """Пересчитать маску по текущим тегам рецепта и сохранить ее."""
+        self.tags_mask = get_tags_mask(self.tags.all())
+        self.save(update_fields=("tags_mask",))
+
+    def get_bands(self):
+        """Корзины LSH по сохраненной сигнатуре ингредиентов."""
+        if not self.ingredients_minhash:
+            return []
+        return [
+            RecipeBand(recipe=self, bucket=bucket)
+            for bucket in get_buckets(
+                load_signatures([self.ingredients_minhash])
+            )[0].tolist()
+        ]
+
+    def update_ingredients_minhash(self):
+        """Пересчитать сигнатуру по текущим ингредиентам и ее корзины LSH."""
+        self.ingredients_minhash = get_signature(
+            self.ingredients_list.values_list("ingredient_id", flat=True)
+        )
+        self.save(update_fields=("ingredients_minhash",))
+        self.bands.all().delete()
+        RecipeBand.objects.bulk_create(self.get_bands())
+
 
 class RecipeIngredient(models.Model):
     """Модель, связывающая рецепты и ингредиенты."""
@@ -142,6 +257,24 @@ class RecipeIngredient(models.Model):
         return f"{self.recipe} - {self.ingredient}"
 
 
+class RecipeBand(models.Model):
+    """Корзина LSH полосы MinHash-сигнатуры рецепта."""
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name="bands",
+        verbose_name="Рецепт"
+    )
+    bucket = models.BigIntegerField("Хэш полосы", db_index=True)
+
+    class Meta:
+        verbose_name = "корзина LSH"
+        verbose_name_plural = "Корзины LSH"
+
+    def __str__(self):
+        return f"{self.recipe} {self.bucket}"
+
+
 class Favorite(models.Model):
     """Модель избранных рецептов."""
     user = models.ForeignKey(
@@ -188,3 +321,198 @@ class ShoppingCart(models.Model):
 
     def __str__(self):
         return f"{self.user} {self.recipe}"
+
+
+class RecipeNeighbor(models.Model):
+    """Похожий рецепт по совместным добавлениям в избранное и покупки."""
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name="neighbors",
+        verbose_name="Рецепт",
+        # Чтения идут по составному индексу recipe_neighbor_score_idx.
+        db_index=False
+    )
+    neighbor = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name="neighbor_of",
+        verbose_name="Похожий рецепт"
+    )
+    score = models.FloatField("Косинусная близость")
+
+    class Meta:
+        ordering = ("recipe", "-score")
+        verbose_name = "похожий рецепт"
+        verbose_name_plural = "Похожие рецепты"
+        indexes = [
+            models.Index(
+                fields=("recipe", "-score"),
+                name="recipe_neighbor_score_idx"
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.recipe} ~ {self.neighbor}"
+
+
+class RecipeNeighborsBuild(models.Model):
+    """Запуск пересчета похожих рецептов."""
+    finished_at = models.DateTimeField("Завершен", auto_now_add=True)
+    full = models.BooleanField("Полный пересчет")
+    favorite_id = models.BigIntegerField("Последний учтенный id избранного")
+    cart_id = models.BigIntegerField(
+        "Последний учтенный id списка покупок"
+    )
+    favorite_pending = models.JSONField(
+        "Пропущенные id избранного",
+        default=list,
+        help_text=(
+            "id перед границей без строк: их транзакции могли быть еще "
+            "не зафиксированы, следующий запуск проверит их снова."
+        )
+    )
+    cart_pending = models.JSONField(
+        "Пропущенные id списка покупок", default=list
+    )
+    recipes = models.PositiveIntegerField("Пересчитано рецептов")
+
+    class Meta:
+        ordering = ("-finished_at",)
+        verbose_name = "пересчет похожих рецептов"
+        verbose_name_plural = "Пересчеты похожих рецептов"
+
+    def __str__(self):
+        return f"{self.finished_at:%Y-%m-%d %H:%M} ({self.recipes})"
+
+
+class RecipeScoresUpdate(models.Model):
+    """Запуск пересчета популярности и трендовости рецептов."""
+    finished_at = models.DateTimeField("Завершен", auto_now_add=True)
+    full = models.BooleanField("Полный пересчет")
+    favorite_id = models.BigIntegerField("Последний учтенный id избранного")
+    cart_id = models.BigIntegerField(
+        "Последний учтенный id списка покупок"
+    )
+    favorite_pending = models.JSONField(
+        "Пропущенные id избранного",
+        default=list,
+        help_text=(
+            "id перед границей без строк: их транзакции могли быть еще "
+            "не зафиксированы, следующий запуск проверит их снова."
+        )
+    )
+    cart_pending = models.JSONField(
+        "Пропущенные id списка покупок", default=list
+    )
+    reference_time = models.DateTimeField(
+        "Опорное время затухания",
+        help_text="Добавление в этот момент имеет в trending_score свой вес."
+    )
+    recipes = models.PositiveIntegerField("Обновлено рецептов")
+
+    class Meta:
+        ordering = ("-finished_at",)
+        verbose_name = "пересчет популярности"
+        verbose_name_plural = "Пересчеты популярности"
+
+    def __str__(self):
+        return f"{self.finished_at:%Y-%m-%d %H:%M} ({self.recipes})"
+
+
+class Change(models.Model):
+    """Запись журнала изменений для синхронизации клиентов.
+
+    Курсором синхронизации служит position, а не id: id выдается при
+    вставке, и запись с меньшим id может стать видна позже записи
+    с большим. Изменения рецептов видны всем (user пустой), избранное,
+    покупки и подписки — только user.
+    """
+    RECIPE = "recipe"
+    FAVORITE = "favorite"
+    SHOPPING_CART = "shopping_cart"
+    SUBSCRIPTION = "subscription"
+    KINDS = (
+        (RECIPE, "рецепт"),
+        (FAVORITE, "избранное"),
+        (SHOPPING_CART, "список покупок"),
+        (SUBSCRIPTION, "подписка"),
+    )
+
+    kind = models.CharField("Тип", max_length=16, choices=KINDS)
+    object_id = models.BigIntegerField(
+        "id рецепта или автора",
+        help_text="Для подписок — id автора, иначе — id рецепта."
+    )
+    user = models.ForeignKey(
+        CustomUser,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name="changes",
+        verbose_name="Пользователь",
+        # Чтения идут по составному индексу change_user_idx.
+        db_index=False
+    )
+    deleted = models.BooleanField("Удаление", default=False)
+    created_at = models.DateTimeField("Время", auto_now_add=True)
+    position = models.BigIntegerField(
+        "Позиция",
+        null=True,
+        unique=True,
+        editable=False,
+        help_text=(
+            "Выдается уже зафиксированной записи, см. assign_positions; "
+            "пустая — запись еще не отдавалась."
+        )
+    )
+
+    class Meta:
+        ordering = ("id",)
+        verbose_name = "изменение"
+        verbose_name_plural = "Журнал изменений"
+        indexes = [
+            models.Index(
+                fields=("user", "position"), name="change_user_idx"
+            ),
+            # Записи без позиции ищутся при каждой синхронизации.
+            models.Index(
+                fields=("id",),
+                condition=models.Q(position=None),
+                name="change_unpositioned_idx"
+            ),
+        ]
+
+    def __str__(self):
+        action = "удален" if self.deleted else "изменен"
+        return f"{self.get_kind_display()} {self.object_id} {action}"
+
+
+class ChangeLogCompaction(models.Model):
+    """Запуск сжатия журнала изменений."""
+    finished_at = models.DateTimeField("Завершено", auto_now_add=True)
+    last_position = models.BigIntegerField(
+        "Последняя удаленная позиция журнала",
+        help_text="Клиентам с курсором меньше нужна полная синхронизация."
+    )
+    superseded = models.PositiveIntegerField("Удалено перекрытых записей")
+    expired = models.PositiveIntegerField("Удалено старых записей")
+
+    class Meta:
+        ordering = ("-finished_at",)
+        verbose_name = "сжатие журнала изменений"
+        verbose_name_plural = "Сжатия журнала изменений"
+
+    def __str__(self):
+        return (
+            f"{self.finished_at:%Y-%m-%d %H:%M} (до {self.last_position})"
+        )
+
+
+@receiver(post_delete, sender=Tag)
+def clear_tag_bit(sender, instance, **kwargs):
+    """Убрать бит удаленного тега из масок, чтобы его можно было занять."""
+    bit = 1 << instance.bit
+    Recipe.objects.alias(
+        has_tag=F("tags_mask").bitand(bit)
+    ).exclude(has_tag=0).update(tags_mask=F("tags_mask") - bit)
@@ -0,0 +1,147 @@
+from itertools import chain
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from scipy import sparse
+
+from recipes.models import (Favorite, RecipeNeighbor, RecipeNeighborsBuild,
+                            ShoppingCart)
+from recipes.watermarks import get_increment
+
+ITERATOR_CHUNK_SIZE = 10000
+
+
+def load_pairs(model):
+    """Пары (рецепт, пользователь) таблицы взаимодействий массивом numpy."""
+    pairs = np.fromiter(
+        chain.from_iterable(
+            model.objects.order_by().values_list(
+                "recipe_id", "user_id"
+            ).iterator(chunk_size=ITERATOR_CHUNK_SIZE)
+        ),
+        dtype=np.int64
+    )
+    return pairs.reshape(-1, 2)
+
+
+def build_matrix():
+    """Разреженная матрица рецепт × пользователь с нормированными строками.
+
+    Возвращает матрицу и отсортированный массив id рецептов ее строк.
+    """
+    favorites = load_pairs(Favorite)
+    carts = load_pairs(ShoppingCart)
+    pairs = np.concatenate((favorites, carts))
+    if not len(pairs):
+        return sparse.csr_matrix((0, 0)), np.empty(0, dtype=np.int64)
+    weights = np.concatenate((
+        np.full(len(favorites), settings.NEIGHBORS_FAVORITE_WEIGHT),
+        np.full(len(carts), settings.NEIGHBORS_CART_WEIGHT),
+    ))
+
+    recipe_ids, rows = np.unique(pairs[:, 0], return_inverse=True)
+    user_ids, columns = np.unique(pairs[:, 1], return_inverse=True)
+    # Повторяющиеся пары (рецепт и в избранном, и в покупках) суммируются.
+    matrix = sparse.csr_matrix(
+        (weights, (rows, columns)), shape=(len(recipe_ids), len(user_ids))
+    )
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    return sparse.diags(1 / norms) @ matrix, recipe_ids
+
+
+def top_neighbors(matrix, transposed, rows, top_k):
+    """Top-K соседей по косинусной близости для строк матрицы.
+
+    Память ограничена размером блока: считается только произведение
+    выбранных строк на всю матрицу.
+    """
+    similarities = (matrix[rows] @ transposed).tocsr()
+    for position, row in enumerate(rows):
+        start, end = similarities.indptr[position:position + 2]
+        columns = similarities.indices[start:end]
+        scores = similarities.data[start:end]
+        own = columns != row
+        columns, scores = columns[own], scores[own]
+        if len(scores) > top_k:
+            best = np.argpartition(-scores, top_k)[:top_k]
+            columns, scores = columns[best], scores[best]
+        order = np.lexsort((columns, -scores))
+        yield row, columns[order], scores[order]
+
+
+def get_changed_recipe_ids(new_rows):
+    """id рецептов со строками прироста избранного и покупок."""
+    return set(chain.from_iterable(
+        rows.values_list("recipe_id", flat=True).distinct()
+        for rows in new_rows
+    ))
+
+
+def build_neighbors(full=False, top_k=None, chunk_size=500, log=None):
+    """Пересчитать и сохранить соседей рецептов.
+
+    Без full пересчитываются только рецепты с новыми добавлениями
+    в избранное или покупки после прошлого запуска. Удаления из избранного
+    и покупок учитываются только полным пересчетом.
+    """
+    top_k = top_k or settings.NEIGHBORS_TOP_K
+    last_build = RecipeNeighborsBuild.objects.first()
+    if last_build is None:
+        full = True
+        last_build = RecipeNeighborsBuild(
+            favorite_id=0, cart_id=0, favorite_pending=[], cart_pending=[]
+        )
+    # Границы фиксируются до чтения матрицы, чтобы добавления во время
+    # пересчета попали в следующий запуск; id перед границей, строк
+    # с которыми еще нет, проверяются снова, см. get_increment.
+    watermarks = {}
+    new_rows = []
+    for model, prefix in ((Favorite, "favorite"), (ShoppingCart, "cart")):
+        last_id, pending, rows = get_increment(
+            model,
+            getattr(last_build, f"{prefix}_id"),
+            getattr(last_build, f"{prefix}_pending")
+        )
+        watermarks[f"{prefix}_id"] = last_id
+        watermarks[f"{prefix}_pending"] = pending
+        new_rows.append(rows)
+
+    matrix, recipe_ids = build_matrix()
+    if full:
+        rows = np.arange(len(recipe_ids))
+        stale = set(
+            RecipeNeighbor.objects.order_by().values_list(
+                "recipe_id", flat=True
+            ).distinct()
+        ) - set(recipe_ids.tolist())
+        RecipeNeighbor.objects.filter(recipe_id__in=stale).delete()
+    else:
+        changed = list(get_changed_recipe_ids(new_rows))
+        rows = np.flatnonzero(np.isin(recipe_ids, changed))
+
+    transposed = matrix.T.tocsr()
+    for start in range(0, len(rows), chunk_size):
+        chunk = rows[start:start + chunk_size]
+        neighbors = [
+            RecipeNeighbor(
+                recipe_id=int(recipe_ids[row]),
+                neighbor_id=int(recipe_ids[column]),
+                score=float(score)
+            )
+            for row, columns, scores in top_neighbors(
+                matrix, transposed, chunk, top_k
+            )
+            for column, score in zip(columns, scores)
+        ]
+        with transaction.atomic():
+            RecipeNeighbor.objects.filter(
+                recipe_id__in=recipe_ids[chunk].tolist()
+            ).delete()
+            RecipeNeighbor.objects.bulk_create(neighbors, batch_size=1000)
+        if log is not None:
+            log(f"Рецептов: {start + len(chunk)}/{len(rows)}")
+
+    return RecipeNeighborsBuild.objects.create(
+        full=full, recipes=len(rows), **watermarks
+    )
@@ -0,0 +1,61 @@
+from django.conf import settings
+from django.db import transaction
+
+from api.taskqueue import enqueue, register_task
+from recipes.changes import compact_changes
+from recipes.models import Recipe
+from recipes.trending import update_scores
+
+
+@register_task("recipes.update_ingredients_minhash")
+def update_ingredients_minhash(recipe_id):
+    """Пересчитать MinHash-сигнатуру и корзины LSH рецепта.
+
+    Строка рецепта блокируется: незафиксированное изменение рецепта
+    дочитывается до конца, а сигнатура и корзины заменяются вместе.
+    """
+    with transaction.atomic():
+        recipe = Recipe.objects.select_for_update().filter(
+            pk=recipe_id
+        ).first()
+        if recipe is not None:
+            recipe.update_ingredients_minhash()
+
+
+def enqueue_minhash_update(recipe):
+    """Поставить пересчет сигнатуры рецепта после смены ингредиентов."""
+    enqueue(
+        "recipes.update_ingredients_minhash",
+        key=f"minhash:{recipe.pk}",
+        recipe_id=recipe.pk
+    )
+
+
+# Модули со scipy импортируются в задачах, а не при запуске веб-воркеров,
+# которые задачи только ставят.
+@register_task("recipes.update_signatures")
+def update_missing_signatures():
+    """Досчитать сигнатуры рецептов, записанных в обход API."""
+    from recipes.duplicates import update_signatures
+
+    update_signatures()
+
+
+@register_task("recipes.build_neighbors")
+def update_neighbors(full=False):
+    """Пересчитать похожие рецепты."""
+    from recipes.neighbors import build_neighbors
+
+    build_neighbors(full=full)
+
+
+@register_task("recipes.update_trending")
+def update_trending(full=False):
+    """Пересчитать популярность и трендовость рецептов."""
+    update_scores(full=full)
+
+
+@register_task("recipes.compact_changes")
+def compact_change_log():
+    """Сжать журнал изменений для синхронизации."""
+    compact_changes(settings.SYNC_CHANGES_RETENTION_DAYS)
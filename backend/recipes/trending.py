@@ -0,0 +1,133 @@
+import math
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from recipes.models import (Favorite, Recipe, RecipeScoresUpdate,
+                            ShoppingCart)
+from recipes.watermarks import get_increment
+
+# Множитель новых добавлений растет со временем от опорного момента;
+# при e ** 30 (около 1e13) все оценки приводятся к текущему моменту.
+MAX_DECAY_EXPONENT = 30
+# Ограничение числа параметров в IN для SQLite.
+IN_CHUNK_SIZE = 900
+
+
+def get_decay_rate():
+    """Скорость затухания в секунду по периоду полураспада."""
+    return math.log(2) / (settings.TRENDING_HALF_LIFE_HOURS * 3600)
+
+
+def count_subquery(model, last_id, pending):
+    """Число добавлений рецепта в model с id до last_id, кроме pending."""
+    return Coalesce(
+        Subquery(
+            model.objects.filter(
+                recipe=OuterRef("pk"), id__lte=last_id
+            ).exclude(id__in=pending).order_by().values("recipe").annotate(
+                count=Count("id")
+            ).values("count"),
+            output_field=IntegerField()
+        ),
+        0
+    )
+
+
+def get_new_counts(rows):
+    """Число добавлений по рецептам среди строк прироста."""
+    return dict(
+        rows.order_by().values("recipe").annotate(
+            count=Count("id")
+        ).values_list("recipe", "count")
+    )
+
+
+def update_scores(full=False):
+    """Учесть новые добавления в избранное и покупки в оценках рецептов.
+
+    trending_score хранит сумму весов добавлений, умноженных на
+    e ** (rate * (t - reference_time)): порядок рецептов по такой сумме
+    совпадает с порядком по затухающей к текущему моменту, поэтому
+    обновляются только рецепты с новыми добавлениями. Время добавления —
+    момент запуска, точность равна интервалу между запусками. Новые
+    добавления выбираются по id с перекрытием, см. get_increment.
+
+    С full популярность пересчитывается заново с учетом удалений;
+    удаления в трендовости не учитываются, они затухают сами.
+    """
+    last_update = RecipeScoresUpdate.objects.first()
+    now = timezone.now()
+    rate = get_decay_rate()
+    if last_update is None:
+        reference_time = now
+        last_update = RecipeScoresUpdate(
+            favorite_id=0, cart_id=0, favorite_pending=[], cart_pending=[]
+        )
+    else:
+        reference_time = last_update.reference_time
+    watermarks = {}
+    new_rows = {}
+    for model, prefix in ((Favorite, "favorite"), (ShoppingCart, "cart")):
+        last_id, pending, new_rows[model] = get_increment(
+            model,
+            getattr(last_update, f"{prefix}_id"),
+            getattr(last_update, f"{prefix}_pending")
+        )
+        watermarks[f"{prefix}_id"] = last_id
+        watermarks[f"{prefix}_pending"] = pending
+
+    with transaction.atomic():
+        exponent = rate * (now - reference_time).total_seconds()
+        if full or exponent > MAX_DECAY_EXPONENT:
+            Recipe.objects.exclude(trending_score=0).update(
+                trending_score=F("trending_score") * math.exp(-exponent)
+            )
+            reference_time, exponent = now, 0
+        if full:
+            Recipe.objects.update(popularity=(
+                count_subquery(
+                    Favorite, watermarks["favorite_id"],
+                    watermarks["favorite_pending"]
+                )
+                + count_subquery(
+                    ShoppingCart, watermarks["cart_id"],
+                    watermarks["cart_pending"]
+                )
+            ))
+
+        favorites = get_new_counts(new_rows[Favorite])
+        carts = get_new_counts(new_rows[ShoppingCart])
+        # Рецепты с одинаковыми приращениями обновляются одним запросом.
+        groups = defaultdict(list)
+        for recipe_id in favorites.keys() | carts.keys():
+            groups[
+                favorites.get(recipe_id, 0), carts.get(recipe_id, 0)
+            ].append(recipe_id)
+        scale = math.exp(exponent)
+        for (favorite_count, cart_count), recipe_ids in groups.items():
+            increments = {
+                "trending_score": F("trending_score") + scale * (
+                    favorite_count * settings.TRENDING_FAVORITE_WEIGHT
+                    + cart_count * settings.TRENDING_CART_WEIGHT
+                ),
+            }
+            if not full:
+                increments["popularity"] = (
+                    F("popularity") + favorite_count + cart_count
+                )
+            for start in range(0, len(recipe_ids), IN_CHUNK_SIZE):
+                Recipe.objects.filter(
+                    pk__in=recipe_ids[start:start + IN_CHUNK_SIZE]
+                ).update(**increments)
+
+        return RecipeScoresUpdate.objects.create(
+            full=full,
+            reference_time=reference_time,
+            recipes=len(favorites.keys() | carts.keys()),
+            **watermarks
+        )
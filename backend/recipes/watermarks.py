@@ -0,0 +1,38 @@
+from django.db.models import Max, Q
+
+# Сколько последних id перед границей проверяется на пропуски. Строка
+# с таким id могла быть еще не зафиксирована при чтении границы, и без
+# повторной проверки ее пропустили бы все следующие запуски. Вместе
+# с пропусками прошлого запуска в IN не больше 800 параметров, что
+# укладывается в ограничение SQLite.
+ID_OVERLAP = 400
+
+
+def get_increment(model, last_id, pending):
+    """Новая граница, пропуски перед ней и строки прироста model.
+
+    В прирост входят строки после last_id до новой границы и появившиеся
+    строки из прошлых пропусков pending. id без строк среди последних
+    ID_OVERLAP перед границей — новые пропуски: их проверит следующий
+    запуск, а старые пропуски считаются откатом или удалением.
+    Пропуски ищутся до чтения прироста и исключаются из него, поэтому
+    строка, зафиксированная между двумя чтениями, учитывается ровно
+    один раз — следующим запуском.
+    """
+    watermark = max(
+        model.objects.aggregate(value=Max("id"))["value"] or 0, last_id
+    )
+    low = max(last_id, watermark - ID_OVERLAP)
+    existing = set(
+        model.objects.filter(
+            Q(id__gt=low, id__lte=watermark) | Q(id__in=pending)
+        ).values_list("id", flat=True)
+    )
+    new_pending = sorted(
+        pk for pk in {*range(low + 1, watermark + 1), *pending}
+        if pk not in existing and pk > watermark - ID_OVERLAP
+    )
+    rows = model.objects.filter(
+        Q(id__gt=last_id, id__lte=watermark) | Q(id__in=pending)
+    ).exclude(id__in=new_pending)
+    return watermark, new_pending, rows